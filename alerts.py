@@ -0,0 +1,282 @@
+import json
+import queue
+import random
+import sqlite3
+import threading
+import time
+import uuid
+import datetime
+import argparse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Webhook alert dispatcher
+# High-risk events are handed to enqueue(), which never blocks or touches the
+# database. A background worker drains them into the alert_queue table (so
+# undelivered alerts survive restarts), coalesces due alerts per user and
+# webhook into batched POSTs, and reschedules failed batches with backoff.
+# The queue is a per-host outbox (storage.local_db_path): each replica only
+# delivers the alerts it raised itself.
+
+ALERT_BATCH_SIZE = 50
+FLUSH_INTERVAL = 1.0
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 300.0
+REQUEST_TIMEOUT = 5
+QUEUE_SIZE = 10000
+
+def init_alert_queue(db_path="finsec.db"):
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS alert_queue (
+        id TEXT PRIMARY KEY,
+        user_id TEXT,
+        webhook_url TEXT,
+        payload TEXT,
+        status TEXT,
+        attempts INTEGER,
+        next_attempt_at REAL,
+        last_error TEXT,
+        created_at TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_alert_queue_due ON alert_queue (status, next_attempt_at)")
+    conn.commit()
+    conn.close()
+
+class AlertDispatcher:
+    def __init__(self, db_path="finsec.db", batch_size=ALERT_BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_attempts=MAX_ATTEMPTS, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 timeout=REQUEST_TIMEOUT, queue_size=QUEUE_SIZE, pool_size=8, session=None):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        # Alerts that arrive while the queue is full; deque appends are thread-safe
+        self._overflow = deque()
+        self._stop = threading.Event()
+        self._thread = None
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+        self.stats = {"enqueued": 0, "delivered": 0, "batches": 0, "failed_attempts": 0, "dead": 0}
+        init_alert_queue(db_path)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="finsec-alerts", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def enqueue(self, user_id, webhook_url, event):
+        # Called from the scoring path: O(1), never waits on I/O or locks
+        if not webhook_url:
+            return False
+        alert = (str(uuid.uuid4()), user_id, webhook_url, json.dumps(event, default=str), time.time())
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            self._overflow.append(alert)
+        self.stats["enqueued"] += 1
+        return True
+
+    def pending_count(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        count = conn.execute("SELECT COUNT(*) FROM alert_queue WHERE status = 'pending'").fetchone()[0]
+        conn.close()
+        return count + self._queue.qsize() + len(self._overflow)
+
+    def flush(self, conn=None):
+        # Persist everything queued in memory, then deliver whatever is due
+        own_conn = conn is None
+        if own_conn:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            self._persist(conn, self._drain())
+            return self._deliver_due(conn)
+        finally:
+            if own_conn:
+                conn.close()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            while not self._stop.is_set():
+                self._persist(conn, self._drain(wait=self.flush_interval))
+                self._deliver_due(conn)
+            # Anything still in memory on shutdown is kept for the next process
+            self._persist(conn, self._drain())
+        finally:
+            conn.close()
+
+    def _drain(self, wait=0):
+        alerts = []
+        if wait:
+            try:
+                alerts.append(self._queue.get(timeout=wait))
+            except queue.Empty:
+                pass
+        while True:
+            try:
+                alerts.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        while self._overflow:
+            alerts.append(self._overflow.popleft())
+        return alerts
+
+    def _persist(self, conn, alerts):
+        if not alerts:
+            return
+        now = datetime.datetime.now()
+        with conn:
+            conn.executemany(
+                "INSERT INTO alert_queue (id, user_id, webhook_url, payload, status, attempts, next_attempt_at, last_error, created_at) VALUES (?, ?, ?, ?, 'pending', 0, ?, NULL, ?)",
+                [(alert_id, user_id, url, payload, queued_at, now) for alert_id, user_id, url, payload, queued_at in alerts]
+            )
+
+    def _deliver_due(self, conn):
+        rows = conn.execute(
+            "SELECT id, user_id, webhook_url, payload, attempts FROM alert_queue WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+            (time.time(), self.batch_size * 20)
+        ).fetchall()
+
+        # Coalesce per user and webhook, then split into batches
+        groups = {}
+        for row in rows:
+            groups.setdefault((row[1], row[2]), []).append(row)
+
+        delivered = 0
+        for (user_id, webhook_url), group in groups.items():
+            for start in range(0, len(group), self.batch_size):
+                batch = group[start:start + self.batch_size]
+                error = self._post(user_id, webhook_url, batch)
+                if error is None:
+                    delivered += len(batch)
+                    with conn:
+                        conn.executemany("DELETE FROM alert_queue WHERE id = ?", [(row[0],) for row in batch])
+                else:
+                    self._reschedule(conn, batch, error)
+        return delivered
+
+    def _post(self, user_id, webhook_url, batch):
+        body = {
+            "user_id": user_id,
+            "alert_count": len(batch),
+            "alerts": [json.loads(row[3]) for row in batch],
+            "sent_at": datetime.datetime.now().isoformat()
+        }
+        try:
+            response = self.session.post(webhook_url, json=body, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self.stats["failed_attempts"] += 1
+            return str(e)
+        self.stats["batches"] += 1
+        self.stats["delivered"] += len(batch)
+        return None
+
+    def _reschedule(self, conn, batch, error):
+        now = time.time()
+        updates = []
+        for alert_id, _, _, _, attempts in batch:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                status = "failed"
+                self.stats["dead"] += 1
+            else:
+                status = "pending"
+            # Exponential backoff with jitter so a recovering receiver is not stampeded
+            delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+            delay *= random.uniform(1.0, 1.1)
+            updates.append((status, attempts, now + delay, error, alert_id))
+        with conn:
+            conn.executemany(
+                "UPDATE alert_queue SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                updates
+            )
+
+# Local stub receiver
+# Records every webhook POST so the dispatcher can be exercised without any
+# external service. fail_first makes the first N requests return HTTP 503.
+class StubWebhookReceiver:
+    def __init__(self, host="127.0.0.1", port=0, fail_first=0):
+        self.received = []
+        self.requests_seen = 0
+        self.fail_first = fail_first
+        self._lock = threading.Lock()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                with receiver._lock:
+                    receiver.requests_seen += 1
+                    failing = receiver.requests_seen <= receiver.fail_first
+                    if not failing:
+                        receiver.received.append(json.loads(body))
+                self.send_response(503 if failing else 200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/webhook"
+
+    def alert_count(self):
+        with self._lock:
+            return sum(batch["alert_count"] for batch in self.received)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stub webhook receiver for FinSec alerts")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-first", type=int, default=0, help="Respond 503 to the first N requests")
+    args = parser.parse_args()
+
+    receiver = StubWebhookReceiver(args.host, args.port, args.fail_first).start()
+    print(f"Stub receiver listening on {receiver.url}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"{len(receiver.received)} batches, {receiver.alert_count()} alerts received")
+    except KeyboardInterrupt:
+        receiver.stop()
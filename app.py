@@ -5,7 +5,6 @@ import os
 import json
 import uuid
 import datetime
-import sqlite3
 import base64
 import requests
 import io
@@ -16,7 +15,27 @@ from dotenv import load_dotenv
 import openai
 import time
 import hashlib
+import itertools
 from PIL import Image
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from assets import load_stylesheet, logo_variant, read_text, PayloadMeter
+from alerts import AlertDispatcher
+from assistant import Assistant, create_backend
+from model import get_risk_model, categorize, categorize_one, ScoreIndex
+from dedup import DuplicateIndex, init_duplicate_tables
+from rings import detect_fraud_rings, RING_INDICATOR
+from uploads import spool_upload, iter_upload_chunks, preview_upload, cleanup_uploads, UPLOAD_TYPES
+from progressive import iter_progressive, PROGRESSIVE_MIN_ROWS, RISK_LEVELS
+from quotas import QuotaManager, FairScheduler, QuotaExceeded, init_quota_tables, plan_quotas
+from metrics import timed, instrument, set_plan, registry, MetricsServer, METRICS_PORT
+from profiling import RerunProfiler
+from session_store import create_session_store, encode_state, new_session_id, is_session_id
+from storage import get_database, local_db_path
+from diff import load_scan_transactions, diff_scans, ranked_changes, iter_csv_chunks, DIFF_STATUSES
+from batch_ingest import init_ingest_tables
+from encoding import DictionaryEncoder, init_dictionary_tables
+from retention import Compactor, CompactionScheduler, init_retention_tables, PLAN_RETENTION, COMPACTION_INTERVAL
+from search import create_search_index, transaction_rows, TRANSACTION_INSERT, CODE_COLUMNS, SEARCH_FIELDS, SEARCH_PAGE_SIZE, MAX_COUNTED_MATCHES
 
 # Load environment variables
 load_dotenv()
@@ -25,6 +44,8 @@ load_dotenv()
 FINSEC_API_URL = os.getenv("FINSEC_API_URL", "https://finsec1.onrender.com/detect")
 FINSEC_API_KEY = os.getenv("FINSEC_API_KEY", "supersecret")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+ASSISTANT_BACKEND = os.getenv("FINSEC_ASSISTANT_BACKEND", "openai")
+SHOW_PAYLOAD = os.getenv("FINSEC_SHOW_PAYLOAD", "") == "1"
 
 # Initialize OpenAI client if API key is available
 if OPENAI_API_KEY:
@@ -32,50 +53,111 @@ if OPENAI_API_KEY:
 
 # Database setup
 def init_db():
-    conn = sqlite3.connect('finsec.db')
-    c = conn.cursor()
+    db = get_database()
     
-    # Create users table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id TEXT PRIMARY KEY,
-        email TEXT UNIQUE,
-        password TEXT,
-        role TEXT,
-        plan TEXT,
-        created_at TIMESTAMP
-    )
-    ''')
-    
-    # Create scans table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS scans (
-        id TEXT PRIMARY KEY,
-        user_id TEXT,
-        filename TEXT,
-        total_transactions INTEGER,
-        high_risk_count INTEGER,
-        medium_risk_count INTEGER,
-        low_risk_count INTEGER,
-        scan_date TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-    ''')
-    
-    # Create settings table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS settings (
-        user_id TEXT PRIMARY KEY,
-        email_alerts BOOLEAN,
-        live_access BOOLEAN,
-        webhook_url TEXT,
-        api_key TEXT,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-    ''')
+    # Inspected before the schema transaction; both are no-ops on a fresh database
+    settings_columns = db.column_names("settings")
+    rollups_exist = db.table_exists("scan_daily_rollups")
+    transaction_columns = db.column_names("scan_transactions")
+    seen_columns = db.column_names("seen_transactions")
     
-    conn.commit()
-    conn.close()
+    with db.transaction() as tx:
+        # Create users table
+        tx.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            email TEXT UNIQUE,
+            password TEXT,
+            role TEXT,
+            plan TEXT,
+            created_at TIMESTAMP
+        )
+        ''')
+        
+        # Create scans table
+        tx.execute('''
+        CREATE TABLE IF NOT EXISTS scans (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            filename TEXT,
+            total_transactions INTEGER,
+            high_risk_count INTEGER,
+            medium_risk_count INTEGER,
+            low_risk_count INTEGER,
+            scan_date TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''')
+        
+        # Create settings table
+        tx.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            user_id TEXT PRIMARY KEY,
+            email_alerts BOOLEAN,
+            live_access BOOLEAN,
+            webhook_url TEXT,
+            api_key TEXT,
+            medium_threshold REAL,
+            high_threshold REAL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''')
+        
+        # Per-user risk thresholds (NULL means the model's defaults), added to
+        # settings tables created before they existed
+        for column in ("medium_threshold", "high_threshold"):
+            if settings_columns and column not in settings_columns:
+                tx.execute(f"ALTER TABLE settings ADD COLUMN {column} REAL")
+        
+        # Create daily risk rollup table, maintained by save_scan_results
+        tx.execute('''
+        CREATE TABLE IF NOT EXISTS scan_daily_rollups (
+            user_id TEXT,
+            day DATE,
+            scan_count INTEGER,
+            total_transactions INTEGER,
+            high_risk_count INTEGER,
+            medium_risk_count INTEGER,
+            low_risk_count INTEGER,
+            PRIMARY KEY (user_id, day),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''')
+        
+        # Backfill rollups from scans saved before the table existed
+        if not rollups_exist:
+            scan_day = db.date_of("scan_date")
+            tx.execute(f'''
+            INSERT INTO scan_daily_rollups
+            SELECT user_id, {scan_day}, COUNT(*), SUM(total_transactions),
+                   SUM(high_risk_count), SUM(medium_risk_count), SUM(low_risk_count)
+            FROM scans
+            GROUP BY user_id, {scan_day}
+            ''')
+        
+        # Per-transaction results of saved scans, with their search index
+        create_search_index(db).create_schema(tx)
+        
+        # Dictionary codes, added to scan_transactions tables created before them
+        for column in CODE_COLUMNS:
+            if transaction_columns and column not in transaction_columns:
+                tx.execute(f"ALTER TABLE scan_transactions ADD COLUMN {column} INTEGER")
+        init_dictionary_tables(tx)
+        
+        # Fingerprints of scanned transactions; tables from before claims get their columns
+        for column, column_type in (("claim_id", "TEXT"), ("claimed_at", "REAL")):
+            if seen_columns and column not in seen_columns:
+                tx.execute(f"ALTER TABLE seen_transactions ADD COLUMN {column} {column_type}")
+        init_duplicate_tables(tx)
+        
+        # Per-user usage counters behind plan quotas
+        init_quota_tables(tx)
+        
+        # Compaction reports and the lease that keeps one compactor running
+        init_retention_tables(tx)
+        
+        # Files taken in by the batch ingestion command, by owner and content hash
+        init_ingest_tables(tx)
 
 # Initialize database
 init_db()
@@ -88,144 +170,31 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Static assets, prepared once per process
+@st.cache_resource
+def get_stylesheet():
+    return load_stylesheet()
+
+@st.cache_resource
+def get_logo(width):
+    return logo_variant(width)
+
+@st.cache_resource
+def get_page_text(path):
+    return read_text(path)
+
+def render_logo(width):
+    logo = get_logo(width)
+    payload_meter.add_media(len(logo))
+    st.image(logo, width=width)
+
 # Custom CSS
 def load_css():
-    css = """
-    <style>
-        .main {
-            background-color: #f5f5f5;
-        }
-        .stApp {
-            background-image: url("app/static/dashboard_background.jpg");
-            background-size: cover;
-            background-repeat: no-repeat;
-            background-attachment: fixed;
-        }
-        .sidebar .sidebar-content {
-            background-color: rgba(20, 39, 78, 0.9);
-            color: white;
-        }
-        .css-1d391kg {
-            padding-top: 0rem;
-        }
-        .stTabs [data-baseweb="tab-list"] {
-            gap: 2px;
-        }
-        .stTabs [data-baseweb="tab"] {
-            background-color: rgba(20, 39, 78, 0.1);
-            border-radius: 4px 4px 0px 0px;
-            padding: 10px 20px;
-            color: #14274E;
-        }
-        .stTabs [aria-selected="true"] {
-            background-color: rgba(20, 39, 78, 0.8) !important;
-            color: white !important;
-        }
-        .css-1y4p8pa {
-            max-width: 100%;
-            padding-top: 1rem;
-        }
-        .block-container {
-            padding-top: 1rem;
-            padding-bottom: 0rem;
-            padding-left: 5rem;
-            padding-right: 5rem;
-        }
-        .main-header {
-            background-color: rgba(20, 39, 78, 0.8);
-            padding: 1.5rem;
-            border-radius: 10px;
-            color: white;
-            margin-bottom: 1rem;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }
-        .card {
-            background-color: rgba(255, 255, 255, 0.9);
-            border-radius: 10px;
-            padding: 1.5rem;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-            margin-bottom: 1rem;
-        }
-        .metric-card {
-            background-color: rgba(20, 39, 78, 0.8);
-            border-radius: 10px;
-            padding: 1rem;
-            color: white;
-            text-align: center;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }
-        .metric-value {
-            font-size: 2rem;
-            font-weight: bold;
-        }
-        .metric-label {
-            font-size: 0.9rem;
-            opacity: 0.8;
-        }
-        .risk-high {
-            color: #ff4b4b;
-            font-weight: bold;
-        }
-        .risk-medium {
-            color: #ffa500;
-            font-weight: bold;
-        }
-        .risk-low {
-            color: #00cc96;
-            font-weight: bold;
-        }
-        .chat-message {
-            padding: 1rem;
-            border-radius: 10px;
-            margin-bottom: 0.5rem;
-            display: flex;
-            flex-direction: column;
-        }
-        .chat-message.user {
-            background-color: rgba(20, 39, 78, 0.1);
-            border-left: 5px solid #14274E;
-        }
-        .chat-message.assistant {
-            background-color: rgba(20, 39, 78, 0.05);
-            border-left: 5px solid #4CAF50;
-        }
-        .chat-message .content {
-            margin-top: 0.5rem;
-        }
-        .btn-primary {
-            background-color: #14274E;
-            color: white;
-        }
-        .btn-danger {
-            background-color: #ff4b4b;
-            color: white;
-        }
-        .btn-success {
-            background-color: #00cc96;
-            color: white;
-        }
-        .btn-warning {
-            background-color: #ffa500;
-            color: white;
-        }
-        .footer {
-            text-align: center;
-            margin-top: 2rem;
-            padding: 1rem;
-            background-color: rgba(20, 39, 78, 0.8);
-            color: white;
-            border-radius: 10px;
-        }
-        /* Mobile responsiveness */
-        @media (max-width: 768px) {
-            .block-container {
-                padding-left: 1rem;
-                padding-right: 1rem;
-            }
-        }
-    </style>
-    """
-    st.markdown(css, unsafe_allow_html=True)
+    # The minified stylesheet is built once per process
+    st.markdown(f"<style>{get_stylesheet()}</style>", unsafe_allow_html=True)
+
+# Measure what each rerun sends to the browser
+payload_meter = PayloadMeter().install(get_script_run_ctx())
 
 # Load custom CSS
 load_css()
@@ -253,160 +222,315 @@ def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 def create_user(email, password, role="client", plan="free"):
-    conn = sqlite3.connect('finsec.db')
-    c = conn.cursor()
-    
-    # Check if user already exists
-    c.execute("SELECT * FROM users WHERE email = ?", (email,))
-    if c.fetchone():
-        conn.close()
-        return False, "User with this email already exists"
-    
-    # Create new user
     user_id = str(uuid.uuid4())
     hashed_password = hash_password(password)
     created_at = datetime.datetime.now()
-    
-    c.execute(
-        "INSERT INTO users (id, email, password, role, plan, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-        (user_id, email, hashed_password, role, plan, created_at)
-    )
-    
-    # Create default settings for user
     api_key = f"fsk_{uuid.uuid4().hex[:16]}"
-    c.execute(
-        "INSERT INTO settings (user_id, email_alerts, live_access, webhook_url, api_key) VALUES (?, ?, ?, ?, ?)",
-        (user_id, False, False, "", api_key)
-    )
     
-    conn.commit()
-    conn.close()
+    with get_database().transaction() as tx:
+        # Check if user already exists; the conflict clause covers concurrent signups
+        created = tx.execute(
+            "INSERT INTO users (id, email, password, role, plan, created_at) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (email) DO NOTHING",
+            (user_id, email, hashed_password, role, plan, created_at)
+        )
+        if not created:
+            return False, "User with this email already exists"
+        
+        # Create default settings for user
+        tx.execute(
+            "INSERT INTO settings (user_id, email_alerts, live_access, webhook_url, api_key) VALUES (?, ?, ?, ?, ?)",
+            (user_id, False, False, "", api_key)
+        )
     
     return True, user_id
 
 def authenticate_user(email, password):
-    conn = sqlite3.connect('finsec.db')
-    c = conn.cursor()
-    
     hashed_password = hash_password(password)
-    c.execute("SELECT * FROM users WHERE email = ? AND password = ?", (email, hashed_password))
-    user = c.fetchone()
-    
-    conn.close()
+    user = get_database().fetch_one(
+        "SELECT id, email, role, plan, created_at FROM users WHERE email = ? AND password = ?",
+        (email, hashed_password)
+    )
     
     if user:
-        return True, {
-            "id": user[0],
-            "email": user[1],
-            "role": user[3],
-            "plan": user[4],
-            "created_at": user[5]
-        }
+        return True, user
     else:
         return False, None
 
 def get_user_settings(user_id):
-    conn = sqlite3.connect('finsec.db')
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM settings WHERE user_id = ?", (user_id,))
-    settings = c.fetchone()
-    
-    conn.close()
+    settings = get_database().fetch_one(
+        "SELECT email_alerts, live_access, webhook_url, api_key, medium_threshold, high_threshold FROM settings WHERE user_id = ?",
+        (user_id,)
+    )
     
     if settings:
-        return {
-            "email_alerts": bool(settings[1]),
-            "live_access": bool(settings[2]),
-            "webhook_url": settings[3],
-            "api_key": settings[4]
-        }
+        settings["email_alerts"] = bool(settings["email_alerts"])
+        settings["live_access"] = bool(settings["live_access"])
+        return settings
     else:
         return {
             "email_alerts": False,
             "live_access": False,
             "webhook_url": "",
-            "api_key": ""
+            "api_key": "",
+            "medium_threshold": None,
+            "high_threshold": None
         }
 
-def update_user_settings(user_id, email_alerts, live_access, webhook_url):
-    conn = sqlite3.connect('finsec.db')
-    c = conn.cursor()
+def get_user_thresholds(user_id):
+    settings = get_user_settings(user_id)
+    if settings["medium_threshold"] is None or settings["high_threshold"] is None:
+        return get_risk_model().thresholds
+    return (settings["medium_threshold"], settings["high_threshold"])
+
+def update_user_thresholds(user_id, medium_threshold, high_threshold):
+    if not 0 <= medium_threshold <= high_threshold <= 1:
+        return False
     
-    c.execute(
+    get_database().execute(
+        "UPDATE settings SET medium_threshold = ?, high_threshold = ? WHERE user_id = ?",
+        (medium_threshold, high_threshold, user_id)
+    )
+    
+    return True
+
+def update_user_settings(user_id, email_alerts, live_access, webhook_url):
+    get_database().execute(
         "UPDATE settings SET email_alerts = ?, live_access = ?, webhook_url = ? WHERE user_id = ?",
         (email_alerts, live_access, webhook_url, user_id)
     )
     
-    conn.commit()
-    conn.close()
-    
     return True
 
-def save_scan_results(user_id, filename, total, high, medium, low):
-    conn = sqlite3.connect('finsec.db')
-    c = conn.cursor()
-    
+ROLLUP_UPSERT = '''
+INSERT INTO scan_daily_rollups (user_id, day, scan_count, total_transactions, high_risk_count, medium_risk_count, low_risk_count)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id, day) DO UPDATE SET
+    scan_count = scan_daily_rollups.scan_count + excluded.scan_count,
+    total_transactions = scan_daily_rollups.total_transactions + excluded.total_transactions,
+    high_risk_count = scan_daily_rollups.high_risk_count + excluded.high_risk_count,
+    medium_risk_count = scan_daily_rollups.medium_risk_count + excluded.medium_risk_count,
+    low_risk_count = scan_daily_rollups.low_risk_count + excluded.low_risk_count
+'''
+
+SCAN_INSERT = "INSERT INTO scans (id, user_id, filename, total_transactions, high_risk_count, medium_risk_count, low_risk_count, scan_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+@instrument("save_scan_results", rows=lambda user_id, filename, total, *args, **kwargs: total)
+def save_scan_results(user_id, filename, total, high, medium, low, transactions=None, encoded=None):
     scan_id = str(uuid.uuid4())
     scan_date = datetime.datetime.now()
     
-    c.execute(
-        "INSERT INTO scans (id, user_id, filename, total_transactions, high_risk_count, medium_risk_count, low_risk_count, scan_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-        (scan_id, user_id, filename, total, high, medium, low, scan_date)
-    )
+    statements = [
+        (SCAN_INSERT, (scan_id, user_id, filename, total, high, medium, low, scan_date)),
+        (ROLLUP_UPSERT, (user_id, scan_date.date(), 1, total, high, medium, low))
+    ]
+    
+    # Scored transactions, when given, are stored and indexed for search
+    if transactions is not None:
+        encoded = encoded or get_dictionary_encoder().encode_frame(transactions)
+        statements.append((TRANSACTION_INSERT, transaction_rows(scan_id, user_id, transactions, encoded)))
+        statements += get_search_index().index_scan_statements(scan_id)
     
-    conn.commit()
-    conn.close()
+    # Group-committed with other sessions' saves instead of one transaction each
+    get_database().write(statements)
     
     return scan_id
 
+RECATEGORIZE_TRANSACTIONS = (
+    "UPDATE scan_transactions SET risk_category = CASE WHEN risk_score >= ? THEN 'High' WHEN risk_score >= ? THEN 'Medium' ELSE 'Low' END "
+    "WHERE scan_id = ?"
+)
+
+def recategorize_scan(user_id, scan_id, thresholds, high, medium, low):
+    # Rewrites a saved scan under new thresholds, in one transaction: its
+    # counts, its day in the rollups and its stored transactions, whose
+    # search index entries are removed and added back around the update
+    db = get_database()
+    search_index = get_search_index()
+    with db.transaction() as tx:
+        # Locks the scan row first, so concurrent applies cannot both read the old counts
+        if not tx.execute("UPDATE scans SET high_risk_count = high_risk_count WHERE id = ? AND user_id = ?", (scan_id, user_id)):
+            return False
+        old = tx.fetch_one(
+            f"SELECT high_risk_count, medium_risk_count, low_risk_count, {db.date_of('scan_date')} AS day FROM scans WHERE id = ?",
+            (scan_id,)
+        )
+        tx.execute(
+            "UPDATE scan_daily_rollups SET high_risk_count = high_risk_count + ?, medium_risk_count = medium_risk_count + ?, "
+            "low_risk_count = low_risk_count + ? WHERE user_id = ? AND day = ?",
+            (high - old["high_risk_count"], medium - old["medium_risk_count"], low - old["low_risk_count"], user_id, old["day"])
+        )
+        tx.execute(
+            "UPDATE scans SET high_risk_count = ?, medium_risk_count = ?, low_risk_count = ? WHERE id = ?",
+            (high, medium, low, scan_id)
+        )
+        for sql, params in search_index.remove_scan_statements(scan_id):
+            tx.execute(sql, params)
+        tx.execute(RECATEGORIZE_TRANSACTIONS, (thresholds[1], thresholds[0], scan_id))
+        for sql, params in search_index.index_scan_statements(scan_id):
+            tx.execute(sql, params)
+    return True
+
 def get_user_scans(user_id):
-    conn = sqlite3.connect('finsec.db')
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM scans WHERE user_id = ? ORDER BY scan_date DESC", (user_id,))
-    scans = c.fetchall()
-    
-    conn.close()
+    scans = get_database().fetch_all(
+        "SELECT id, filename, total_transactions, high_risk_count, medium_risk_count, low_risk_count, scan_date "
+        "FROM scans WHERE user_id = ? ORDER BY scan_date DESC",
+        (user_id,)
+    )
     
     result = []
     for scan in scans:
         result.append({
-            "id": scan[0],
-            "filename": scan[2],
-            "total": scan[3],
-            "high_risk": scan[4],
-            "medium_risk": scan[5],
-            "low_risk": scan[6],
-            "date": scan[7]
+            "id": scan["id"],
+            "filename": scan["filename"],
+            "total": scan["total_transactions"],
+            "high_risk": scan["high_risk_count"],
+            "medium_risk": scan["medium_risk_count"],
+            "low_risk": scan["low_risk_count"],
+            "date": scan["scan_date"]
         })
     
     return result
 
-# Fraud detection functions
-def analyze_transactions(df):
-    # Add risk score calculation
-    df['risk_score'] = np.random.uniform(0, 1, size=len(df))
-    
-    # Assign risk categories
-    def assign_risk_category(score):
-        if score < 0.3:
-            return "Low"
-        elif score < 0.7:
-            return "Medium"
-        else:
-            return "High"
-    
-    df['risk_category'] = df['risk_score'].apply(assign_risk_category)
+TREND_PERIODS = ("day", "week", "month")
+
+def get_user_risk_trends(user_id, period="day"):
+    if period not in TREND_PERIODS:
+        raise ValueError(f"period must be one of {', '.join(TREND_PERIODS)}")
     
-    # Count risk categories
-    risk_counts = df['risk_category'].value_counts().to_dict()
-    high_count = risk_counts.get('High', 0)
-    medium_count = risk_counts.get('Medium', 0)
-    low_count = risk_counts.get('Low', 0)
+    # Reads the pre-rolled daily rows, never the scans table
+    db = get_database()
+    bucket = db.period_start(period, "day")
+    rows = db.fetch_all(
+        f"SELECT {bucket} AS period, SUM(scan_count) AS scans, SUM(total_transactions) AS total, "
+        "SUM(high_risk_count) AS high_risk, SUM(medium_risk_count) AS medium_risk, SUM(low_risk_count) AS low_risk "
+        f"FROM scan_daily_rollups WHERE user_id = ? GROUP BY {bucket} ORDER BY {bucket}",
+        (user_id,)
+    )
     
+    return rows
+
+# Bulk ingestion functions
+BULK_BATCH_SIZE = 10000
+
+def _iter_batches(rows, batch_size):
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    it = iter(rows)
+    while True:
+        batch = list(itertools.islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def _write_batches(batches, write_batch, synchronous):
+    # One transaction per batch, with durability relaxed only while it runs
+    db = get_database()
+    written = 0
+    started = time.perf_counter()
+
+    for batch in batches:
+        with db.bulk_transaction(synchronous) as tx:
+            written += write_batch(tx, batch)
+
+    elapsed = time.perf_counter() - started
+    return written, elapsed
+
+def _bulk_stats(rows, skipped, elapsed):
+    return {
+        "rows": rows,
+        "skipped": skipped,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed) if elapsed > 0 else rows
+    }
+
+def bulk_create_users(users, batch_size=BULK_BATCH_SIZE, synchronous="NORMAL"):
+    # users: iterable of dicts with email and password, and optionally role and plan
+    submitted = 0
+
+    def prepare(batch):
+        nonlocal submitted
+        submitted += len(batch)
+        created_at = datetime.datetime.now()
+        user_rows = []
+        settings_rows = []
+        for user in batch:
+            user_id = str(uuid.uuid4())
+            user_rows.append((
+                user_id,
+                user["email"],
+                hash_password(user["password"]),
+                user.get("role", "client"),
+                user.get("plan", "free"),
+                created_at
+            ))
+            settings_rows.append((user_id, False, False, "", f"fsk_{uuid.uuid4().hex[:16]}", user_id))
+        return user_rows, settings_rows
+
+    def write_batch(tx, batch):
+        user_rows, settings_rows = prepare(batch)
+
+        # Existing emails are skipped, like create_user does
+        created = tx.executemany(
+            "INSERT INTO users (id, email, password, role, plan, created_at) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (email) DO NOTHING",
+            user_rows
+        )
+
+        # Only create settings for users that were actually inserted
+        tx.executemany(
+            "INSERT INTO settings (user_id, email_alerts, live_access, webhook_url, api_key) "
+            "SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM users WHERE id = ?)",
+            settings_rows
+        )
+        return created
+
+    created, elapsed = _write_batches(_iter_batches(users, batch_size), write_batch, synchronous)
+
+    return _bulk_stats(created, submitted - created, elapsed)
+
+def bulk_save_scan_results(scans, batch_size=BULK_BATCH_SIZE, synchronous="NORMAL"):
+    # scans: iterable of dicts with the save_scan_results fields
+    # (user_id, filename, total, high, medium, low) and optionally id and scan_date
+    def write_batch(tx, batch):
+        now = datetime.datetime.now()
+        rows = [
+            (
+                scan.get("id") or str(uuid.uuid4()),
+                scan["user_id"],
+                scan["filename"],
+                scan["total"],
+                scan["high"],
+                scan["medium"],
+                scan["low"],
+                scan.get("scan_date") or now
+            )
+            for scan in batch
+        ]
+        tx.executemany(SCAN_INSERT, rows)
+
+        # Pre-aggregate the batch so each (user, day) rollup is upserted once
+        rollups = {}
+        for _, user_id, _, total, high, medium, low, scan_date in rows:
+            day = scan_date.date() if isinstance(scan_date, datetime.datetime) else datetime.date.fromisoformat(str(scan_date)[:10])
+            counts = rollups.setdefault((user_id, day), [0, 0, 0, 0, 0])
+            counts[0] += 1
+            counts[1] += total
+            counts[2] += high
+            counts[3] += medium
+            counts[4] += low
+        tx.executemany(ROLLUP_UPSERT, [key + tuple(counts) for key, counts in rollups.items()])
+        return len(rows)
+
+    saved, elapsed = _write_batches(_iter_batches(scans, batch_size), write_batch, synchronous)
+
+    return _bulk_stats(saved, 0, elapsed)
+
+# Fraud detection functions
+MAX_LISTED_RINGS = 20
+
+def summarize_risk_counts(high_count, medium_count, low_count):
     # Calculate percentages
-    total = len(df)
+    total = high_count + medium_count + low_count
     high_percent = round((high_count / total) * 100)
     medium_percent = round((medium_count / total) * 100)
     low_percent = round((low_count / total) * 100)
@@ -414,6 +538,18 @@ def analyze_transactions(df):
     # Generate summary
     summary = f"{high_percent}% of transactions were high risk, {medium_percent}% medium risk, and {low_percent}% low risk."
     
+    return {
+        'total': total,
+        'high_count': high_count,
+        'medium_count': medium_count,
+        'low_count': low_count,
+        'high_percent': high_percent,
+        'medium_percent': medium_percent,
+        'low_percent': low_percent,
+        'summary': summary
+    }
+
+def assign_fraud_indicators(df):
     # Add fraud indicators (simulated)
     fraud_indicators = [
         "Unusual transaction amount",
@@ -432,39 +568,63 @@ def analyze_transactions(df):
         else:
             return ''
     
-    df['fraud_indicators'] = df.apply(assign_indicators, axis=1)
+    indicators = df.apply(assign_indicators, axis=1) if len(df) else pd.Series('', index=df.index, dtype=object)
     
-    return df, {
-        'total': total,
-        'high_count': high_count,
-        'medium_count': medium_count,
-        'low_count': low_count,
-        'high_percent': high_percent,
-        'medium_percent': medium_percent,
-        'low_percent': low_percent,
-        'summary': summary
-    }
+    # Members of suspected fraud rings are marked whatever their risk
+    if 'fraud_ring' in df.columns:
+        in_ring = df['fraud_ring'].notna().to_numpy()
+        if in_ring.any():
+            existing = indicators[in_ring]
+            indicators[in_ring] = np.where(existing != '', existing + ', ' + RING_INDICATOR, RING_INDICATOR)
+    return indicators
 
-def api_analyze_transaction(transaction_data):
-    # Simulate API call
-    time.sleep(1)  # Simulate network delay
+@instrument("analyze_transactions", rows=lambda df, *args, **kwargs: len(df))
+def analyze_transactions(df, scores=None, thresholds=None):
+    # Add risk score calculation (progressive mode passes scores it already computed)
+    model = get_risk_model()
+    # Merchant, location and category are interned once; scoring and ring links use the codes
+    encoded = get_dictionary_encoder().encode_frame(df)
+    df['risk_score'] = model.score_frame(df, encoded) if scores is None else scores
+    
+    # Assign risk categories using the user's thresholds, or the model's
+    thresholds = tuple(thresholds or model.thresholds)
+    df['risk_category'] = categorize(df['risk_score'].to_numpy(), thresholds)
     
-    # Generate random risk score
-    risk_score = np.random.uniform(0, 1)
+    # Count risk categories from the sorted score index used for what-if recounts
+    score_index = ScoreIndex(df['risk_score'].to_numpy())
+    risk_counts = score_index.counts(thresholds)
+    summary = summarize_risk_counts(risk_counts['High'], risk_counts['Medium'], risk_counts['Low'])
+    
+    # Link transactions sharing cards or customers into suspected fraud rings
+    ring_ids, rings = detect_fraud_rings(df, encoded=encoded)
+    df['fraud_ring'] = pd.Series(ring_ids, index=df.index).where(ring_ids >= 0).astype("Int64")
+    df['fraud_indicators'] = assign_fraud_indicators(df)
+    
+    summary.update({
+        'thresholds': thresholds,
+        'score_index': score_index,
+        'encoded': encoded,
+        'ring_count': len(rings),
+        'fraud_rings': rings.head(MAX_LISTED_RINGS).to_dict("records")
+    })
+    return df, summary
+
+def api_analyze_transaction(transaction_data, thresholds=None):
+    # Score with the in-process model
+    model = get_risk_model()
+    risk_score = model.score_one(transaction_data)
     
     # Assign risk category
-    if risk_score < 0.3:
-        risk_category = "Low"
+    risk_category = categorize_one(risk_score, thresholds or model.thresholds)
+    if risk_category == "Low":
         fraud_indicators = []
-    elif risk_score < 0.7:
-        risk_category = "Medium"
+    elif risk_category == "Medium":
         fraud_indicators = np.random.choice([
             "Unusual transaction amount",
             "Suspicious IP address",
             "Multiple transactions in short time"
         ], size=np.random.randint(1, 3), replace=False).tolist()
     else:
-        risk_category = "High"
         fraud_indicators = np.random.choice([
             "Unusual transaction amount",
             "Suspicious IP address",
@@ -481,23 +641,217 @@ def api_analyze_transaction(transaction_data):
         'timestamp': datetime.datetime.now().isoformat()
     }
 
+@instrument("live_transaction", rows=lambda *args, **kwargs: 1)
+def process_live_transaction(user_id, transaction_data, thresholds=None, webhook_url=None, dispatcher=None):
+    # The live scoring path: score, then queue a webhook alert for high risk.
+    # Returns (result, alert_queued); the replay tool drives this same function.
+    result = api_analyze_transaction(transaction_data, thresholds)
+    alert_queued = False
+    if result['risk_category'] == "High" and webhook_url:
+        alert_queued = (dispatcher or get_alert_dispatcher()).enqueue(user_id, webhook_url, result)
+    return result, alert_queued
+
 # AI Chatbot functions
-def get_ai_response(query):
-    if not OPENAI_API_KEY:
-        return "AI assistant is not available. Please add your OpenAI API key in the settings."
+@st.cache_resource
+def get_assistant():
+    # Shared per process so the answer cache is reused across sessions
+    backend = create_backend(ASSISTANT_BACKEND, OPENAI_API_KEY)
+    return Assistant(backend) if backend else None
+
+def stream_ai_response(query, history=()):
+    assistant = get_assistant()
+    if assistant is None:
+        yield "AI assistant is not available. Please add your OpenAI API key in the settings."
+        return
     
+    yield from assistant.stream_response(query, history)
+
+@instrument("ai_response")
+def get_ai_response(query, history=()):
+    return "".join(stream_ai_response(query, history)).strip()
+
+# Alerting functions
+@st.cache_resource
+def get_alert_dispatcher():
+    # One dispatcher thread per process, shared by every session; the outbox is per host
+    return AlertDispatcher(local_db_path(get_database())).start()
+
+# Duplicate detection functions
+@st.cache_resource
+def get_duplicate_index():
+    # Fingerprints live in the main database; each process keeps Bloom filter hints
+    return DuplicateIndex(get_database())
+
+# Quota functions
+@st.cache_resource
+def get_quota_manager():
+    # Scan counters live in the main database; live token buckets are per process
+    return QuotaManager(get_database())
+
+@st.cache_resource
+def get_scan_scheduler():
+    # Limits concurrent scans per process and shares them fairly between users
+    return FairScheduler()
+
+# Metrics functions
+@st.cache_resource
+def start_metrics_server():
+    # Prometheus endpoint, one per process, only when FINSEC_METRICS_PORT is set
+    return MetricsServer(port=METRICS_PORT).start() if METRICS_PORT else None
+
+# Profiling functions
+@st.cache_resource
+def get_profiler():
+    # Shared per process so the admin toggle applies to every session on this host
+    return RerunProfiler(local_db_path(get_database()))
+
+# Dictionary encoding functions
+@st.cache_resource
+def get_dictionary_encoder():
+    # Codes are shared by every session; each process caches the dictionaries it has used
+    return DictionaryEncoder(get_database())
+
+# Search functions
+@st.cache_resource
+def get_search_index():
+    return create_search_index(get_database())
+
+# Retention functions
+@st.cache_resource
+def get_compactor():
+    return Compactor(get_database(), get_search_index())
+
+@st.cache_resource
+def start_compaction_scheduler():
+    # One background compactor per process; the lease lets only one run at a time
+    return CompactionScheduler(get_compactor()).start() if COMPACTION_INTERVAL > 0 else None
+
+# Scan comparison functions
+MAX_DIFF_ROWS = 1000
+
+@st.cache_resource(max_entries=4, ttl=3600, show_spinner=False)
+def compare_scans(user_id, old_scan_id, new_scan_id):
+    # Cached per pair: the grid, filters and export reuse one join
+    db = get_database()
+    with timed("load_scan_transactions"):
+        old = load_scan_transactions(db, user_id, old_scan_id)
+        new = load_scan_transactions(db, user_id, new_scan_id)
+    with timed("diff_scans", len(old) + len(new)):
+        result, summary = diff_scans(old, new)
+    summary["stored"] = (len(old) > 0, len(new) > 0)
+    return result, summary
+
+# Shared session functions
+# Keys restored when a session is picked up by another replica. The login is
+# never one of them: the sid is in the URL, so it must not act as a credential
+SHARED_STATE_KEYS = ["page", "show_chat", "chat_messages", "uploaded_file", "analysis_results"]
+
+@st.cache_resource
+def get_session_store():
+    return create_session_store()
+
+def get_session_id():
+    # Carried in the URL, so any replica serving this browser tab finds its state
+    if "session_id" not in st.session_state:
+        session_id = st.query_params.get("sid")
+        # Anything but an id this server issued gets a fresh one
+        if not is_session_id(session_id):
+            session_id = new_session_id()
+            st.query_params["sid"] = session_id
+        st.session_state.session_id = session_id
+    return st.session_state.session_id
+
+def restore_shared_session():
+    # Once per login: adopt what another replica stored for this session id,
+    # only when it belongs to the user who has just signed in here
+    user = st.session_state.get("user")
+    if not user or st.session_state.get("shared_session_checked"):
+        return
+    st.session_state.shared_session_checked = True
+    state = get_session_store().load_state(get_session_id())
+    if state and state.get("user_id") == user["id"]:
+        for key in SHARED_STATE_KEYS:
+            if key in state:
+                st.session_state[key] = state[key]
+        st.session_state.persisted_state = encode_state(state)
+
+def persist_shared_session():
+    # Only logged-in sessions are shared, and only after restore_shared_session
+    # has had its chance to adopt the stored state; unchanged state is not rewritten
+    if not st.session_state.get("user") or not st.session_state.get("shared_session_checked"):
+        return
+    state = {key: st.session_state.get(key) for key in SHARED_STATE_KEYS}
+    state["user_id"] = st.session_state.user["id"]
+    encoded = encode_state(state)
+    if encoded != st.session_state.get("persisted_state"):
+        get_session_store().save_state(get_session_id(), st.session_state.user["id"], state)
+        st.session_state.persisted_state = encoded
+
+def save_analysis_frames(results_df, duplicates_df):
+    # Frames live in the shared store; the session only keeps their content hash
+    store = get_session_store()
+    session_id = get_session_id()
+    store.save_frame(session_id, st.session_state.user["id"], "results", results_df)
+    store.save_frame(session_id, st.session_state.user["id"], "duplicates", duplicates_df)
+    return scan_content_hash(results_df)
+
+def load_analysis_frames(session_id, content_hash):
+    # Frames are read from the store on every rerun and dropped after it, so a
+    # replica's memory does not grow with uploads; only the score index is cached
+    store = get_session_store()
+    df = store.load_frame(session_id, "results")
+    if df is None:
+        return None
+    return {
+        "df": df,
+        "duplicates": store.load_frame(session_id, "duplicates"),
+        "score_index": load_score_index(session_id, content_hash, df["risk_score"])
+    }
+
+@st.cache_resource(max_entries=16, ttl=3600)
+def load_score_index(session_id, content_hash, _scores):
+    # One sorted float64 array per scan, for what-if recounts on every slider move
+    return ScoreIndex(_scores.to_numpy())
+
+# Upload functions
+MAX_LISTED_DUPLICATES = 1000
+
+@st.cache_resource
+def cleanup_stale_uploads():
+    # Runs once per process; spooled uploads older than a day are removed
+    return cleanup_uploads()
+
+def read_new_transactions(path, user_id, plan):
+    # Chunk-scans an upload: every chunk is claimed against earlier scans as it
+    # is read and only its new rows are kept, so memory follows the new rows
+    # (at most the plan's max_scan_rows) instead of the file size. Returns
+    # (claim_id, new rows, the first MAX_LISTED_DUPLICATES duplicates, duplicate count)
+    duplicate_index = get_duplicate_index()
+    max_rows = plan_quotas(plan)["max_scan_rows"]
+    claim_id = uuid.uuid4().hex
+    new_chunks, listed_duplicates = [], []
+    new_count = duplicate_count = 0
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant for FinSec, a financial fraud detection platform. Provide concise, helpful responses about using the platform, fraud detection, and financial security."},
-                {"role": "user", "content": query}
-            ],
-            max_tokens=150
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {str(e)}"
+        for chunk in iter_upload_chunks(path):
+            _, is_duplicate = duplicate_index.claim(user_id, chunk, claim_id=claim_id)
+            new_count += int((~is_duplicate).sum())
+            if new_count > max_rows:
+                raise QuotaExceeded(
+                    f"This file has more than {max_rows:,} new transactions; your {plan} plan allows up to {max_rows:,} per scan."
+                )
+            new_chunks.append(chunk[~is_duplicate])
+            if is_duplicate.any() and duplicate_count < MAX_LISTED_DUPLICATES:
+                listed_duplicates.append(chunk[is_duplicate].head(MAX_LISTED_DUPLICATES - duplicate_count))
+            duplicate_count += int(is_duplicate.sum())
+    except BaseException:
+        duplicate_index.release(claim_id)
+        raise
+    
+    # Files without rows still give their columns
+    empty = preview_upload(path, 0)
+    df = pd.concat(new_chunks, ignore_index=True) if new_chunks else empty
+    duplicates_df = pd.concat(listed_duplicates, ignore_index=True) if listed_duplicates else empty
+    return claim_id, df, duplicates_df, duplicate_count
 
 # Utility functions
 def get_table_download_link(df, filename="finsec_report.csv", text="Download CSV Report"):
@@ -506,10 +860,136 @@ def get_table_download_link(df, filename="finsec_report.csv", text="Download CSV
     href = f'<a href="data:file/csv;base64,{b64}" download="{filename}" class="btn-primary" style="text-decoration:none;padding:0.5rem 1rem;border-radius:5px;">{text}</a>'
     return href
 
+def scan_content_hash(df):
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()
+
+# Chart functions
+# Chart specs are cached on the scan's content hash, so reruns triggered by
+# unrelated widgets reuse them instead of rebuilding figures from the frame.
+# Arguments starting with an underscore are not hashed by st.cache_data.
+MAX_CHART_POINTS = 300
+SCORE_HISTOGRAM_BINS = 50
+RISK_COLORS = {"High": "#ff4b4b", "Medium": "#ffa500", "Low": "#00cc96"}
+
+def _compact_layout(fig):
+    fig.update_layout(margin=dict(t=0, b=0, l=0, r=0))
+    return fig.to_dict()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_risk_pie_spec(content_hash, high, medium, low):
+    fig = px.pie(
+        names=["High", "Medium", "Low"],
+        values=[high, medium, low],
+        color=["High", "Medium", "Low"],
+        color_discrete_map=RISK_COLORS
+    )
+    return _compact_layout(fig)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_indicator_bar_spec(content_hash, _df):
+    indicators = _df["fraud_indicators"]
+    indicators = indicators[indicators.astype(bool)].str.split(",").explode().str.strip()
+
+    indicator_counts = indicators.value_counts().reset_index()
+    indicator_counts.columns = ["Indicator", "Count"]
+
+    fig = px.bar(
+        indicator_counts,
+        x="Count",
+        y="Indicator",
+        orientation="h",
+        color_discrete_sequence=["#14274E"]
+    )
+    return _compact_layout(fig)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_score_histogram_spec(content_hash, _df):
+    # Binned here so the browser receives bin counts instead of every score
+    counts, edges = np.histogram(_df["risk_score"].to_numpy(), bins=SCORE_HISTOGRAM_BINS, range=(0.0, 1.0))
+    centers = (edges[:-1] + edges[1:]) / 2
+
+    fig = go.Figure(go.Bar(x=centers, y=counts, width=edges[1] - edges[0], marker_color="#14274E"))
+    fig.update_layout(xaxis_title="Risk Score", yaxis_title="Transactions", bargap=0.05)
+    return _compact_layout(fig)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_score_trend_spec(content_hash, _df, date_column="date"):
+    if date_column not in _df.columns:
+        return None
+
+    dates = pd.to_datetime(_df[date_column], errors="coerce")
+    valid = dates.notna().to_numpy()
+    if not valid.any():
+        return None
+
+    # Pre-bin scores into at most MAX_CHART_POINTS equal-width time buckets
+    stamps = dates.to_numpy()[valid].astype("datetime64[ns]").astype(np.int64)
+    scores = _df["risk_score"].to_numpy()[valid]
+    high = (_df["risk_category"].to_numpy()[valid] == "High")
+
+    start, end = stamps.min(), stamps.max()
+    n_bins = min(MAX_CHART_POINTS, len(np.unique(stamps)))
+    width = max((end - start) / n_bins, 1)
+    bins = np.minimum(((stamps - start) / width).astype(np.int64), n_bins - 1)
+
+    counts = np.bincount(bins, minlength=n_bins)
+    score_sums = np.bincount(bins, weights=scores, minlength=n_bins)
+    high_counts = np.bincount(bins, weights=high, minlength=n_bins)
+
+    filled = counts > 0
+    bucket_starts = pd.to_datetime(start + np.arange(n_bins)[filled] * width)
+    mean_scores = score_sums[filled] / counts[filled]
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=bucket_starts, y=mean_scores, mode="lines+markers", name="Average Risk Score", line=dict(color="#14274E")))
+    fig.add_trace(go.Bar(x=bucket_starts, y=high_counts[filled], name="High Risk Transactions", marker_color=RISK_COLORS["High"], yaxis="y2", opacity=0.5))
+    fig.update_layout(
+        yaxis=dict(title="Average Risk Score", range=[0, 1]),
+        yaxis2=dict(title="High Risk", overlaying="y", side="right", showgrid=False),
+        legend=dict(orientation="h")
+    )
+    return _compact_layout(fig)
+
+# Progressive analysis
+def render_progressive_analysis(df, thresholds):
+    # Scores a stratified sample first, then refines the estimates chunk by chunk
+    model = get_risk_model()
+    progress = st.progress(0.0, text="Scoring a stratified sample...")
+    metrics = st.empty()
+    chart = st.empty()
+    
+    for snap in iter_progressive(df, model.score_frame, lambda scores: categorize(scores, thresholds)):
+        estimates = snap["estimates"]
+        progress.progress(snap["processed"] / snap["total"], text=f"{snap['processed']:,} of {snap['total']:,} transactions scored")
+        
+        with metrics.container():
+            cols = st.columns(3)
+            for col, level in zip(cols, RISK_LEVELS):
+                estimate = estimates[level]
+                with col:
+                    st.markdown(f'<div class="metric-card" style="background-color: {RISK_COLORS[level]};"><div class="metric-value">~{estimate["estimate"]:,}</div><div class="metric-label">{level} Risk (95% interval {estimate["low"]:,} to {estimate["high"]:,})</div></div>', unsafe_allow_html=True)
+        
+        fig = go.Figure(go.Bar(
+            x=RISK_LEVELS,
+            y=[estimates[level]["estimate"] for level in RISK_LEVELS],
+            error_y=dict(
+                type="data",
+                symmetric=False,
+                array=[estimates[level]["high"] - estimates[level]["estimate"] for level in RISK_LEVELS],
+                arrayminus=[estimates[level]["estimate"] - estimates[level]["low"] for level in RISK_LEVELS]
+            ),
+            marker_color=[RISK_COLORS[level] for level in RISK_LEVELS]
+        ))
+        fig.update_layout(margin=dict(t=0, b=0, l=0, r=0), yaxis_title="Estimated Transactions")
+        chart.plotly_chart(fig, use_container_width=True)
+    
+    return snap["scores"]
+
 # Sidebar navigation
 def render_sidebar():
     with st.sidebar:
-        st.image("static/finsec_logo.png", width=200)
+        render_logo(200)
         st.markdown("### Predict. Prevent. Protect.")
         
         st.markdown("---")
@@ -561,6 +1041,14 @@ def render_sidebar():
             if st.button("Privacy Policy"):
                 st.session_state.page = "privacy"
                 st.experimental_rerun()
+        
+        # Bytes the previous rerun sent to the browser
+        if SHOW_PAYLOAD and "last_payload" in st.session_state:
+            payload = st.session_state.last_payload
+            st.caption(
+                f"Last rerun: {payload['total_bytes'] / 1024:.1f} KB "
+                f"({payload['messages']} messages, {payload['media_bytes'] / 1024:.1f} KB media)"
+            )
 
 # Logout modal
 def render_logout_modal():
@@ -594,6 +1082,9 @@ def render_logout_modal():
                 st.experimental_rerun()
             
             if st.button("Confirm Logout", key="confirm_logout"):
+                get_session_store().delete_session(get_session_id())
+                st.session_state.persisted_state = None
+                st.session_state.shared_session_checked = False
                 st.session_state.user = None
                 st.session_state.login_status = None
                 st.session_state.show_logout_modal = False
@@ -665,15 +1156,21 @@ def render_chat_interface():
             </script>
             """, unsafe_allow_html=True)
             
+            # Conversation so far
+            for message in st.session_state.chat_messages:
+                with st.chat_message(message["role"]):
+                    st.markdown(message["content"])
+            
             # Handle chat messages
-            if st.button("Send", key="send_chat"):
-                query = st.session_state.get("chat_input", "")
-                if query:
-                    st.session_state.chat_messages.append({"role": "user", "content": query})
-                    response = get_ai_response(query)
-                    st.session_state.chat_messages.append({"role": "assistant", "content": response})
-                    st.session_state.chat_input = ""
-                    st.experimental_rerun()
+            query = st.chat_input("Ask the FinSec assistant", key="chat_input")
+            if query:
+                history = list(st.session_state.chat_messages)
+                st.session_state.chat_messages.append({"role": "user", "content": query})
+                with st.chat_message("user"):
+                    st.markdown(query)
+                with st.chat_message("assistant"), timed("ai_response_stream"):
+                    response = st.write_stream(stream_ai_response(query, history))
+                st.session_state.chat_messages.append({"role": "assistant", "content": response})
 
 # Page: Login
 def render_login_page():
@@ -685,7 +1182,7 @@ def render_login_page():
         col1, col2 = st.columns([1, 1])
         
         with col1:
-            st.image("static/finsec_logo.png", width=300)
+            render_logo(300)
             st.markdown("### Predict. Prevent. Protect.")
             st.markdown("Welcome to FinSec, your advanced financial fraud detection platform.")
         
@@ -725,7 +1222,7 @@ def render_signup_page():
         col1, col2 = st.columns([1, 1])
         
         with col1:
-            st.image("static/finsec_logo.png", width=300)
+            render_logo(300)
             st.markdown("### Predict. Prevent. Protect.")
             st.markdown("Join FinSec today and secure your financial transactions with our advanced fraud detection platform.")
         
@@ -784,48 +1281,95 @@ def render_dashboard_page():
     
     with tabs[0]:
         st.markdown("### Upload Transaction Data")
-        st.markdown("Upload your CSV file containing transaction data for fraud analysis.")
+        st.markdown("Upload your transaction data for fraud analysis as CSV (optionally gzip or zstd compressed), Parquet or JSON Lines.")
         
-        uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
+        uploaded_file = st.file_uploader("Choose a transactions file", type=UPLOAD_TYPES)
         
         if uploaded_file is not None:
-            st.session_state.uploaded_file = uploaded_file
+            cleanup_stale_uploads()
             
             try:
-                df = pd.read_csv(uploaded_file)
+                # Spool each new upload to disk once; the session keeps only its path and hash
+                upload = st.session_state.uploaded_file
+                if upload is None or upload["file_id"] != uploaded_file.file_id:
+                    upload = spool_upload(uploaded_file, uploaded_file.name)
+                    upload["file_id"] = uploaded_file.file_id
+                    st.session_state.uploaded_file = upload
                 
                 st.markdown("### Transaction Data Preview")
-                st.dataframe(df.head())
+                st.dataframe(preview_upload(upload["path"]))
+                
+                progressive = st.checkbox("Show progressive results while analyzing large files", value=True)
                 
                 if st.button("Analyze Transactions"):
                     with st.spinner("Analyzing transactions..."):
-                        # Perform analysis
-                        results_df, summary = analyze_transactions(df)
-                        st.session_state.analysis_results = {
-                            "df": results_df,
-                            "summary": summary
-                        }
+                        # Skip transactions already scanned in earlier uploads; the
+                        # rest are claimed until this scan is saved or given up
+                        duplicate_index = get_duplicate_index()
+                        with timed("parse_upload") as span:
+                            claim_id, df, duplicates_df, duplicate_count = read_new_transactions(
+                                upload["path"], st.session_state.user["id"], st.session_state.user["plan"]
+                            )
+                            span.rows = len(df) + duplicate_count
                         
-                        # Save scan results to database
-                        save_scan_results(
-                            st.session_state.user["id"],
-                            uploaded_file.name,
-                            summary["total"],
-                            summary["high_count"],
-                            summary["medium_count"],
-                            summary["low_count"]
-                        )
+                        try:
+                            if df.empty:
+                                st.warning("Every transaction in this file has already been scanned. Nothing new to analyze.")
+                            else:
+                                # Enforce plan quotas, then wait for a fairly shared scan slot
+                                get_quota_manager().check_scan(st.session_state.user["id"], st.session_state.user["plan"], len(df))
+                                
+                                with get_scan_scheduler().slot(st.session_state.user["id"], st.session_state.user["plan"], len(df)):
+                                    # Perform analysis, showing estimates first for large files
+                                    thresholds = get_user_thresholds(st.session_state.user["id"])
+                                    scores = None
+                                    if progressive and len(df) >= PROGRESSIVE_MIN_ROWS:
+                                        scores = render_progressive_analysis(df, thresholds)
+                                    results_df, summary = analyze_transactions(df, scores, thresholds)
+                                
+                                summary["duplicate_count"] = duplicate_count
+                                del summary["score_index"]
+                                encoded = summary.pop("encoded")
+                                st.session_state.analysis_results = {
+                                    "summary": summary,
+                                    "hash": save_analysis_frames(results_df, duplicates_df)
+                                }
+                                
+                                # Save scan results to database
+                                scan_id = save_scan_results(
+                                    st.session_state.user["id"],
+                                    upload["name"],
+                                    summary["total"],
+                                    summary["high_count"],
+                                    summary["medium_count"],
+                                    summary["low_count"],
+                                    results_df,
+                                    encoded
+                                )
+                                duplicate_index.record(claim_id, scan_id)
+                                st.session_state.analysis_results["scan_id"] = scan_id
+                        except BaseException:
+                            duplicate_index.release(claim_id)
+                            raise
                         
-                        st.success("Analysis complete!")
-                        st.experimental_rerun()
+                        if not df.empty:
+                            st.success("Analysis complete!")
+                            st.experimental_rerun()
             
+            except QuotaExceeded as e:
+                st.error(str(e))
             except Exception as e:
                 st.error(f"Error: {str(e)}")
         
         # Display analysis results if available
-        if st.session_state.analysis_results:
-            results = st.session_state.analysis_results
-            df = results["df"]
+        results = st.session_state.analysis_results
+        frames = load_analysis_frames(get_session_id(), results["hash"]) if results else None
+        if results and frames is None:
+            st.info("These analysis results have expired. Please analyze the file again.")
+            st.session_state.analysis_results = None
+        
+        if frames:
+            df = frames["df"]
             summary = results["summary"]
             
             st.markdown("### Analysis Results")
@@ -844,41 +1388,89 @@ def render_dashboard_page():
             
             st.markdown(f"**Summary:** {summary['summary']}")
             
-            # Charts
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("### Risk Distribution")
-                fig = px.pie(
-                    names=["High", "Medium", "Low"],
-                    values=[summary["high_count"], summary["medium_count"], summary["low_count"]],
-                    color=["High", "Medium", "Low"],
-                    color_discrete_map={"High": "#ff4b4b", "Medium": "#ffa500", "Low": "#00cc96"}
+            # Threshold what-if: counts come from binary searches over the sorted scores
+            with st.expander("Adjust Risk Thresholds"):
+                whatif_thresholds = st.slider(
+                    "Medium and high risk thresholds",
+                    min_value=0.0,
+                    max_value=1.0,
+                    value=tuple(summary["thresholds"]),
+                    step=0.01,
+                    key="whatif_thresholds"
                 )
-                fig.update_layout(margin=dict(t=0, b=0, l=0, r=0))
-                st.plotly_chart(fig, use_container_width=True)
-            
-            with col2:
-                st.markdown("### Fraud Indicators")
-                # Count fraud indicators
-                indicators = []
-                for ind in df["fraud_indicators"]:
-                    if ind:
-                        indicators.extend([i.strip() for i in ind.split(",")])
+                whatif_counts = frames["score_index"].counts(whatif_thresholds)
                 
-                indicator_counts = pd.Series(indicators).value_counts().reset_index()
-                indicator_counts.columns = ["Indicator", "Count"]
+                col1, col2, col3 = st.columns(3)
+                col1.metric("High Risk", whatif_counts["High"], whatif_counts["High"] - summary["high_count"], delta_color="inverse")
+                col2.metric("Medium Risk", whatif_counts["Medium"], whatif_counts["Medium"] - summary["medium_count"], delta_color="off")
+                col3.metric("Low Risk", whatif_counts["Low"], whatif_counts["Low"] - summary["low_count"], delta_color="off")
                 
-                fig = px.bar(
-                    indicator_counts,
-                    x="Count",
-                    y="Indicator",
-                    orientation="h",
-                    color_discrete_sequence=["#14274E"]
-                )
-                fig.update_layout(margin=dict(t=0, b=0, l=0, r=0))
-                st.plotly_chart(fig, use_container_width=True)
+                if whatif_thresholds != tuple(summary["thresholds"]) and st.button("Apply Thresholds"):
+                    if not update_user_thresholds(st.session_state.user["id"], *whatif_thresholds):
+                        st.error("The medium risk threshold must not be above the high risk threshold.")
+                    else:
+                        # Categories, indicators and counts are recomputed together so they agree
+                        df["risk_category"] = categorize(df["risk_score"].to_numpy(), whatif_thresholds)
+                        df["fraud_indicators"] = assign_fraud_indicators(df)
+                        counts = df["risk_category"].value_counts()
+                        summary.update(summarize_risk_counts(*(int(counts.get(level, 0)) for level in RISK_LEVELS)))
+                        summary["thresholds"] = whatif_thresholds
+                        
+                        # The saved scan follows, so History, trends, search and diff agree with this view
+                        if results.get("scan_id"):
+                            recategorize_scan(
+                                st.session_state.user["id"],
+                                results["scan_id"],
+                                whatif_thresholds,
+                                summary["high_count"],
+                                summary["medium_count"],
+                                summary["low_count"]
+                            )
+                        results["hash"] = save_analysis_frames(df, frames["duplicates"])
+                        st.success("Thresholds saved and applied to this scan. New scans will use them too.")
+                        st.experimental_rerun()
+            
+            if summary.get("ring_count"):
+                st.markdown("### Suspected Fraud Rings")
+                st.markdown(f"{summary['ring_count']} groups of transactions share cards or customers and were flagged as possible coordinated fraud.")
+                st.dataframe(pd.DataFrame(summary["fraud_rings"]))
+            
+            if summary.get("duplicate_count"):
+                st.info(f"{summary['duplicate_count']} duplicate transactions were already scanned and were not counted again.")
+                with st.expander("Duplicate Transactions"):
+                    if summary["duplicate_count"] > len(frames["duplicates"]):
+                        st.caption(f"Showing the first {len(frames['duplicates']):,}.")
+                    st.dataframe(frames["duplicates"])
             
+            # Charts
+            with timed("build_charts", len(df)):
+                col1, col2 = st.columns(2)
+                
+                content_hash = results["hash"]
+
+                with col1:
+                    st.markdown("### Risk Distribution")
+                    st.plotly_chart(
+                        build_risk_pie_spec(content_hash, summary["high_count"], summary["medium_count"], summary["low_count"]),
+                        use_container_width=True
+                    )
+
+                with col2:
+                    st.markdown("### Fraud Indicators")
+                    st.plotly_chart(build_indicator_bar_spec(content_hash, df), use_container_width=True)
+
+                col1, col2 = st.columns(2)
+
+                with col1:
+                    st.markdown("### Risk Score Distribution")
+                    st.plotly_chart(build_score_histogram_spec(content_hash, df), use_container_width=True)
+
+                with col2:
+                    trend_spec = build_score_trend_spec(content_hash, df)
+                    if trend_spec:
+                        st.markdown("### Risk Score Over Time")
+                        st.plotly_chart(trend_spec, use_container_width=True)
+
             # Detailed results table
             st.markdown("### Detailed Results")
             
@@ -892,8 +1484,9 @@ def render_dashboard_page():
                     return "background-color: rgba(0, 204, 150, 0.2); color: #00cc96; font-weight: bold"
                 return ""
             
-            styled_df = df.style.applymap(highlight_risk, subset=["risk_category"])
-            st.dataframe(styled_df)
+            with timed("render_results_table", len(df)):
+                styled_df = df.style.applymap(highlight_risk, subset=["risk_category"])
+                st.dataframe(styled_df)
             
             # Download link
             st.markdown(get_table_download_link(df), unsafe_allow_html=True)
@@ -949,36 +1542,49 @@ def render_dashboard_page():
                             "location": location
                         }
                         
-                        result = api_analyze_transaction(transaction_data)
-                        
-                        # Display result
-                        st.markdown("### Transaction Analysis Result")
-                        
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            st.markdown(f"**Transaction ID:** {result['transaction_id']}")
-                            st.markdown(f"**Risk Score:** {result['risk_score']:.2f}")
+                        try:
+                            get_quota_manager().acquire_live(st.session_state.user["id"], st.session_state.user["plan"])
+                        except QuotaExceeded as e:
+                            st.error(str(e))
+                        else:
+                            result, alert_queued = process_live_transaction(
+                                st.session_state.user["id"],
+                                transaction_data,
+                                get_user_thresholds(st.session_state.user["id"]),
+                                user_settings["webhook_url"]
+                            )
                             
-                            risk_color = "#00cc96"
-                            if result['risk_category'] == "Medium":
-                                risk_color = "#ffa500"
-                            elif result['risk_category'] == "High":
-                                risk_color = "#ff4b4b"
+                            # Display result
+                            st.markdown("### Transaction Analysis Result")
                             
-                            st.markdown(f"**Risk Category:** <span style='color:{risk_color};font-weight:bold;'>{result['risk_category']}</span>", unsafe_allow_html=True)
-                        
-                        with col2:
-                            st.markdown("**Fraud Indicators:**")
-                            if result['fraud_indicators']:
-                                for indicator in result['fraud_indicators']:
-                                    st.markdown(f"- {indicator}")
-                            else:
-                                st.markdown("No fraud indicators detected")
-                        
-                        # Send alert for high risk transactions
-                        if result['risk_category'] == "High" and user_settings["email_alerts"]:
-                            st.warning("High risk transaction detected! Alert email would be sent in a production environment.")
+                            col1, col2 = st.columns(2)
+                            
+                            with col1:
+                                st.markdown(f"**Transaction ID:** {result['transaction_id']}")
+                                st.markdown(f"**Risk Score:** {result['risk_score']:.2f}")
+                                
+                                risk_color = "#00cc96"
+                                if result['risk_category'] == "Medium":
+                                    risk_color = "#ffa500"
+                                elif result['risk_category'] == "High":
+                                    risk_color = "#ff4b4b"
+                                
+                                st.markdown(f"**Risk Category:** <span style='color:{risk_color};font-weight:bold;'>{result['risk_category']}</span>", unsafe_allow_html=True)
+                            
+                            with col2:
+                                st.markdown("**Fraud Indicators:**")
+                                if result['fraud_indicators']:
+                                    for indicator in result['fraud_indicators']:
+                                        st.markdown(f"- {indicator}")
+                                else:
+                                    st.markdown("No fraud indicators detected")
+                            
+                            # Send alert for high risk transactions
+                            if result['risk_category'] == "High":
+                                if alert_queued:
+                                    st.warning("High risk transaction detected! An alert has been queued for your webhook.")
+                                if user_settings["email_alerts"]:
+                                    st.warning("High risk transaction detected! Alert email would be sent in a production environment.")
     
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -1015,14 +1621,128 @@ def render_history_page():
             
             # Display the table
             st.dataframe(display_df)
-            
+
+            # Risk trends from the daily rollup table
+            st.markdown("### Risk Trends")
+            period = st.radio("Group by", ["Day", "Week", "Month"], horizontal=True, key="trend_period")
+            trends = get_user_risk_trends(st.session_state.user["id"], period.lower())
+
+            if trends:
+                trends_df = pd.DataFrame(trends).rename(columns={
+                    "high_risk": "High",
+                    "medium_risk": "Medium",
+                    "low_risk": "Low"
+                })
+                fig = px.bar(
+                    trends_df,
+                    x="period",
+                    y=["High", "Medium", "Low"],
+                    color_discrete_map=RISK_COLORS,
+                    labels={"period": period, "value": "Transactions", "variable": "Risk"}
+                )
+                fig.update_layout(margin=dict(t=0, b=0, l=0, r=0), barmode="stack")
+                st.plotly_chart(fig, use_container_width=True)
+
             # Allow downloading history as CSV
             if st.button("Download History"):
                 csv = display_df.to_csv(index=False)
                 b64 = base64.b64encode(csv.encode()).decode()
                 href = f'<a href="data:file/csv;base64,{b64}" download="finsec_history.csv">Download CSV</a>'
                 st.markdown(href, unsafe_allow_html=True)
-        
+
+            # Compare two saved scans transaction by transaction
+            if len(scans) >= 2:
+                st.markdown("### Compare Scans")
+                scan_labels = {scan["id"]: f'{scan["filename"]} ({pd.to_datetime(scan["date"]):%Y-%m-%d %H:%M})' for scan in scans}
+                scan_ids = list(scan_labels)
+                col1, col2 = st.columns(2)
+                with col1:
+                    old_scan_id = st.selectbox("Baseline scan", scan_ids, index=1, format_func=scan_labels.get, key="diff_old")
+                with col2:
+                    new_scan_id = st.selectbox("Compared scan", scan_ids, index=0, format_func=scan_labels.get, key="diff_new")
+
+                if st.button("Compare", key="diff_compare"):
+                    st.session_state.scan_diff = (old_scan_id, new_scan_id)
+
+                if st.session_state.get("scan_diff") == (old_scan_id, new_scan_id) and old_scan_id != new_scan_id:
+                    with st.spinner("Comparing scans..."):
+                        diff_result, diff_summary = compare_scans(st.session_state.user["id"], old_scan_id, new_scan_id)
+
+                    if not all(diff_summary["stored"]):
+                        st.info("Transaction details were not stored for one of these scans, so it cannot be compared.")
+                    else:
+                        col1, col2, col3, col4 = st.columns(4)
+                        col1.metric("Added", f'{diff_summary["added"]:,}')
+                        col2.metric("Removed", f'{diff_summary["removed"]:,}')
+                        col3.metric("Recategorized", f'{diff_summary["recategorized"]:,}')
+                        col4.metric("Newly High Risk", f'{diff_summary["new_high_risk"]:,}')
+
+                        statuses = st.multiselect("Show", DIFF_STATUSES, default=["added", "recategorized"], key="diff_statuses")
+                        with timed("render_diff_table"):
+                            ranked = ranked_changes(diff_result, statuses)
+                            st.caption(f"{len(ranked):,} transactions, largest score changes first" + (f" (showing the top {MAX_DIFF_ROWS:,})" if len(ranked) > MAX_DIFF_ROWS else ""))
+                            st.dataframe(ranked.head(MAX_DIFF_ROWS), hide_index=True)
+
+                        if st.button("Export Comparison", key="diff_export"):
+                            with timed("export_diff", len(ranked)):
+                                export = b"".join(iter_csv_chunks(ranked))
+                            st.download_button("Download CSV", export, file_name="finsec_scan_comparison.csv", mime="text/csv", key="diff_download")
+
+            # Search the transactions of every saved scan through the index
+            st.markdown("### Search Transactions")
+            col1, col2, col3 = st.columns([3, 1, 1])
+            with col1:
+                query = st.text_input("Search", placeholder="Merchant, location, category or transaction ID", key="search_query")
+            with col2:
+                field_labels = {None: "Any field", **{field: field.replace("_", " ").title() for field in SEARCH_FIELDS}}
+                field = st.selectbox("In", list(field_labels), format_func=field_labels.get, key="search_field")
+            with col3:
+                risk = st.selectbox("Risk", [None, "High", "Medium", "Low"], format_func=lambda level: level or "Any", key="search_risk")
+
+            if query:
+                # Keyset paging: one cursor per page visited, so Previous needs no recount
+                search_key = (query, field, risk)
+                if st.session_state.get("search_key") != search_key:
+                    st.session_state.search_key = search_key
+                    st.session_state.search_cursors = [None]
+                cursors = st.session_state.search_cursors
+
+                search_index = get_search_index()
+                matches = search_index.count(st.session_state.user["id"], query, field, risk)
+                rows, next_cursor = search_index.search(st.session_state.user["id"], query, field, risk, before_id=cursors[-1])
+
+                if not rows:
+                    st.info("No saved transactions match this search.")
+                else:
+                    matches_label = f"{MAX_COUNTED_MATCHES:,}+" if matches >= MAX_COUNTED_MATCHES else f"{matches:,}"
+                    first = (len(cursors) - 1) * SEARCH_PAGE_SIZE + 1
+                    st.caption(f"Showing {first:,}–{first + len(rows) - 1:,} of {matches_label} matching transactions")
+
+                    results_df = pd.DataFrame(rows).drop(columns=["id"])
+                    results_df["scan_date"] = pd.to_datetime(results_df["scan_date"]).dt.strftime("%Y-%m-%d %H:%M")
+                    st.dataframe(results_df.rename(columns={
+                        "scan_id": "Scan ID",
+                        "filename": "Filename",
+                        "scan_date": "Scan Date",
+                        "transaction_id": "Transaction ID",
+                        "date": "Date",
+                        "amount": "Amount",
+                        "merchant": "Merchant",
+                        "location": "Location",
+                        "category": "Category",
+                        "risk_score": "Risk Score",
+                        "risk_category": "Risk"
+                    }), hide_index=True)
+
+                    # Callbacks run once per click, before the rerun reads the cursors
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        if len(cursors) > 1:
+                            st.button("← Previous", key="search_previous", on_click=cursors.pop)
+                    with col2:
+                        if next_cursor is not None:
+                            st.button("Next →", key="search_next", on_click=cursors.append, args=(next_cursor,))
+
         st.markdown('</div>', unsafe_allow_html=True)
 
 # Page: Settings
@@ -1036,13 +1756,23 @@ def render_settings_page():
         user_settings = get_user_settings(st.session_state.user["id"])
         
         # Create tabs for different settings categories
-        tabs = st.tabs(["General", "API & Integration", "Account"])
+        is_admin = st.session_state.user["role"] == "admin"
+        tabs = st.tabs(["General", "API & Integration", "Account"] + (["Performance"] if is_admin else []))
         
         with tabs[0]:
             st.markdown("### General Settings")
             
             email_alerts = st.toggle("Email Alerts for High Risk Transactions", value=user_settings["email_alerts"])
             
+            st.markdown("### Risk Thresholds")
+            risk_thresholds = st.slider(
+                "Medium and high risk thresholds",
+                min_value=0.0,
+                max_value=1.0,
+                value=tuple(get_user_thresholds(st.session_state.user["id"])),
+                step=0.01
+            )
+            
             st.markdown("### Theme Settings")
             theme = st.selectbox("Theme", ["Light", "Dark"], index=0)
             
@@ -1054,6 +1784,7 @@ def render_settings_page():
                     user_settings["live_access"],
                     user_settings["webhook_url"]
                 )
+                update_user_thresholds(st.session_state.user["id"], *risk_thresholds)
                 st.success("Settings saved successfully!")
         
         with tabs[1]:
@@ -1186,6 +1917,13 @@ def render_settings_page():
             st.markdown("#### Upgrade Plan")
             st.markdown("Current Plan: **" + st.session_state.user["plan"].capitalize() + "**")
             
+            usage = get_quota_manager().usage(st.session_state.user["id"], st.session_state.user["plan"])
+            st.markdown(
+                f"Scans this hour: **{usage['scans_last_hour']} of {usage['scans_per_hour']}** · "
+                f"Up to **{usage['max_scan_rows']:,}** transactions per scan · "
+                f"**{usage['live_per_second']}** live transactions per second"
+            )
+            
             if st.session_state.user["plan"] == "free":
                 st.markdown("""
                 **Premium Plan Benefits:**
@@ -1198,6 +1936,88 @@ def render_settings_page():
                 if st.button("Upgrade to Premium"):
                     st.info("This is a demo. In a real application, this would redirect to a payment page.")
         
+        if is_admin:
+            with tabs[3]:
+                st.markdown("### Pipeline Timings")
+                st.markdown("Latency, rows and memory change per pipeline stage and user plan since this process started.")
+                
+                timings = registry.summary()
+                if timings:
+                    st.dataframe(pd.DataFrame(timings).round(3), use_container_width=True)
+                else:
+                    st.info("No timings recorded yet.")
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.download_button("Download Prometheus Metrics", registry.render_prometheus(), file_name="finsec_metrics.txt")
+                with col2:
+                    if st.button("Reset Timings"):
+                        registry.reset()
+                        st.experimental_rerun()
+                
+                metrics_server = start_metrics_server()
+                if metrics_server:
+                    st.markdown(f"Prometheus endpoint: `{metrics_server.url}`")
+                
+                st.markdown("### Rerun Profiling")
+                st.markdown("Runs page reruns of every session on this server under cProfile and keeps their hottest functions.")
+                
+                profiler = get_profiler()
+                col1, col2 = st.columns(2)
+                with col1:
+                    profiling_enabled = st.toggle("Profile reruns", value=profiler.enabled)
+                with col2:
+                    sample_every = st.number_input("Profile one in every N reruns", min_value=1, value=profiler.sample_every)
+                profiler.configure(profiling_enabled, sample_every)
+                
+                runs = profiler.recent_runs()
+                if runs:
+                    st.markdown("#### Hottest Functions by Page")
+                    st.dataframe(pd.DataFrame(profiler.page_hotspots()).round(3), use_container_width=True)
+                    
+                    st.markdown("#### Recent Profiled Reruns")
+                    runs_df = pd.DataFrame(runs)
+                    st.dataframe(runs_df.drop(columns=["id"]).round(3), use_container_width=True)
+                    
+                    run_labels = {run["id"]: f"{run['started_at']} · {run['page']} · {run['duration_ms']:.0f} ms" for run in runs}
+                    run_id = st.selectbox("Inspect rerun", list(run_labels), format_func=run_labels.get)
+                    st.dataframe(pd.DataFrame(profiler.hot_functions(run_id)).round(3), use_container_width=True)
+                    
+                    artifact = profiler.artifact(run_id)
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        if artifact:
+                            st.download_button("Download Profile (.prof)", artifact, file_name=f"finsec_rerun_{run_id[:8]}.prof")
+                    with col2:
+                        if st.button("Clear Profiles"):
+                            profiler.clear()
+                            st.experimental_rerun()
+                else:
+                    st.info("No profiled reruns yet.")
+                
+                st.markdown("### Data Retention")
+                st.markdown("Transaction details and scans past their plan's retention are archived to Parquet files, and the duplicate-detection fingerprints of expired scans are deleted; daily risk rollups are kept.")
+                st.dataframe(pd.DataFrame(PLAN_RETENTION).T.rename_axis("plan"), use_container_width=True)
+                
+                compactor = get_compactor()
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button("Preview Compaction"):
+                        st.json(compactor.run(dry_run=True))
+                with col2:
+                    if st.button("Run Compaction Now"):
+                        with st.spinner("Archiving and compacting..."):
+                            report = compactor.run()
+                        if report is None:
+                            st.warning("Another process is compacting right now.")
+                        else:
+                            st.success(f"Archived {report['archived_transactions']:,} transactions and {report['archived_scans']:,} scans, dropped {report['expired_fingerprints']:,} fingerprints; reclaimed {report['reclaimed_bytes'] / 2 ** 20:.1f} MB.")
+                
+                compaction_runs = compactor.recent_runs()
+                if compaction_runs:
+                    st.markdown("#### Recent Compactions")
+                    st.dataframe(pd.DataFrame(compaction_runs).drop(columns=["dry_run", "archive_files"]), use_container_width=True)
+        
         st.markdown('</div>', unsafe_allow_html=True)
 
 # Page: Privacy Policy
@@ -1207,16 +2027,21 @@ def render_privacy_page():
     with st.container():
         st.markdown('<div class="card">', unsafe_allow_html=True)
         
-        # Read privacy policy from file
-        with open("privacy_policy.md", "r") as f:
-            privacy_policy = f.read()
-        
-        st.markdown(privacy_policy)
+        # Privacy policy text is read once per process
+        st.markdown(get_page_text("privacy_policy.md"))
         
         st.markdown('</div>', unsafe_allow_html=True)
 
 # Main application
 def main():
+    # Pick up state stored by another replica for this session
+    restore_shared_session()
+    
+    # Label this rerun's metrics with the user's plan
+    set_plan(st.session_state.user["plan"] if st.session_state.user else None)
+    start_metrics_server()
+    start_compaction_scheduler()
+    
     # Initialize page if not set
     if 'page' not in st.session_state:
         st.session_state.page = "login" if not st.session_state.user else "dashboard"
@@ -1266,4 +2091,13 @@ def main():
     """, unsafe_allow_html=True)
 
 if __name__ == "__main__":
-    main()
+    try:
+        # Profiled only when switched on from the admin Performance tab
+        get_profiler().run(
+            main,
+            st.session_state.get("page"),
+            st.session_state.user["id"] if st.session_state.user else None
+        )
+    finally:
+        st.session_state.last_payload = payload_meter.uninstall()
+        persist_shared_session()
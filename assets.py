@@ -0,0 +1,85 @@
+import io
+import os
+import re
+
+from PIL import Image
+
+# Static assets
+# Everything the pages send on each rerun is prepared once per process: the
+# shipped stylesheet is minified, the logo is resized to the width it is shown
+# at (2x for high-DPI screens) and re-encoded as WebP, and page text is read
+# once. PayloadMeter measures what a rerun actually sends to the browser.
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STYLESHEET_PATH = os.path.join(STATIC_DIR, "style.css")
+LOGO_PATH = os.path.join(STATIC_DIR, "finsec_logo.png")
+LOGO_SCALE = 2
+LOGO_QUALITY = 85
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    # Spaces before ":" are kept; they matter in selectors like "a :hover"
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+def load_stylesheet(path=STYLESHEET_PATH):
+    with open(path, "r") as f:
+        return minify_css(f.read())
+
+def read_text(path):
+    with open(path, "r") as f:
+        return f.read()
+
+def logo_variant(width, path=LOGO_PATH, scale=LOGO_SCALE, quality=LOGO_QUALITY):
+    # Returns WebP bytes sized for display at width CSS pixels
+    with Image.open(path) as image:
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        target = min(width * scale, image.width)
+        resized = image.resize((target, round(image.height * target / image.width)), Image.LANCZOS)
+    buffer = io.BytesIO()
+    resized.save(buffer, "WEBP", quality=quality, method=6)
+    return buffer.getvalue()
+
+class PayloadMeter:
+    # Counts the serialized size of every message one script run enqueues for
+    # the browser, by wrapping the run context's enqueue function. Media files
+    # are fetched separately over HTTP, so their bytes are added explicitly.
+    def __init__(self):
+        self.messages = 0
+        self.message_bytes = 0
+        self.media_bytes = 0
+        self._ctx = None
+        self._enqueue = None
+
+    def install(self, ctx):
+        if ctx is None or self._ctx is not None:
+            return self
+        self._ctx = ctx
+        self._enqueue = ctx._enqueue
+
+        def counting_enqueue(msg):
+            self.messages += 1
+            self.message_bytes += msg.ByteSize()
+            self._enqueue(msg)
+
+        ctx._enqueue = counting_enqueue
+        return self
+
+    def uninstall(self):
+        if self._ctx is not None:
+            self._ctx._enqueue = self._enqueue
+            self._ctx = None
+        return self.totals()
+
+    def add_media(self, nbytes):
+        self.media_bytes += nbytes
+
+    def totals(self):
+        return {
+            "messages": self.messages,
+            "message_bytes": self.message_bytes,
+            "media_bytes": self.media_bytes,
+            "total_bytes": self.message_bytes + self.media_bytes
+        }
@@ -0,0 +1,161 @@
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import openai
+
+# AI assistant
+# Answers stream token by token from a pluggable backend. Complete answers are
+# cached on the normalized question plus a hash of everything sent before it
+# (system prompt, recent turns and any scan context), so repeated FAQ-style
+# questions are served from memory without a remote call, while a follow-up is
+# only answered from cache for the identical conversation.
+
+SYSTEM_PROMPT = "You are a helpful assistant for FinSec, a financial fraud detection platform. Provide concise, helpful responses about using the platform, fraud detection, and financial security."
+DEFAULT_MODEL = "gpt-3.5-turbo"
+MAX_TOKENS = 150
+REQUEST_TIMEOUT = 10.0
+RESPONSE_DEADLINE = 30.0
+HISTORY_MESSAGES = 6
+CACHE_SIZE = 256
+CACHE_TTL = 3600
+
+def normalize_query(query):
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+class TTLCache:
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+# Backends
+# A backend turns a list of chat messages into an iterator of text chunks.
+class OpenAIBackend:
+    def __init__(self, api_key, model=DEFAULT_MODEL, max_tokens=MAX_TOKENS, timeout=REQUEST_TIMEOUT):
+        self.client = openai.OpenAI(api_key=api_key, timeout=timeout, max_retries=1)
+        self.model = model
+        self.max_tokens = max_tokens
+        self.calls = 0
+
+    def stream(self, messages):
+        self.calls += 1
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            stream=True
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+class StubBackend:
+    # Deterministic local backend for tests and offline development
+    ANSWERS = {
+        "upload": "Go to the Dashboard, open Upload Transactions, choose a CSV file and click Analyze Transactions.",
+        "risk": "Each transaction gets a risk score between 0 and 1 and is categorized as Low, Medium or High risk.",
+        "live": "Live monitoring is available on the Premium plan once Live Access is enabled in Settings.",
+        "webhook": "Add a webhook URL under Settings > API & Integration to receive High-risk alerts.",
+        "history": "The History page lists your previous scans and shows daily, weekly and monthly risk trends."
+    }
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def stream(self, messages):
+        self.calls += 1
+        question = normalize_query(messages[-1]["content"])
+        answer = next(
+            (text for keyword, text in self.ANSWERS.items() if keyword in question),
+            f"FinSec stub answer to: {question}"
+        )
+        for word in answer.split(" "):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word + " "
+
+def create_backend(name, api_key=""):
+    if name == "stub":
+        return StubBackend()
+    if name == "openai" and api_key:
+        return OpenAIBackend(api_key)
+    return None
+
+class Assistant:
+    def __init__(self, backend, cache=None, history_messages=HISTORY_MESSAGES, deadline=RESPONSE_DEADLINE):
+        self.backend = backend
+        self.cache = cache if cache is not None else TTLCache()
+        self.history_messages = history_messages
+        self.deadline = deadline
+
+    def build_messages(self, query, history=()):
+        # Recent turns give the model context for follow-up questions
+        recent = list(history)[-self.history_messages:] if self.history_messages else []
+        return [{"role": "system", "content": SYSTEM_PROMPT}] + [
+            {"role": message["role"], "content": message["content"]} for message in recent
+        ] + [{"role": "user", "content": query}]
+
+    def cache_key(self, messages):
+        # The answer depends on the whole prompt, not just the last question
+        context = json.dumps(messages[:-1], sort_keys=True).encode()
+        return normalize_query(messages[-1]["content"]), hashlib.sha256(context).hexdigest()
+
+    def stream_response(self, query, history=()):
+        messages = self.build_messages(query, history)
+        key = self.cache_key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        started = time.monotonic()
+        chunks = []
+        try:
+            for chunk in self.backend.stream(messages):
+                chunks.append(chunk)
+                yield chunk
+                if time.monotonic() - started > self.deadline:
+                    yield " ... (response timed out)"
+                    return
+        except Exception as e:
+            yield f"Error: {str(e)}"
+            return
+
+        # Only complete answers are cached
+        answer = "".join(chunks).strip()
+        if answer:
+            self.cache.put(key, answer)
+
+    def get_response(self, query, history=()):
+        return "".join(self.stream_response(query, history)).strip()
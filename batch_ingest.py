@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from uploads import UPLOAD_TYPES, SPOOL_BLOCK_SIZE, COMPRESSION_EXTENSIONS
+
+# Watched-folder batch ingestion
+# Export files dropped into a directory are scanned headlessly: each file goes
+# through the same duplicate check, quota check, analyze_transactions() and
+# save_scan_results() as a dashboard upload, in a pool of worker processes.
+# Files in <dir>/<email>/ belong to that user; files at the top level belong
+# to the --user account. Every file is claimed in ingested_files under its
+# owner and SHA-256 before it is processed, so renamed or re-dropped copies
+# are skipped and several watchers can share one directory.
+
+INGEST_DIR = os.getenv("FINSEC_INGEST_DIR", "ingest")
+INGEST_WORKERS = int(os.getenv("FINSEC_INGEST_WORKERS", str(max((os.cpu_count() or 2) - 1, 1))))
+POLL_INTERVAL = 30
+SETTLE_SECONDS = 10
+# A claim older than this is taken to belong to a crashed worker
+CLAIM_TIMEOUT = 3600
+INGEST_EXTENSIONS = tuple("." + extension for extension in UPLOAD_TYPES)
+
+def init_ingest_tables(tx):
+    tx.execute('''
+    CREATE TABLE IF NOT EXISTS ingested_files (
+        user_id TEXT,
+        content_hash TEXT,
+        path TEXT,
+        status TEXT,
+        scan_id TEXT,
+        transactions INTEGER,
+        duplicates INTEGER,
+        error TEXT,
+        claimed_at REAL,
+        finished_at REAL,
+        PRIMARY KEY (user_id, content_hash)
+    )
+    ''')
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(SPOOL_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+def is_ingestible(name):
+    # Skips hidden and partial files, e.g. ".export.csv" or "export.csv.part"
+    if name.startswith(".") or name.startswith("~"):
+        return False
+    name = name.lower()
+    stem, extension = os.path.splitext(name)
+    if extension in COMPRESSION_EXTENSIONS:
+        extension = os.path.splitext(stem)[1] or ".csv"
+    return extension in INGEST_EXTENSIONS
+
+def discover_files(directory, default_owner=None, settle=SETTLE_SECONDS, now=None):
+    # (path, owner email) for every settled file, oldest first; files still
+    # being written (modified within settle seconds) wait for the next pass
+    now = now or time.time()
+    found = []
+    for entry in os.scandir(directory):
+        if entry.is_dir() and not entry.name.startswith("."):
+            found += [(path, mtime, entry.name) for path, mtime in _scan_files(entry.path)]
+        elif entry.is_file() and default_owner and is_ingestible(entry.name):
+            found.append((entry.path, entry.stat().st_mtime, default_owner))
+    return [(path, owner) for path, mtime, owner in sorted(found, key=lambda item: item[1]) if now - mtime >= settle]
+
+def _scan_files(directory):
+    for entry in os.scandir(directory):
+        if entry.is_file() and is_ingestible(entry.name):
+            yield entry.path, entry.stat().st_mtime
+
+class IngestLedger:
+    # Claims and outcomes of ingested files, kept in the main database
+    def __init__(self, database):
+        self.database = database
+
+    def claim(self, user_id, content_hash, path, retry_failed=False, now=None):
+        # True when this caller now owns the file; done files, and files
+        # claimed by a live worker, are never taken
+        now = now or time.time()
+        retake = "(ingested_files.status = 'processing' AND ingested_files.claimed_at < ?)"
+        params = (user_id, content_hash, path, now, now - CLAIM_TIMEOUT)
+        if retry_failed:
+            retake = f"({retake} OR ingested_files.status = 'failed')"
+        taken = self.database.execute(
+            "INSERT INTO ingested_files (user_id, content_hash, path, status, claimed_at) VALUES (?, ?, ?, 'processing', ?) "
+            "ON CONFLICT (user_id, content_hash) DO UPDATE SET path = excluded.path, status = excluded.status, "
+            "claimed_at = excluded.claimed_at, error = NULL "
+            f"WHERE {retake}",
+            params
+        )
+        return taken == 1
+
+    def release(self, user_id, content_hash):
+        # Gives a claim back so the next pass tries the file again
+        self.database.execute(
+            "DELETE FROM ingested_files WHERE user_id = ? AND content_hash = ? AND status = 'processing'",
+            (user_id, content_hash)
+        )
+
+    def finish(self, user_id, content_hash, scan_id, transactions, duplicates):
+        self.database.execute(
+            "UPDATE ingested_files SET status = 'done', scan_id = ?, transactions = ?, duplicates = ?, finished_at = ? "
+            "WHERE user_id = ? AND content_hash = ?",
+            (scan_id, transactions, duplicates, time.time(), user_id, content_hash)
+        )
+
+    def fail(self, user_id, content_hash, error):
+        self.database.execute(
+            "UPDATE ingested_files SET status = 'failed', error = ?, finished_at = ? WHERE user_id = ? AND content_hash = ?",
+            (error, time.time(), user_id, content_hash)
+        )
+
+    def recent(self, limit=50):
+        return self.database.fetch_all(
+            "SELECT user_id, content_hash, path, status, scan_id, transactions, duplicates, error, claimed_at, finished_at "
+            "FROM ingested_files ORDER BY claimed_at DESC LIMIT ?",
+            (limit,)
+        )
+
+def ingest_file(path, email, retry_failed=False):
+    # Runs in a worker process; returns a result dict, never raises
+    import app
+    from storage import get_database
+    from quotas import QuotaExceeded
+
+    result = {"path": path, "user": email, "status": "skipped", "scan_id": None, "transactions": 0, "duplicates": 0, "error": None}
+    start = time.perf_counter()
+    database = get_database()
+    user = database.fetch_one("SELECT id, plan FROM users WHERE email = ?", (email,))
+    if user is None:
+        result.update(status="unknown_user", error=f"No account for {email}")
+        return result
+
+    ledger = IngestLedger(database)
+    try:
+        content_hash = file_hash(path)
+    except OSError as e:
+        result.update(status="failed", error=str(e))
+        return result
+    result["hash"] = content_hash
+    if not ledger.claim(user["id"], content_hash, path, retry_failed):
+        return result
+
+    duplicate_index = app.get_duplicate_index()
+    claim_id = None
+    try:
+        # Skip transactions already scanned in earlier uploads, chunk by chunk
+        claim_id, df, _, result["duplicates"] = app.read_new_transactions(path, user["id"], user["plan"])
+
+        if df.empty:
+            ledger.finish(user["id"], content_hash, None, 0, result["duplicates"])
+            result["status"] = "done"
+        else:
+            app.get_quota_manager().check_scan(user["id"], user["plan"], len(df))
+            results_df, summary = app.analyze_transactions(df, None, app.get_user_thresholds(user["id"]))
+            scan_id = app.save_scan_results(
+                user["id"],
+                os.path.basename(path),
+                summary["total"],
+                summary["high_count"],
+                summary["medium_count"],
+                summary["low_count"],
+                results_df,
+                summary["encoded"]
+            )
+            duplicate_index.record(claim_id, scan_id)
+            ledger.finish(user["id"], content_hash, scan_id, summary["total"], result["duplicates"])
+            result.update(status="done", scan_id=scan_id, transactions=summary["total"], high_risk=summary["high_count"])
+    except QuotaExceeded as e:
+        # Over quota is not a bad file; it is retried once the budget refills
+        if claim_id is not None:
+            duplicate_index.release(claim_id)
+        ledger.release(user["id"], content_hash)
+        result.update(status="deferred", error=str(e))
+    except Exception as e:
+        if claim_id is not None:
+            duplicate_index.release(claim_id)
+        ledger.fail(user["id"], content_hash, f"{type(e).__name__}: {e}")
+        result.update(status="failed", error=str(e))
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+class BatchIngester:
+    def __init__(self, directory=INGEST_DIR, default_owner=None, workers=INGEST_WORKERS, settle=SETTLE_SECONDS, retry_failed=False):
+        self.directory = directory
+        self.default_owner = default_owner
+        self.workers = workers
+        self.settle = settle
+        self.retry_failed = retry_failed
+        # (path, size, mtime) already handed out by this process, so unchanged
+        # files are not re-hashed on every pass
+        self._submitted = set()
+
+    def _pending(self):
+        pending = []
+        for path, owner in discover_files(self.directory, self.default_owner, self.settle):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            key = (path, stat.st_size, stat.st_mtime)
+            if key not in self._submitted:
+                pending.append((key, path, owner))
+        return pending
+
+    def run(self, once=False, interval=POLL_INTERVAL, on_result=None):
+        # Spawned workers start clean instead of inheriting pooled connections
+        context = multiprocessing.get_context("spawn")
+        totals = {}
+        running = {}
+        next_scan = 0
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            while True:
+                # One directory scan per interval; with once, only the first
+                if time.time() >= next_scan:
+                    for key, path, owner in self._pending():
+                        self._submitted.add(key)
+                        running[executor.submit(ingest_file, path, owner, self.retry_failed)] = key
+                    next_scan = float("inf") if once else time.time() + interval
+                if not running:
+                    if once:
+                        return totals
+                    time.sleep(max(next_scan - time.time(), 0))
+                    continue
+
+                timeout = None if once else max(next_scan - time.time(), 0)
+                finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # The worker died mid-file; its claim times out
+                        result = {"path": key[0], "status": "failed", "error": str(e)}
+                    if result["status"] == "deferred" or result.get("hash") is None:
+                        # Nothing recorded as done or failed; try again on a later pass
+                        self._submitted.discard(key)
+                    totals[result["status"]] = totals.get(result["status"], 0) + 1
+                    if on_result:
+                        on_result(result)
+
+def print_result(result):
+    line = f"{result['status']:>12}  {result['path']}"
+    if result.get("scan_id"):
+        line += f"  scan {result['scan_id']}  {result['transactions']} transactions, {result.get('high_risk', 0)} high risk"
+    if result.get("duplicates"):
+        line += f"  ({result['duplicates']} duplicates skipped)"
+    if result.get("error"):
+        line += f"  {result['error']}"
+    print(line, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan transaction files dropped into a directory, without the UI.")
+    parser.add_argument("directory", nargs="?", default=INGEST_DIR, help="Directory to watch; subdirectories are named after the owning user's email")
+    parser.add_argument("--user", help="Email of the account that owns files at the top level of the directory")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--once", action="store_true", help="Process what is there now and exit instead of watching")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="Seconds between directory scans when watching")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS, help="Ignore files modified within this many seconds")
+    parser.add_argument("--retry-failed", action="store_true", help="Process files that failed in an earlier run again")
+    parser.add_argument("--json", help="Also write the run totals to this file")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+
+    ingester = BatchIngester(args.directory, args.user, args.workers, args.settle, args.retry_failed)
+    try:
+        totals = ingester.run(once=args.once, interval=args.interval, on_result=print_result)
+    except KeyboardInterrupt:
+        return 130
+    print("Totals: " + (", ".join(f"{status} {count}" for status, count in sorted(totals.items())) or "no new files"))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(totals, f, indent=2)
+    return 1 if totals.get("failed") else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
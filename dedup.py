@@ -0,0 +1,171 @@
+import math
+import time
+import uuid
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Duplicate transaction index
+# Every transaction a user has scanned is remembered as a 64-bit fingerprint in
+# the seen_transactions table of the main database, which is the only
+# authority: an upload claims its fingerprints with one INSERT ... ON CONFLICT
+# DO NOTHING, and whatever it could not insert was already seen, by this or
+# any other process or replica. A per-user Bloom filter is only a hint in
+# front of the claim: fingerprints it may have seen are confirmed first and
+# never re-inserted, so replayed exports cost reads instead of failed inserts.
+# The filter is topped up after every claim; a stale filter only costs speed.
+
+BLOOM_ERROR_RATE = 0.001
+BLOOM_INITIAL_CAPACITY = 100000
+LOOKUP_CHUNK = 500
+# Claims not tied to a saved scan after this long belong to a crashed upload
+CLAIM_TIMEOUT = 3600
+
+def fingerprints(df):
+    # Transaction IDs identify replays; rows without an ID column hash every field
+    if "transaction_id" in df.columns:
+        values = df["transaction_id"].astype(str).to_numpy(dtype=object)
+        return pd.util.hash_array(values, categorize=False)
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.n_bits = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 64)
+        self.n_hashes = max(int(round(self.n_bits / self.capacity * math.log(2))), 1)
+        self.bits = np.zeros((self.n_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, keys):
+        # Double hashing: position_i = h1 + i * h2 (mod m), for all keys at once.
+        # Keys are remixed first (splitmix64 finalizer) so low-entropy keys still
+        # spread over both halves.
+        keys = np.asarray(keys, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            keys = (keys ^ (keys >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            keys = (keys ^ (keys >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            keys = keys ^ (keys >> np.uint64(31))
+        h1 = keys & np.uint64(0xFFFFFFFF)
+        h2 = (keys >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.n_hashes, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.n_bits)
+
+    def add(self, keys):
+        positions = self._positions(keys).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+        self.count += len(keys)
+
+    def contains(self, keys):
+        if not len(keys):
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        bytes_ = self.bits[positions >> np.uint64(3)]
+        masks = np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)
+        return ((bytes_ & masks) != 0).all(axis=1)
+
+def init_duplicate_tables(tx):
+    tx.execute('''
+    CREATE TABLE IF NOT EXISTS seen_transactions (
+        user_id TEXT,
+        fingerprint BIGINT,
+        scan_id TEXT,
+        claim_id TEXT,
+        claimed_at REAL,
+        PRIMARY KEY (user_id, fingerprint)
+    )
+    ''')
+    tx.execute("CREATE INDEX IF NOT EXISTS idx_seen_transactions_claim ON seen_transactions (claim_id)")
+    tx.execute("CREATE INDEX IF NOT EXISTS idx_seen_transactions_pending ON seen_transactions (user_id, scan_id)")
+
+class DuplicateIndex:
+    def __init__(self, database, error_rate=BLOOM_ERROR_RATE):
+        self.database = database
+        self.error_rate = error_rate
+        self._filters = {}
+        self._lock = threading.Lock()
+
+    def _load_filter(self, user_id, minimum_capacity=0):
+        # Rebuilt from the database on first use and whenever it outgrows its capacity
+        count = self.database.fetch_one("SELECT COUNT(*) AS seen FROM seen_transactions WHERE user_id = ?", (user_id,))["seen"]
+        capacity = max(BLOOM_INITIAL_CAPACITY, 2 * max(count, minimum_capacity))
+        bloom = BloomFilter(capacity, self.error_rate)
+        for _, rows in self.database.stream("SELECT fingerprint FROM seen_transactions WHERE user_id = ?", (user_id,), 100000):
+            bloom.add(np.array([row[0] for row in rows], dtype=np.int64).view(np.uint64))
+        self._filters[user_id] = bloom
+        return bloom
+
+    def _filter(self, user_id):
+        bloom = self._filters.get(user_id)
+        if bloom is None:
+            bloom = self._load_filter(user_id)
+        return bloom
+
+    def _top_up(self, user_id, keys):
+        with self._lock:
+            bloom = self._filter(user_id)
+            if bloom.count + len(keys) > bloom.capacity:
+                self._load_filter(user_id, bloom.count + len(keys))
+            else:
+                bloom.add(keys)
+
+    def _confirmed(self, user_id, signed):
+        # The subset of fingerprints already in seen_transactions
+        confirmed = set()
+        values = signed.tolist()
+        for start in range(0, len(values), LOOKUP_CHUNK):
+            chunk = values[start:start + LOOKUP_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            confirmed.update(row["fingerprint"] for row in self.database.fetch_all(
+                f"SELECT fingerprint FROM seen_transactions WHERE user_id = ? AND fingerprint IN ({placeholders})",
+                (user_id,) + tuple(chunk)
+            ))
+        return np.fromiter(confirmed, dtype=np.int64, count=len(confirmed))
+
+    def claim(self, user_id, df, now=None, claim_id=None):
+        # Returns (claim_id, mask): mask marks rows seen in an earlier upload,
+        # by any process, or earlier in this same upload. The other rows are
+        # now claimed; pass claim_id to record() once their scan is saved, or
+        # to release() if it is not. Chunks of one upload share a claim_id.
+        now = now or time.time()
+        keys = fingerprints(df)
+        repeated = pd.Series(keys).duplicated().to_numpy()
+        unique = np.unique(keys)
+        signed = unique.view(np.int64)
+
+        with self._lock:
+            maybe_seen = self._filter(user_id).contains(unique)
+        seen = self._confirmed(user_id, signed[maybe_seen])
+        candidates = signed[~np.isin(signed, seen)].tolist()
+
+        claim_id = claim_id or uuid.uuid4().hex
+        claimed = np.zeros(0, dtype=np.int64)
+        with self.database.transaction() as tx:
+            # Claims of crashed uploads go back to the pool
+            tx.execute(
+                "DELETE FROM seen_transactions WHERE user_id = ? AND scan_id IS NULL AND claimed_at < ?",
+                (user_id, now - CLAIM_TIMEOUT)
+            )
+            inserted = tx.executemany(
+                "INSERT INTO seen_transactions (user_id, fingerprint, claim_id, claimed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id, fingerprint) DO NOTHING",
+                ((user_id, fingerprint, claim_id, now) for fingerprint in candidates)
+            )
+            if inserted == len(candidates):
+                claimed = np.asarray(candidates, dtype=np.int64)
+            elif candidates:
+                # Another upload got some of them first; read back what is ours
+                tx.cursor.execute(self.database.translate("SELECT fingerprint FROM seen_transactions WHERE claim_id = ?"), (claim_id,))
+                claimed = np.fromiter((row[0] for row in tx.cursor), dtype=np.int64)
+
+        self._top_up(user_id, unique)
+        is_duplicate = repeated | ~np.isin(keys.view(np.int64), claimed)
+        return claim_id, is_duplicate
+
+    def record(self, claim_id, scan_id):
+        self.database.execute("UPDATE seen_transactions SET scan_id = ? WHERE claim_id = ?", (scan_id, claim_id))
+
+    def release(self, claim_id):
+        # Gives back claims whose scan was never saved; recorded ones stay
+        self.database.execute("DELETE FROM seen_transactions WHERE claim_id = ? AND scan_id IS NULL", (claim_id,))
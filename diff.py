@@ -0,0 +1,120 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+# Scan comparison
+# Two saved scans are joined on transaction_id with a vectorized hash join:
+# IDs are hashed to 64 bits once (as in dedup.py), the older scan's hashes
+# build a pandas hash index, and the newer scan probes it in one get_indexer
+# call. Matches are confirmed on the IDs themselves, so a hash collision can
+# never pair two different transactions. Every transaction ends up added,
+# removed, recategorized or unchanged, with its score change.
+
+DIFF_COLUMNS = ("transaction_id", "merchant", "amount", "risk_score", "risk_category")
+DIFF_CHUNK_SIZE = 100000
+DIFF_STATUSES = ["added", "removed", "recategorized", "unchanged"]
+RISK_LEVELS = ["Low", "Medium", "High"]
+
+def load_scan_transactions(database, user_id, scan_id, chunk_size=DIFF_CHUNK_SIZE):
+    # Read in chunks so multi-million-row scans never exist as dicts
+    frames = [
+        pd.DataFrame.from_records(rows, columns=columns)
+        for columns, rows in database.stream(
+            f"SELECT {', '.join(DIFF_COLUMNS)} FROM scan_transactions WHERE scan_id = ? AND user_id = ? ORDER BY id",
+            (scan_id, user_id),
+            chunk_size
+        )
+    ]
+    if not frames:
+        return pd.DataFrame({column: pd.Series(dtype=object) for column in DIFF_COLUMNS})
+    df = pd.concat(frames, ignore_index=True)
+    df["risk_category"] = pd.Categorical(df["risk_category"], categories=RISK_LEVELS)
+    return df
+
+def _join_keys(df):
+    ids = df["transaction_id"].to_numpy(dtype=object)
+    keys = pd.util.hash_array(df["transaction_id"].astype(str).to_numpy(dtype=object), categorize=False)
+    # Rows without an ID cannot be matched; they count as added or removed
+    has_id = pd.notna(ids)
+    # Repeated IDs within one scan: the last occurrence wins
+    keep = has_id & ~pd.Index(keys).duplicated(keep="last")
+    return ids, keys, has_id, keep
+
+def diff_scans(old, new):
+    old_ids, old_keys, old_has_id, old_keep = _join_keys(old)
+    new_ids, new_keys, new_has_id, _ = _join_keys(new)
+
+    # Build on the old scan, probe with the new one
+    position = pd.Index(old_keys[old_keep]).get_indexer(new_keys)
+    old_rows = np.flatnonzero(old_keep)
+    matched = (position >= 0) & new_has_id
+    candidates = old_rows[position[matched]]
+    confirmed = old_ids[candidates] == new_ids[matched]
+    new_matched = np.flatnonzero(matched)[confirmed]
+    old_matched = candidates[confirmed]
+
+    new_only = np.ones(len(new), dtype=bool)
+    new_only[new_matched] = False
+    old_only = np.ones(len(old), dtype=bool)
+    old_only[old_matched] = False
+
+    old_score = old["risk_score"].to_numpy(dtype=float)
+    new_score = new["risk_score"].to_numpy(dtype=float)
+    old_category = pd.Categorical(old["risk_category"], categories=RISK_LEVELS)
+    new_category = pd.Categorical(new["risk_category"], categories=RISK_LEVELS)
+    changed = old_category.codes[old_matched] != new_category.codes[new_matched]
+
+    def part(rows, source, status, old_index=None, new_index=None):
+        count = len(rows)
+        return pd.DataFrame({
+            "transaction_id": source["transaction_id"].to_numpy(dtype=object)[rows],
+            "merchant": source["merchant"].to_numpy(dtype=object)[rows],
+            "amount": source["amount"].to_numpy(dtype=float)[rows],
+            "status": status,
+            "old_risk_category": old_category[old_index] if old_index is not None else pd.Categorical([None] * count, categories=RISK_LEVELS),
+            "new_risk_category": new_category[new_index] if new_index is not None else pd.Categorical([None] * count, categories=RISK_LEVELS),
+            "old_risk_score": old_score[old_index] if old_index is not None else np.full(count, np.nan),
+            "new_risk_score": new_score[new_index] if new_index is not None else np.full(count, np.nan)
+        })
+
+    added = np.flatnonzero(new_only)
+    removed = np.flatnonzero(old_only)
+    result = pd.concat([
+        part(added, new, "added", new_index=added),
+        part(removed, old, "removed", old_index=removed),
+        part(new_matched, new, np.where(changed, "recategorized", "unchanged"), old_matched, new_matched)
+    ], ignore_index=True)
+    result["status"] = pd.Categorical(result["status"], categories=DIFF_STATUSES)
+    result["score_delta"] = result["new_risk_score"] - result["old_risk_score"]
+
+    becomes_high = (result["new_risk_category"] == "High") & (result["old_risk_category"] != "High")
+    summary = {
+        "added": len(added),
+        "removed": len(removed),
+        "recategorized": int(changed.sum()),
+        "unchanged": int(len(changed) - changed.sum()),
+        "new_high_risk": int(becomes_high.sum()),
+        "mean_score_delta": float(np.nanmean(result["score_delta"])) if len(new_matched) else 0.0
+    }
+    return result, summary
+
+def ranked_changes(result, statuses=None, limit=None):
+    # Largest score movements first, then added and removed rows by risk
+    rows = result if not statuses else result[result["status"].isin(statuses)]
+    magnitude = rows["score_delta"].abs().fillna(rows["new_risk_score"].fillna(rows["old_risk_score"]))
+    order = np.argsort(-magnitude.to_numpy(), kind="stable")
+    if limit is not None:
+        order = order[:limit]
+    return rows.iloc[order]
+
+def iter_csv_chunks(result, chunk_size=DIFF_CHUNK_SIZE):
+    # CSV bytes in slices, written by Arrow's CSV writer (several times faster
+    # than DataFrame.to_csv), so exports never format the whole frame at once
+    for start in range(0, max(len(result), 1), chunk_size):
+        table = pa.Table.from_pandas(result.iloc[start:start + chunk_size], preserve_index=False)
+        sink = io.BytesIO()
+        pa_csv.write_csv(table, sink, pa_csv.WriteOptions(include_header=start == 0))
+        yield sink.getvalue()
@@ -0,0 +1,121 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Dictionary encoding
+# Merchant, location and category strings repeat millions of times across
+# uploads. Each distinct value gets a stable int32 code per field, kept in the
+# dictionary_values table and cached per process, so an upload's strings are
+# hashed once (one factorize per column) and everything after that works on
+# code arrays: model features and ring links gather from per-code lookup
+# tables, and saved scans store the codes next to the strings. Codes are dense
+# per field and never change once assigned, so every process and replica
+# agrees on them.
+
+ENCODED_FIELDS = ("merchant", "location", "category")
+MISSING_CODE = -1
+ASSIGN_ATTEMPTS = 5
+
+# One statement per new value; the next free code is read and taken in the
+# same statement, and a value or code another process took first is skipped
+# and looked up again
+ASSIGN_CODE = (
+    "INSERT INTO dictionary_values (field, code, value) "
+    "SELECT ?, COALESCE(MAX(code), -1) + 1, ? FROM dictionary_values WHERE field = ? "
+    "ON CONFLICT DO NOTHING"
+)
+
+def init_dictionary_tables(tx):
+    tx.execute('''
+    CREATE TABLE IF NOT EXISTS dictionary_values (
+        field TEXT,
+        code INTEGER,
+        value TEXT,
+        PRIMARY KEY (field, code),
+        UNIQUE (field, value)
+    )
+    ''')
+
+class FieldDictionary:
+    def __init__(self, database, field):
+        self.database = database
+        self.field = field
+        self.values = []
+        self._codes = {}
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def _sync(self):
+        # Codes are dense, so everything this process has not seen yet is the tail
+        rows = self.database.fetch_all(
+            "SELECT code, value FROM dictionary_values WHERE field = ? AND code >= ? ORDER BY code",
+            (self.field, len(self.values))
+        )
+        for row in rows:
+            self._codes[row["value"]] = row["code"]
+            self.values.append(row["value"])
+
+    def codes_for(self, values):
+        # int32 codes for a list of distinct strings, assigning new ones as needed
+        with self._lock:
+            missing = [value for value in values if value not in self._codes]
+            for _ in range(ASSIGN_ATTEMPTS):
+                if not missing:
+                    break
+                self._sync()
+                missing = [value for value in missing if value not in self._codes]
+                if missing:
+                    with self.database.transaction() as tx:
+                        tx.executemany(ASSIGN_CODE, [(self.field, value, self.field) for value in missing])
+            if missing:
+                self._sync()
+                if any(value not in self._codes for value in missing):
+                    raise RuntimeError(f"Could not assign dictionary codes for {self.field}")
+            return np.fromiter((self._codes[value] for value in values), dtype=np.int32, count=len(values))
+
+    def derive(self, name, fn, dtype=np.float64):
+        # fn(value) for every code, plus fn("") in a last slot that MISSING_CODE
+        # lands on; only codes added since the last call are computed
+        with self._lock:
+            table = self._derived.get(name)
+            known = 0 if table is None else len(table) - 1
+            if table is None or known < len(self.values):
+                extra = np.array([fn(value) for value in self.values[known:]], dtype=dtype)
+                previous = np.empty(0, dtype=dtype) if table is None else table[:-1]
+                table = np.concatenate([previous, extra, np.array([fn("")], dtype=dtype)])
+                self._derived[name] = table
+            return table
+
+class EncodedColumn:
+    def __init__(self, codes, dictionary):
+        self.codes = codes
+        self.dictionary = dictionary
+
+    def __len__(self):
+        return len(self.codes)
+
+    def lookup(self, name, fn, dtype=np.float64):
+        # Per-row fn(value) through the per-code table; missing values get fn("")
+        return self.dictionary.derive(name, fn, dtype)[self.codes]
+
+class DictionaryEncoder:
+    # One per process; dictionaries are loaded lazily and grow as uploads add values
+    def __init__(self, database, fields=ENCODED_FIELDS):
+        self.database = database
+        self.fields = fields
+        self._dictionaries = {field: FieldDictionary(database, field) for field in fields}
+
+    def encode(self, field, values):
+        # One hashing pass over the column, then only its distinct values are looked up
+        codes, uniques = pd.factorize(values, sort=False)
+        mapping = self._dictionaries[field].codes_for([str(value) for value in uniques])
+        mapping = np.append(mapping, np.int32(MISSING_CODE))
+        return EncodedColumn(mapping[codes], self._dictionaries[field])
+
+    def encode_frame(self, df):
+        # {field: EncodedColumn} for the encoded fields the frame has
+        return {field: self.encode(field, df[field]) for field in self.fields if field in df.columns}
@@ -0,0 +1,319 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import tempfile
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Multi-session load test
+# Runs N simulated sessions concurrently against the app's own functions and a
+# throwaway finsec.db: signup and login, then repeated upload -> analyze ->
+# save -> history -> settings journeys, the way the dashboard calls them.
+# Every SQLite statement and commit is timed through a connection factory;
+# time spent in write statements beyond their uncontended cost (measured by a
+# single-session warm-up) is reported as lock wait.
+
+STEPS = ["signup", "login", "upload", "analyze", "save", "history", "settings"]
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "BEGIN")
+DEFAULT_BUDGETS = {
+    "p99_ms": {"login": 500, "upload": 1000, "analyze": 5000, "save": 1000, "history": 1000, "settings": 500},
+    "min_journeys_per_sec": 1.0,
+    "max_lock_wait_share": 0.5,
+    "max_session_mb": 50.0,
+    "max_errors": 0
+}
+
+_local = threading.local()
+
+def _db_clock():
+    if not hasattr(_local, "write_seconds"):
+        _local.write_seconds = 0.0
+        _local.write_calls = 0
+    return _local
+
+class TimedCursor(sqlite3.Cursor):
+    def _timed(self, method, sql, *args):
+        if not sql.lstrip().upper().startswith(WRITE_PREFIXES):
+            return method(sql, *args)
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            clock = _db_clock()
+            clock.write_seconds += time.perf_counter() - start
+            clock.write_calls += 1
+
+    def execute(self, sql, *args):
+        return self._timed(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._timed(super().executemany, sql, *args)
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            clock = _db_clock()
+            clock.write_seconds += time.perf_counter() - start
+            clock.write_calls += 1
+
+def install_timed_connections():
+    connect = sqlite3.connect
+
+    def timed_connect(*args, **kwargs):
+        kwargs.setdefault("factory", TimedConnection)
+        return connect(*args, **kwargs)
+
+    sqlite3.connect = timed_connect
+
+def synthetic_upload(session, iteration, rows, seed=None):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "transaction_id": [f"LT{session:04d}-{iteration:04d}-{i:07d}" for i in range(rows)],
+        "date": pd.Timestamp("2025-04-01") + pd.to_timedelta(rng.integers(0, 30 * 24 * 3600, rows), unit="s"),
+        "amount": np.round(rng.lognormal(4.5, 1.2, rows), 2),
+        "merchant": rng.choice(["Amazon", "PayPal Transfer", "Grocery Store", "Electronics Store", "Gas Station"], rows),
+        "category": rng.choice(["Online Shopping", "Money Transfer", "Food", "Electronics", "Travel"], rows),
+        "location": rng.choice(["New York USA", "Online", "Chicago USA", "Los Angeles USA"], rows),
+        "card_type": rng.choice(["Credit", "Debit"], rows),
+        "card_number": rng.integers(0, rows // 5 + 1, rows).astype(str)
+    })
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False)
+    buffer.seek(0)
+    return buffer
+
+class SessionRunner:
+    def __init__(self, app, services, session, iterations, rows, plan):
+        self.app = app
+        self.services = services
+        self.session = session
+        self.iterations = iterations
+        self.rows = rows
+        self.plan = plan
+        self.samples = {step: [] for step in STEPS}
+        self.db_write_seconds = 0.0
+        self.errors = []
+        self.rejected = 0
+        self.journeys = 0
+        self.session_bytes = 0
+
+    def _step(self, name, func, *args, **kwargs):
+        clock = _db_clock()
+        write_before = clock.write_seconds
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.samples[name].append(time.perf_counter() - start)
+            self.db_write_seconds += clock.write_seconds - write_before
+
+    def run(self):
+        app = self.app
+        email = f"loadtest{self.session}@example.com"
+        try:
+            self._step("signup", app.create_user, email, "loadtest", plan=self.plan)
+            ok, user = self._step("login", app.authenticate_user, email, "loadtest")
+            if not ok:
+                raise RuntimeError(f"Login failed for {email}: {user}")
+
+            for iteration in range(self.iterations):
+                self._journey(user, iteration)
+        except Exception as e:
+            self.errors.append(f"session {self.session}: {e!r}")
+        return self
+
+    def _journey(self, user, iteration):
+        app, services = self.app, self.services
+        try:
+            upload = self._step("upload", services["spool"], synthetic_upload(self.session, iteration, self.rows, self.session * 7919 + iteration), f"loadtest_{iteration}.csv")
+            try:
+                claim_id, df, _, _ = self._step("upload", services["read"], upload["path"], user["id"], user["plan"])
+            except services["QuotaExceeded"]:
+                self.rejected += 1
+                return
+
+            try:
+                services["quotas"].check_scan(user["id"], user["plan"], len(df))
+            except services["QuotaExceeded"]:
+                services["dedup"].release(claim_id)
+                self.rejected += 1
+                return
+            with services["scheduler"].slot(user["id"], user["plan"], len(df)):
+                results_df, summary = self._step("analyze", app.analyze_transactions, df, None, app.get_user_thresholds(user["id"]))
+
+            # What the session would keep in st.session_state.analysis_results
+            self.session_bytes = max(self.session_bytes, int(results_df.memory_usage(deep=True).sum()))
+
+            scan_id = self._step(
+                "save", app.save_scan_results,
+                user["id"], upload["name"], summary["total"], summary["high_count"], summary["medium_count"], summary["low_count"],
+                results_df, summary["encoded"]
+            )
+            self._step("save", services["dedup"].record, claim_id, scan_id)
+
+            self._step("history", app.get_user_scans, user["id"])
+            self._step("history", app.get_user_risk_trends, user["id"], "week")
+
+            settings = self._step("settings", app.get_user_settings, user["id"])
+            self._step("settings", app.update_user_settings, user["id"], not settings["email_alerts"], settings["live_access"], settings["webhook_url"])
+            self.journeys += 1
+        except Exception as e:
+            self.errors.append(f"session {self.session} iteration {iteration}: {e!r}")
+
+def _resident_bytes():
+    from metrics import resident_bytes
+    return resident_bytes()
+
+def run_load_test(sessions=8, iterations=3, rows=2000, plan="premium", workdir=None, keep=False):
+    # The app resolves finsec.db relative to the working directory
+    workdir = workdir or tempfile.mkdtemp(prefix="finsec_loadtest_")
+    os.makedirs(workdir, exist_ok=True)
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    os.environ.setdefault("FINSEC_UPLOAD_DIR", os.path.join(workdir, "uploads"))
+    try:
+        install_timed_connections()
+        import app
+        from quotas import QuotaManager, FairScheduler, QuotaExceeded
+        from uploads import spool_upload
+        from storage import get_database
+
+        services = {
+            "spool": lambda file, name: spool_upload(file, name, os.environ["FINSEC_UPLOAD_DIR"]),
+            # Chunk-scanned and claimed as the dashboard does
+            "read": app.read_new_transactions,
+            "dedup": app.get_duplicate_index(),
+            "quotas": QuotaManager(get_database()),
+            "scheduler": FairScheduler(),
+            "QuotaExceeded": QuotaExceeded
+        }
+
+        # Uncontended baseline: one session, one journey
+        baseline = SessionRunner(app, services, 0, 1, rows, plan).run()
+        baseline_write = baseline.db_write_seconds / max(baseline.journeys, 1)
+
+        memory_before = _resident_bytes()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as executor:
+            runners = list(executor.map(
+                lambda session: SessionRunner(app, services, session, iterations, rows, plan).run(),
+                range(1, sessions + 1)
+            ))
+        elapsed = time.perf_counter() - start
+        memory_after = _resident_bytes()
+
+        return summarize(runners, elapsed, baseline_write, memory_before, memory_after, sessions, iterations, rows)
+    finally:
+        os.chdir(previous_cwd)
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def summarize(runners, elapsed, baseline_write, memory_before, memory_after, sessions, iterations, rows):
+    steps = {}
+    for step in STEPS:
+        samples = np.array([sample for runner in runners for sample in runner.samples[step]])
+        if len(samples):
+            steps[step] = {
+                "calls": len(samples),
+                "per_sec": len(samples) / elapsed,
+                **{f"p{p}_ms": float(np.percentile(samples, p) * 1000) for p in (50, 95, 99)},
+                "max_ms": float(samples.max() * 1000)
+            }
+
+    journeys = sum(runner.journeys for runner in runners)
+    write_seconds = sum(runner.db_write_seconds for runner in runners)
+    lock_wait = max(write_seconds - baseline_write * journeys, 0.0)
+    return {
+        "sessions": sessions,
+        "iterations": iterations,
+        "rows_per_upload": rows,
+        "elapsed_seconds": elapsed,
+        "journeys": journeys,
+        "journeys_per_sec": journeys / elapsed if elapsed else 0.0,
+        "rows_per_sec": journeys * rows / elapsed if elapsed else 0.0,
+        "rejected_by_quota": sum(runner.rejected for runner in runners),
+        "errors": [error for runner in runners for error in runner.errors],
+        "steps": steps,
+        "db_write_seconds": write_seconds,
+        "lock_wait_seconds": lock_wait,
+        "lock_wait_share": lock_wait / (elapsed * sessions) if elapsed else 0.0,
+        "session_result_mb": max((runner.session_bytes for runner in runners), default=0) / 2 ** 20,
+        "process_growth_per_session_mb": (memory_after - memory_before) / sessions / 2 ** 20
+    }
+
+def check_budgets(report, budgets=DEFAULT_BUDGETS):
+    # Returns [(check, value, limit, passed), ...]
+    checks = []
+    for step, limit in budgets["p99_ms"].items():
+        if step in report["steps"]:
+            value = report["steps"][step]["p99_ms"]
+            checks.append((f"{step} p99 ms", value, limit, value <= limit))
+    checks.append(("journeys per sec", report["journeys_per_sec"], budgets["min_journeys_per_sec"], report["journeys_per_sec"] >= budgets["min_journeys_per_sec"]))
+    checks.append(("lock wait share", report["lock_wait_share"], budgets["max_lock_wait_share"], report["lock_wait_share"] <= budgets["max_lock_wait_share"]))
+    checks.append(("session result MB", report["session_result_mb"], budgets["max_session_mb"], report["session_result_mb"] <= budgets["max_session_mb"]))
+    checks.append(("errors", len(report["errors"]), budgets["max_errors"], len(report["errors"]) <= budgets["max_errors"]))
+    return checks
+
+def print_report(report, checks):
+    print(f"{report['sessions']} sessions x {report['iterations']} journeys of {report['rows_per_upload']} rows "
+          f"in {report['elapsed_seconds']:.2f}s: {report['journeys_per_sec']:.2f} journeys/s, {report['rows_per_sec']:.0f} rows/s")
+    if report["rejected_by_quota"]:
+        print(f"{report['rejected_by_quota']} scans rejected by plan quotas")
+    print(f"{'step':<10}{'calls':>7}{'per sec':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step, stats in report["steps"].items():
+        print(f"{step:<10}{stats['calls']:>7}{stats['per_sec']:>10.1f}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+    print(f"SQLite write time {report['db_write_seconds']:.2f}s, estimated lock wait {report['lock_wait_seconds']:.2f}s "
+          f"({report['lock_wait_share']:.1%} of session time)")
+    print(f"Analysis results held per session: {report['session_result_mb']:.2f} MB; "
+          f"process growth per session: {report['process_growth_per_session_mb']:.2f} MB")
+    for error in report["errors"][:10]:
+        print(f"ERROR {error}")
+    for name, value, limit, passed in checks:
+        print(f"{'PASS' if passed else 'FAIL'}  {name}: {value:.3f} (budget {limit})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate concurrent FinSec sessions against a throwaway database")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=3, help="Upload-to-settings journeys per session")
+    parser.add_argument("--rows", type=int, default=2000, help="Transactions per uploaded file")
+    parser.add_argument("--plan", default="premium", help="Plan of the simulated users")
+    parser.add_argument("--workdir", help="Directory for finsec.db and uploads (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the work directory afterwards")
+    parser.add_argument("--budgets", help="JSON file overriding the default pass/fail budgets")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    budgets = dict(DEFAULT_BUDGETS)
+    if args.budgets:
+        with open(args.budgets) as f:
+            budgets.update(json.load(f))
+
+    report = run_load_test(args.sessions, args.iterations, args.rows, args.plan, args.workdir, args.keep)
+    checks = check_budgets(report, budgets)
+    print_report(report, checks)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({**report, "checks": checks}, f, indent=2)
+
+    sys.exit(0 if all(passed for *_, passed in checks) else 1)
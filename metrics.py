@@ -0,0 +1,225 @@
+import os
+import time
+import bisect
+import threading
+import functools
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Pipeline instrumentation
+# timed() and instrument() record latency, rows and resident memory change per
+# stage and user plan into an in-process registry. When FINSEC_METRICS=0 they
+# cost one flag check. The registry renders as Prometheus text, served by an
+# optional background HTTP endpoint and by the admin panel.
+
+METRICS_ENABLED = os.getenv("FINSEC_METRICS", "1") == "1"
+METRICS_PORT = int(os.getenv("FINSEC_METRICS_PORT", "0"))
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+RECENT_SAMPLES = 1024
+UNKNOWN_PLAN = "anonymous"
+
+_context = threading.local()
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def set_enabled(enabled):
+    global METRICS_ENABLED
+    METRICS_ENABLED = enabled
+
+def set_plan(plan):
+    # Label for everything the current thread (one Streamlit session) records
+    _context.plan = plan or UNKNOWN_PLAN
+
+def current_plan():
+    return getattr(_context, "plan", UNKNOWN_PLAN)
+
+_statm_fd = None
+
+def resident_bytes():
+    # Current RSS from /proc (kept open, read with pread); 0 where unavailable
+    global _statm_fd
+    try:
+        if _statm_fd is None:
+            _statm_fd = os.open("/proc/self/statm", os.O_RDONLY)
+        return int(os.pread(_statm_fd, 128, 0).split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+class StageStats:
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.memory_delta = 0
+        self.max_memory_delta = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds, rows, memory_delta):
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.seconds += seconds
+        self.rows += rows or 0
+        self.memory_delta += memory_delta
+        self.max_memory_delta = max(self.max_memory_delta, memory_delta)
+        self.recent.append(seconds)
+
+class MetricsRegistry:
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, plan, seconds, rows=None, memory_delta=0):
+        with self._lock:
+            stats = self._stages.get((stage, plan))
+            if stats is None:
+                stats = self._stages[(stage, plan)] = StageStats()
+            stats.observe(seconds, rows, memory_delta)
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    def summary(self):
+        # One row per stage and plan, with percentiles over recent samples
+        rows = []
+        with self._lock:
+            items = [(key, stats, np.array(stats.recent)) for key, stats in sorted(self._stages.items())]
+        for (stage, plan), stats, recent in items:
+            p50, p95, p99 = np.percentile(recent, [50, 95, 99]) * 1000 if len(recent) else (0.0, 0.0, 0.0)
+            rows.append({
+                "stage": stage,
+                "plan": plan,
+                "calls": stats.count,
+                "mean_ms": stats.seconds / stats.count * 1000,
+                "p50_ms": p50,
+                "p95_ms": p95,
+                "p99_ms": p99,
+                "rows": stats.rows,
+                "rows_per_sec": stats.rows / stats.seconds if stats.seconds else 0.0,
+                "avg_memory_delta_mb": stats.memory_delta / stats.count / 2 ** 20,
+                "max_memory_delta_mb": stats.max_memory_delta / 2 ** 20
+            })
+        return rows
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP finsec_stage_duration_seconds Time spent in each pipeline stage.",
+            "# TYPE finsec_stage_duration_seconds histogram"
+        ]
+        with self._lock:
+            items = sorted(self._stages.items())
+            for (stage, plan), stats in items:
+                labels = f'stage="{stage}",plan="{plan}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ["+Inf"], stats.bucket_counts):
+                    cumulative += count
+                    lines.append(f'finsec_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"finsec_stage_duration_seconds_sum{{{labels}}} {stats.seconds}")
+                lines.append(f"finsec_stage_duration_seconds_count{{{labels}}} {stats.count}")
+
+            lines += [
+                "# HELP finsec_stage_rows_total Rows processed by each pipeline stage.",
+                "# TYPE finsec_stage_rows_total counter"
+            ]
+            lines += [f'finsec_stage_rows_total{{stage="{stage}",plan="{plan}"}} {stats.rows}' for (stage, plan), stats in items]
+
+            lines += [
+                "# HELP finsec_stage_memory_delta_bytes_total Resident memory change summed over calls of each stage.",
+                "# TYPE finsec_stage_memory_delta_bytes_total counter"
+            ]
+            lines += [f'finsec_stage_memory_delta_bytes_total{{stage="{stage}",plan="{plan}"}} {stats.memory_delta}' for (stage, plan), stats in items]
+
+            lines += [
+                "# HELP finsec_stage_memory_delta_bytes_max Largest resident memory change of a single call.",
+                "# TYPE finsec_stage_memory_delta_bytes_max gauge"
+            ]
+            lines += [f'finsec_stage_memory_delta_bytes_max{{stage="{stage}",plan="{plan}"}} {stats.max_memory_delta}' for (stage, plan), stats in items]
+
+        lines.append(f"finsec_process_resident_bytes {resident_bytes()}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+class Span:
+    # Set span.rows inside the block to record how many rows the stage handled
+    __slots__ = ("stage", "rows", "_start", "_memory")
+
+    def __init__(self, stage, rows=None):
+        self.stage = stage
+        self.rows = rows
+
+    def __enter__(self):
+        self._memory = resident_bytes()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        registry.observe(self.stage, current_plan(), seconds, self.rows, resident_bytes() - self._memory)
+        return False
+
+class _NoopSpan:
+    __slots__ = ("rows",)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+def timed(stage, rows=None):
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    return Span(stage, rows)
+
+def instrument(stage, rows=None):
+    # rows: optional function of the call's arguments giving its row count
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return func(*args, **kwargs)
+            with Span(stage, rows(*args, **kwargs) if rows else None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class MetricsServer:
+    # Serves registry.render_prometheus() at /metrics from a daemon thread
+    def __init__(self, host="0.0.0.0", port=METRICS_PORT):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
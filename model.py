@@ -0,0 +1,297 @@
+import os
+import json
+import math
+import zlib
+import argparse
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Risk scoring model
+# A logistic regression over a few numeric features plus hashed merchant,
+# category and location buckets. Frames are scored with one matrix product and
+# three weight gathers; a single live transaction is scored in pure Python.
+# Callers that have dictionary-encoded merchant, location and category pass
+# the codes, and bucket and flag lookups become per-code table gathers.
+
+FORMAT_VERSION = 1
+MODEL_PATH = os.getenv("FINSEC_MODEL_PATH", "models/risk_model.npz")
+DEFAULT_THRESHOLDS = (0.3, 0.7)
+RISK_CATEGORIES = np.array(["Low", "Medium", "High"])
+NUMERIC_FEATURES = ["log_amount", "is_online", "is_debit"]
+HASHED_FEATURES = ["merchant", "category", "location"]
+HASH_BUCKETS = 16
+
+def categorize(scores, thresholds=DEFAULT_THRESHOLDS):
+    # Low below the medium threshold, High at or above the high threshold
+    return RISK_CATEGORIES[np.searchsorted(np.asarray(thresholds), scores, side="right")]
+
+def categorize_one(score, thresholds=DEFAULT_THRESHOLDS):
+    if score < thresholds[0]:
+        return "Low"
+    elif score < thresholds[1]:
+        return "Medium"
+    return "High"
+
+class ScoreIndex:
+    # Sorted copy of a scan's scores: category counts for any threshold pair
+    # come from two binary searches instead of recategorizing every row
+    def __init__(self, scores):
+        self.sorted_scores = np.sort(np.asarray(scores, dtype=np.float64))
+
+    def __len__(self):
+        return len(self.sorted_scores)
+
+    def counts(self, thresholds):
+        n = len(self.sorted_scores)
+        below_medium, below_high = np.searchsorted(self.sorted_scores, thresholds, side="left")
+        return {"High": int(n - below_high), "Medium": int(below_high - below_medium), "Low": int(below_medium)}
+
+# Feature extraction
+def _bucket(value, buckets=HASH_BUCKETS):
+    return zlib.crc32(str(value).strip().lower().encode()) % buckets
+
+def _factorize(df, column):
+    # Work on distinct values only; upload columns repeat the same few strings
+    if column not in df.columns:
+        return np.zeros(len(df), dtype=np.int64), np.array([""], dtype=object)
+    codes, uniques = pd.factorize(df[column].fillna("").astype(str), sort=False)
+    if not len(uniques):
+        return np.zeros(len(df), dtype=np.int64), np.array([""], dtype=object)
+    return codes, np.asarray(uniques, dtype=object)
+
+def _hash_codes(df, column, buckets=HASH_BUCKETS, encoded=None):
+    if encoded and column in encoded:
+        return encoded[column].lookup(f"bucket{buckets}", lambda value: _bucket(value, buckets), np.int64)
+    codes, uniques = _factorize(df, column)
+    bucket_of = np.array([_bucket(value, buckets) for value in uniques], dtype=np.int64)
+    return bucket_of[codes]
+
+def _flag(df, column, value, encoded=None):
+    if encoded and column in encoded:
+        return encoded[column].lookup(f"is_{value}", lambda unique: unique.strip().lower() == value)
+    codes, uniques = _factorize(df, column)
+    matches = np.array([str(unique).strip().lower() == value for unique in uniques], dtype=np.float64)
+    return matches[codes]
+
+def frame_features(df, buckets=HASH_BUCKETS, encoded=None):
+    amount = pd.to_numeric(df["amount"], errors="coerce").fillna(0).clip(lower=0) if "amount" in df.columns else pd.Series(0.0, index=df.index)
+    numeric = np.column_stack([
+        np.log1p(amount.to_numpy(dtype=np.float64)),
+        _flag(df, "location", "online", encoded),
+        _flag(df, "card_type", "debit")
+    ])
+    hashed = [_hash_codes(df, column, buckets, encoded) for column in HASHED_FEATURES]
+    return numeric, hashed
+
+def _one_hot(numeric, hashed, buckets):
+    n = len(numeric)
+    X = np.zeros((n, 1 + numeric.shape[1] + buckets * len(hashed)))
+    X[:, 0] = 1.0
+    X[:, 1:1 + numeric.shape[1]] = numeric
+    offset = 1 + numeric.shape[1]
+    for codes in hashed:
+        X[np.arange(n), offset + codes] = 1.0
+        offset += buckets
+    return X
+
+class RiskModel:
+    def __init__(self, weights, mean, std, metadata):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.metadata = metadata
+        self.buckets = metadata["hash_buckets"]
+        self.thresholds = tuple(metadata["thresholds"])
+        self.version = metadata["model_version"]
+
+        # Split the flat weight vector once so scoring is gathers plus one matmul
+        n_numeric = len(self.mean)
+        self.bias = float(self.weights[0])
+        self.numeric_weights = self.weights[1:1 + n_numeric] / self.std
+        self.bias -= float(self.numeric_weights @ self.mean)
+        offset = 1 + n_numeric
+        self.hashed_weights = []
+        for _ in HASHED_FEATURES:
+            self.hashed_weights.append(self.weights[offset:offset + self.buckets])
+            offset += self.buckets
+        self._numeric_list = self.numeric_weights.tolist()
+        self._hashed_lists = [w.tolist() for w in self.hashed_weights]
+
+    def score_frame(self, df, encoded=None):
+        numeric, hashed = frame_features(df, self.buckets, encoded)
+        z = numeric @ self.numeric_weights + self.bias
+        for weights, codes in zip(self.hashed_weights, hashed):
+            z += weights[codes]
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def score_one(self, transaction):
+        amount = max(float(transaction.get("amount") or 0), 0.0)
+        location = str(transaction.get("location") or "")
+        card_type = str(transaction.get("card_type") or "")
+        w = self._numeric_list
+        z = self.bias + w[0] * math.log1p(amount)
+        z += w[1] * (location.strip().lower() == "online")
+        z += w[2] * (card_type.strip().lower() == "debit")
+        for weights, column in zip(self._hashed_lists, HASHED_FEATURES):
+            z += weights[_bucket(transaction.get(column) or "", self.buckets)]
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Through a file handle, so numpy never appends ".npz" to the path;
+        # written aside and moved into place, so a reload never sees half a file
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                weights=self.weights,
+                mean=self.mean,
+                std=self.std,
+                metadata=np.array(json.dumps(self.metadata))
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            metadata = json.loads(str(data["metadata"]))
+            if metadata.get("format_version") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported model format version {metadata.get('format_version')} in {path}")
+            return cls(data["weights"], data["mean"], data["std"], metadata)
+
+class SimulatedRiskModel:
+    # Used until a model has been trained; keeps the original random scores
+    thresholds = DEFAULT_THRESHOLDS
+    version = "simulated"
+    metadata = {"model_version": "simulated", "thresholds": list(DEFAULT_THRESHOLDS)}
+
+    def score_frame(self, df, encoded=None):
+        return np.random.uniform(0, 1, size=len(df))
+
+    def score_one(self, transaction):
+        return float(np.random.uniform(0, 1))
+
+# Inference runtime
+_model = None
+_model_lock = threading.Lock()
+
+def get_risk_model(path=None):
+    # Loaded once per process; reload_risk_model() picks up a new artifact
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                path = path or MODEL_PATH
+                _model = RiskModel.load(path) if os.path.exists(path) else SimulatedRiskModel()
+    return _model
+
+def reload_risk_model(path=None):
+    global _model
+    with _model_lock:
+        _model = None
+    return get_risk_model(path)
+
+# Training
+def _auc(labels, scores):
+    order = np.argsort(scores, kind="mergesort")
+    ranks = np.empty(len(scores))
+    ranks[order] = np.arange(1, len(scores) + 1)
+    positives = labels.sum()
+    negatives = len(labels) - positives
+    if positives == 0 or negatives == 0:
+        return float("nan")
+    return float((ranks[labels == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+def fit_logistic(X, y, l2=1.0, max_iter=25, tol=1e-6):
+    # Newton / IRLS with an L2 penalty on everything except the bias
+    w = np.zeros(X.shape[1])
+    penalty = np.full(X.shape[1], l2)
+    penalty[0] = 0.0
+    for _ in range(max_iter):
+        p = 1.0 / (1.0 + np.exp(-(X @ w)))
+        gradient = X.T @ (p - y) + penalty * w
+        hessian = (X * (p * (1 - p))[:, None]).T @ X + np.diag(penalty + 1e-9)
+        step = np.linalg.solve(hessian, gradient)
+        w -= step
+        if np.abs(step).max() < tol:
+            break
+    return w
+
+def train_model(df, label_column, thresholds=DEFAULT_THRESHOLDS, l2=1.0, holdout=0.2, buckets=HASH_BUCKETS, seed=42):
+    if label_column not in df.columns:
+        raise ValueError(f"Label column '{label_column}' not found in training data")
+    if not thresholds[0] < thresholds[1]:
+        raise ValueError("The medium threshold must be below the high threshold")
+
+    y = pd.to_numeric(df[label_column], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+    y = (y > 0).astype(np.float64)
+    numeric, hashed = frame_features(df, buckets)
+
+    mean = numeric.mean(axis=0)
+    std = numeric.std(axis=0)
+    std[std == 0] = 1.0
+    X = _one_hot((numeric - mean) / std, hashed, buckets)
+
+    rng = np.random.default_rng(seed)
+    is_test = rng.random(len(X)) < holdout if holdout and len(X) >= 10 else np.zeros(len(X), dtype=bool)
+    weights = fit_logistic(X[~is_test], y[~is_test], l2=l2)
+
+    metrics = {}
+    if is_test.any():
+        p = 1.0 / (1.0 + np.exp(-(X[is_test] @ weights)))
+        eps = 1e-12
+        metrics = {
+            "holdout_rows": int(is_test.sum()),
+            "holdout_auc": _auc(y[is_test], p),
+            "holdout_logloss": float(-np.mean(y[is_test] * np.log(p + eps) + (1 - y[is_test]) * np.log(1 - p + eps)))
+        }
+
+    trained_at = datetime.datetime.now()
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "model_version": trained_at.strftime("%Y%m%d%H%M%S"),
+        "model_type": "logistic_regression",
+        "trained_at": trained_at.isoformat(),
+        "label_column": label_column,
+        "training_rows": int((~is_test).sum()),
+        "positive_rate": float(y.mean()) if len(y) else 0.0,
+        "numeric_features": NUMERIC_FEATURES,
+        "hashed_features": HASHED_FEATURES,
+        "hash_buckets": buckets,
+        "l2": l2,
+        "thresholds": [float(thresholds[0]), float(thresholds[1])],
+        "metrics": metrics
+    }
+    return RiskModel(weights, mean, std, metadata)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the FinSec risk scoring model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train = subparsers.add_parser("train", help="Fit a model on a labeled transactions CSV")
+    train.add_argument("data", help="CSV file with transactions and a fraud label column")
+    train.add_argument("--label", default="is_fraud", help="Name of the 0/1 label column")
+    train.add_argument("--out", default=MODEL_PATH, help="Where to write the model artifact")
+    train.add_argument("--medium-threshold", type=float, default=DEFAULT_THRESHOLDS[0])
+    train.add_argument("--high-threshold", type=float, default=DEFAULT_THRESHOLDS[1])
+    train.add_argument("--l2", type=float, default=1.0)
+    train.add_argument("--holdout", type=float, default=0.2)
+
+    info = subparsers.add_parser("info", help="Print a model artifact's metadata")
+    info.add_argument("path", nargs="?", default=MODEL_PATH)
+
+    args = parser.parse_args()
+
+    if args.command == "train":
+        df = pd.read_csv(args.data)
+        model = train_model(df, args.label, (args.medium_threshold, args.high_threshold), l2=args.l2, holdout=args.holdout)
+        model.save(args.out)
+        print(f"Saved model {model.version} to {args.out}")
+        print(json.dumps(model.metadata["metrics"], indent=2))
+    else:
+        print(json.dumps(RiskModel.load(args.path).metadata, indent=2))
@@ -0,0 +1,189 @@
+import os
+import time
+import uuid
+import pstats
+import cProfile
+import sqlite3
+import datetime
+import tempfile
+import itertools
+import threading
+
+# Rerun profiling
+# When enabled, every Nth rerun of main() runs under cProfile. The top
+# functions by own time are stored per page and rerun in profile_functions,
+# and the full profile is kept as a .prof blob (readable by pstats, snakeviz
+# and similar tools) for the most recent runs. Only one rerun is profiled at a
+# time; concurrent reruns simply run unprofiled. The toggle is per process and
+# profiles are stored per host (storage.local_db_path), so with several
+# replicas the admin page shows the reruns of the server that rendered it.
+
+PROFILE_TOP_N = 25
+PROFILE_KEEP = 50
+
+def _function_name(key):
+    filename, line, name = key
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+class RerunProfiler:
+    def __init__(self, db_path="finsec.db", top_n=PROFILE_TOP_N, keep=PROFILE_KEEP):
+        self.db_path = db_path
+        self.top_n = top_n
+        self.keep = keep
+        self.enabled = False
+        self.sample_every = 1
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+        conn = self._connect()
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS profile_runs (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            page TEXT,
+            started_at TIMESTAMP,
+            duration REAL,
+            function_calls INTEGER,
+            profile BLOB
+        )
+        ''')
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS profile_functions (
+            run_id TEXT,
+            rank INTEGER,
+            function TEXT,
+            calls INTEGER,
+            own_seconds REAL,
+            cumulative_seconds REAL,
+            PRIMARY KEY (run_id, rank)
+        )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def configure(self, enabled, sample_every=1):
+        self.enabled = enabled
+        self.sample_every = max(int(sample_every), 1)
+
+    def run(self, func, page=None, user_id=None):
+        if not self.enabled or next(self._counter) % self.sample_every:
+            return func()
+        if not self._lock.acquire(blocking=False):
+            return func()
+
+        profiler = cProfile.Profile()
+        started_at = datetime.datetime.now()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                return func()
+            finally:
+                profiler.disable()
+        finally:
+            # Reruns end by exception too (st.experimental_rerun); keep those
+            self._lock.release()
+            self._store(profiler, page, user_id, started_at, time.perf_counter() - start)
+
+    def _store(self, profiler, page, user_id, started_at, duration):
+        stats = pstats.Stats(profiler)
+        hot = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:self.top_n]
+        functions = [
+            (rank, _function_name(key), calls, own, cumulative)
+            for rank, (key, (_, calls, own, cumulative, _)) in enumerate(hot, 1)
+        ]
+
+        fd, path = tempfile.mkstemp(suffix=".prof")
+        os.close(fd)
+        try:
+            stats.dump_stats(path)
+            with open(path, "rb") as f:
+                artifact = f.read()
+        finally:
+            os.remove(path)
+
+        run_id = str(uuid.uuid4())
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO profile_runs (id, user_id, page, started_at, duration, function_calls, profile) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, user_id, page, started_at, duration, stats.total_calls, artifact)
+            )
+            conn.executemany(
+                "INSERT INTO profile_functions (run_id, rank, function, calls, own_seconds, cumulative_seconds) VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id,) + function for function in functions]
+            )
+            # Top functions are kept for every run; full profiles only for recent ones
+            conn.execute(
+                "UPDATE profile_runs SET profile = NULL WHERE profile IS NOT NULL AND id NOT IN "
+                "(SELECT id FROM profile_runs ORDER BY started_at DESC LIMIT ?)",
+                (self.keep,)
+            )
+        conn.close()
+        return run_id
+
+    def recent_runs(self, limit=50):
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT id, page, user_id, started_at, duration, function_calls, profile IS NOT NULL FROM profile_runs ORDER BY started_at DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        conn.close()
+        return [
+            {
+                "id": row[0],
+                "page": row[1],
+                "user_id": row[2],
+                "started_at": row[3],
+                "duration_ms": row[4] * 1000,
+                "function_calls": row[5],
+                "has_profile": bool(row[6])
+            }
+            for row in rows
+        ]
+
+    def hot_functions(self, run_id):
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT rank, function, calls, own_seconds, cumulative_seconds FROM profile_functions WHERE run_id = ? ORDER BY rank",
+            (run_id,)
+        ).fetchall()
+        conn.close()
+        return [
+            {"rank": row[0], "function": row[1], "calls": row[2], "own_ms": row[3] * 1000, "cumulative_ms": row[4] * 1000}
+            for row in rows
+        ]
+
+    def page_hotspots(self, limit=25):
+        # Functions with the most own time summed over every profiled rerun, per page
+        conn = self._connect()
+        rows = conn.execute('''
+        SELECT r.page, f.function, COUNT(*), SUM(f.own_seconds), SUM(f.cumulative_seconds)
+        FROM profile_functions f JOIN profile_runs r ON r.id = f.run_id
+        GROUP BY r.page, f.function
+        ORDER BY SUM(f.own_seconds) DESC
+        LIMIT ?
+        ''', (limit,)).fetchall()
+        conn.close()
+        return [
+            {"page": row[0], "function": row[1], "reruns": row[2], "own_ms": row[3] * 1000, "cumulative_ms": row[4] * 1000}
+            for row in rows
+        ]
+
+    def artifact(self, run_id):
+        conn = self._connect()
+        row = conn.execute("SELECT profile FROM profile_runs WHERE id = ?", (run_id,)).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM profile_functions")
+            conn.execute("DELETE FROM profile_runs")
+        conn.close()
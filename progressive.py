@@ -0,0 +1,97 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Progressive analysis
+# Rows are scored in an order that starts with a stratified random sample and
+# continues in random order, so after every chunk the processed rows are a
+# random sample of the upload. Each snapshot reports exact counts so far plus
+# estimated totals with confidence intervals, and the last one is exact.
+
+SAMPLE_SIZE = 20000
+PROGRESSIVE_MIN_ROWS = 50000
+CHUNK_ROWS = 200000
+STRATA_BINS = 10
+CONFIDENCE_Z = 1.96
+RISK_LEVELS = ["High", "Medium", "Low"]
+
+def stratified_sample(df, size=SAMPLE_SIZE, bins=STRATA_BINS, seed=None):
+    # Proportional allocation over amount quantiles (or category), so the first
+    # estimate covers small and large transactions alike
+    rng = np.random.default_rng(seed)
+    n = len(df)
+    if size >= n:
+        return rng.permutation(n)
+
+    if "amount" in df.columns:
+        amounts = pd.to_numeric(df["amount"], errors="coerce").to_numpy(dtype=np.float64)
+        edges = np.unique(np.nanquantile(amounts, np.linspace(0, 1, bins + 1)[1:-1])) if not np.isnan(amounts).all() else []
+        strata = np.searchsorted(edges, amounts, side="right")
+    elif "category" in df.columns:
+        strata = pd.factorize(df["category"])[0] + 1
+    else:
+        return rng.choice(n, size, replace=False)
+
+    sample = []
+    for stratum, stratum_size in enumerate(np.bincount(strata)):
+        if stratum_size:
+            members = np.flatnonzero(strata == stratum)
+            quota = min(max(int(round(stratum_size * size / n)), 1), stratum_size)
+            sample.append(rng.choice(members, quota, replace=False))
+    return rng.permutation(np.concatenate(sample))
+
+def processing_order(df, sample_size=SAMPLE_SIZE, seed=None):
+    rng = np.random.default_rng(seed)
+    sample = stratified_sample(df, sample_size, seed=seed)
+    rest = np.setdiff1d(np.arange(len(df)), sample, assume_unique=True)
+    return np.concatenate([sample, rng.permutation(rest)]), len(sample)
+
+def proportion_interval(count, n, population, z=CONFIDENCE_Z):
+    # Wilson score interval with a finite population correction
+    if n == 0:
+        return 0.0, 1.0
+    if n >= population:
+        share = count / n
+        return share, share
+    effective_n = n * (population - 1) / (population - n)
+    share = count / n
+    denominator = 1 + z ** 2 / effective_n
+    center = (share + z ** 2 / (2 * effective_n)) / denominator
+    margin = z * math.sqrt(share * (1 - share) / effective_n + z ** 2 / (4 * effective_n ** 2)) / denominator
+    return max(center - margin, 0.0), min(center + margin, 1.0)
+
+def snapshot(counts, processed, population, stage):
+    estimates = {}
+    for level in RISK_LEVELS:
+        low, high = proportion_interval(counts[level], processed, population)
+        estimates[level] = {
+            "count": counts[level],
+            "estimate": round(counts[level] / processed * population) if processed else 0,
+            "low": math.floor(low * population),
+            "high": math.ceil(high * population)
+        }
+    return {"stage": stage, "processed": processed, "total": population, "estimates": estimates}
+
+def iter_progressive(df, score, categorize, sample_size=SAMPLE_SIZE, chunk_rows=CHUNK_ROWS, seed=None):
+    # score(frame) -> scores and categorize(scores) -> categories; yields
+    # snapshots, and the final one ("done") also carries the full score array
+    n = len(df)
+    order, n_sample = processing_order(df, sample_size, seed)
+    scores = np.empty(n, dtype=np.float64)
+    counts = dict.fromkeys(RISK_LEVELS, 0)
+
+    boundaries = sorted(set([0, n_sample] + list(range(n_sample + chunk_rows, n, chunk_rows)) + [n]))
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        rows = order[start:end]
+        chunk_scores = score(df.iloc[rows])
+        scores[rows] = chunk_scores
+        levels, level_counts = np.unique(categorize(chunk_scores), return_counts=True)
+        for level, count in zip(levels, level_counts):
+            counts[level] += int(count)
+
+        stage = "done" if end == n else ("sample" if start == 0 else "chunk")
+        result = snapshot(counts, end, n, stage)
+        if stage == "done":
+            result["scores"] = scores
+        yield result
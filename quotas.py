@@ -0,0 +1,205 @@
+import heapq
+import time
+import threading
+from contextlib import contextmanager
+
+# Plan quotas and fair scheduling
+# Scan admission is decided by the database: each user has one scan counter
+# per hour in quota_usage, and a scan is admitted by a single conditional
+# upsert that only increments the counter while it is under the plan's cap.
+# Every process and replica shares that counter, so a spawn pool or a second
+# host cannot multiply the quota. Live transactions are rate limited per
+# second by in-memory token buckets in each process; their usage reaches
+# quota_usage in periodic batches for reporting. Counters older than the
+# longest window are pruned on flush. Scan work additionally goes through a
+# weighted fair scheduler, so a user submitting huge scans queues behind
+# their own backlog instead of everyone else's.
+
+PLAN_QUOTAS = {
+    "free": {"max_scan_rows": 10000, "scans_per_hour": 10, "live_per_second": 2, "weight": 1},
+    "premium": {"max_scan_rows": 2000000, "scans_per_hour": 120, "live_per_second": 100, "weight": 4}
+}
+DEFAULT_PLAN = "free"
+LIVE_BURST_SECONDS = 2
+USAGE_FLUSH_INTERVAL = 5.0
+SCAN_SLOTS = 2
+SCAN_WINDOW = 3600
+USAGE_WINDOW = 60
+# Counters older than this are no longer read by any check or report
+LONGEST_WINDOW = SCAN_WINDOW
+
+# Admits amount more usage only while the window stays within the cap
+ADMIT_USAGE = (
+    "INSERT INTO quota_usage (user_id, resource, window_start, used) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (user_id, resource, window_start) DO UPDATE SET used = quota_usage.used + excluded.used "
+    "WHERE quota_usage.used + excluded.used <= ?"
+)
+ADD_USAGE = (
+    "INSERT INTO quota_usage (user_id, resource, window_start, used) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (user_id, resource, window_start) DO UPDATE SET used = quota_usage.used + excluded.used"
+)
+
+def plan_quotas(plan):
+    return PLAN_QUOTAS.get(plan, PLAN_QUOTAS[DEFAULT_PLAN])
+
+def init_quota_tables(tx):
+    tx.execute('''
+    CREATE TABLE IF NOT EXISTS quota_usage (
+        user_id TEXT,
+        resource TEXT,
+        window_start INTEGER,
+        used INTEGER,
+        PRIMARY KEY (user_id, resource, window_start)
+    )
+    ''')
+
+class TokenBucket:
+    def __init__(self, rate, capacity, tokens=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity if tokens is None else min(tokens, capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount=1):
+        # Returns seconds to wait before amount tokens are available (0 = taken)
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate else float("inf")
+
+class QuotaExceeded(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class QuotaManager:
+    def __init__(self, database):
+        self.database = database
+        self._buckets = {}
+        self._pending_usage = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _used_since(self, user_id, resource, since):
+        row = self.database.fetch_one(
+            "SELECT COALESCE(SUM(used), 0) AS used FROM quota_usage WHERE user_id = ? AND resource = ? AND window_start >= ?",
+            (user_id, resource, int(since))
+        )
+        return row["used"]
+
+    def _bucket(self, user_id, resource, rate, capacity):
+        # A plan change (different capacity) replaces the bucket
+        key = (user_id, resource)
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.capacity != capacity:
+            bucket = TokenBucket(rate, capacity)
+            self._buckets[key] = bucket
+        return bucket
+
+    def _record_usage(self, user_id, resource, amount, window):
+        # Counters are bucketed into windows of the given length (seconds)
+        key = (user_id, resource, int(time.time() // window * window))
+        self._pending_usage[key] = self._pending_usage.get(key, 0) + amount
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending_usage = self._pending_usage, {}
+            self._last_flush = time.monotonic()
+        statements = [("DELETE FROM quota_usage WHERE window_start < ?", (int(time.time() - LONGEST_WINDOW),))]
+        if pending:
+            statements.append((ADD_USAGE, [key + (amount,) for key, amount in pending.items()]))
+        self.database.write(statements)
+        return len(pending)
+
+    def check_scan(self, user_id, plan, rows):
+        # Raises QuotaExceeded, otherwise takes one scan from this hour's budget
+        quotas = plan_quotas(plan)
+        if rows > quotas["max_scan_rows"]:
+            raise QuotaExceeded(
+                f"This file has {rows:,} new transactions; your {plan} plan allows up to {quotas['max_scan_rows']:,} per scan."
+            )
+        now = time.time()
+        window_start = int(now // SCAN_WINDOW * SCAN_WINDOW)
+        admitted = self.database.execute(ADMIT_USAGE, (user_id, "scan", window_start, 1, quotas["scans_per_hour"]))
+        if not admitted:
+            retry_after = window_start + SCAN_WINDOW - now
+            raise QuotaExceeded(
+                f"Your {plan} plan allows {quotas['scans_per_hour']} scans per hour. Try again in {int(retry_after // 60) + 1} minutes.",
+                retry_after
+            )
+
+    def acquire_live(self, user_id, plan):
+        # Hot path: memory only, usage reaches the database in periodic batches
+        quotas = plan_quotas(plan)
+        rate = quotas["live_per_second"]
+        with self._lock:
+            bucket = self._bucket(user_id, "live", rate, rate * LIVE_BURST_SECONDS)
+            retry_after = bucket.try_acquire()
+            if not retry_after:
+                self._record_usage(user_id, "live", 1, USAGE_WINDOW)
+            due = time.monotonic() - self._last_flush >= USAGE_FLUSH_INTERVAL
+        if due:
+            self.flush()
+        if retry_after:
+            raise QuotaExceeded(
+                f"Your {plan} plan allows {rate} live transactions per second. Try again in {retry_after:.1f} seconds.",
+                retry_after
+            )
+
+    def usage(self, user_id, plan):
+        quotas = plan_quotas(plan)
+        self.flush()
+        return {
+            "scans_last_hour": self._used_since(user_id, "scan", time.time() // SCAN_WINDOW * SCAN_WINDOW),
+            "scans_per_hour": quotas["scans_per_hour"],
+            "max_scan_rows": quotas["max_scan_rows"],
+            "live_per_second": quotas["live_per_second"]
+        }
+
+class FairScheduler:
+    # Weighted fair queueing over a fixed number of slots: each request gets a
+    # virtual start tag of max(now, the user's previous finish), and finishes
+    # cost / weight later. Slots go to the smallest start tag, so a heavy user
+    # only delays their own later requests.
+    def __init__(self, slots=SCAN_SLOTS):
+        self.slots = slots
+        self._free = slots
+        self._virtual_time = 0.0
+        self._finish = {}
+        self._waiting = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self, user_id, plan, cost=1):
+        weight = plan_quotas(plan)["weight"]
+        with self._condition:
+            start = max(self._virtual_time, self._finish.get(user_id, 0.0))
+            self._finish[user_id] = start + max(cost, 1) / weight
+            self._sequence += 1
+            ticket = (start, self._sequence)
+            heapq.heappush(self._waiting, ticket)
+            while not (self._free and self._waiting[0] == ticket):
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._free -= 1
+            self._virtual_time = start
+            # Users whose tags are behind virtual time no longer need one
+            self._finish = {user: finish for user, finish in self._finish.items() if finish > start}
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._free += 1
+                self._condition.notify_all()
+
+    def queue_length(self):
+        with self._condition:
+            return len(self._waiting)
@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Live replay and load generator
+# Streams transactions from a CSV (or synthetic ones) through the same
+# process_live_transaction() the Live Monitoring page uses, open-loop at a fixed
+# rate, in Poisson arrivals or in bursts. Latency is measured from each
+# transaction's scheduled send time, so time spent waiting for a free worker
+# counts too and an overloaded pipeline cannot hide behind a slow sender.
+
+DEFAULT_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sample_transactions.csv")
+REPLAY_USER = "replay"
+HISTOGRAM_BUCKETS_PER_DECADE = 4
+PERCENTILES = [50, 90, 99, 99.9]
+
+def load_transactions(path):
+    df = pd.read_csv(path)
+    return df.where(df.notna(), None).to_dict("records")
+
+def synthetic_transactions(count, template=None, seed=None):
+    # Draws categorical fields from the template rows, amounts from a lognormal
+    rng = np.random.default_rng(seed)
+    template = template or [{}]
+    pools = {
+        column: sorted({str(row[column]) for row in template if row.get(column) is not None}) or [""]
+        for column in ["merchant", "category", "location", "card_type"]
+    }
+    amounts = np.round(rng.lognormal(4.5, 1.2, count), 2)
+    picks = {column: rng.integers(0, len(values), count) for column, values in pools.items()}
+    return [
+        {
+            "transaction_id": f"SYN{i:09d}",
+            "amount": float(amounts[i]),
+            **{column: pools[column][picks[column][i]] for column in pools}
+        }
+        for i in range(count)
+    ]
+
+def send_offsets(count, rate, pattern="steady", burst_size=1, seed=None):
+    # Seconds after the start at which each transaction is due; rate 0 means
+    # everything is due immediately (closed loop, limited only by workers)
+    if rate <= 0:
+        return np.zeros(count)
+    if pattern == "poisson":
+        return np.cumsum(np.random.default_rng(seed).exponential(1.0 / rate, count))
+    if pattern == "burst":
+        # Bursts of burst_size back to back, spaced so the mean rate is kept
+        return (np.arange(count) // burst_size) * (burst_size / rate)
+    return np.arange(count) / rate
+
+class LatencyRecorder:
+    def __init__(self, capacity):
+        self.latencies = np.zeros(capacity)
+        self.completed = 0
+        self.errors = 0
+        self.alerts = 0
+        self.categories = {}
+        self._lock = threading.Lock()
+
+    def record(self, index, latency, category=None, alert_queued=False):
+        with self._lock:
+            self.latencies[index] = latency
+            self.completed += 1
+            if category is None:
+                self.errors += 1
+            else:
+                self.categories[category] = self.categories.get(category, 0) + 1
+            self.alerts += bool(alert_queued)
+
+def latency_histogram(latencies, buckets_per_decade=HISTOGRAM_BUCKETS_PER_DECADE):
+    # Log-spaced buckets in milliseconds: [(upper_bound_ms, count), ...]
+    latencies_ms = np.maximum(np.asarray(latencies) * 1000, 1e-3)
+    low = np.floor(np.log10(latencies_ms.min()))
+    high = np.ceil(np.log10(latencies_ms.max())) + 1e-9
+    edges = 10 ** np.arange(low, high + 1.0 / buckets_per_decade, 1.0 / buckets_per_decade)
+    counts, edges = np.histogram(latencies_ms, bins=edges)
+    return [(float(edge), int(count)) for edge, count in zip(edges[1:], counts) if count]
+
+def run_replay(transactions, rate=0, count=None, pattern="steady", burst_size=1, concurrency=4,
+               thresholds=None, webhook_url=None, dispatcher=None, seed=None):
+    from app import process_live_transaction
+
+    count = count or len(transactions)
+    offsets = send_offsets(count, rate, pattern, burst_size, seed)
+    recorder = LatencyRecorder(count)
+
+    def process(index, due):
+        transaction = dict(transactions[index % len(transactions)])
+        try:
+            result, alert_queued = process_live_transaction(REPLAY_USER, transaction, thresholds, webhook_url, dispatcher)
+            recorder.record(index, time.perf_counter() - due, result["risk_category"], alert_queued)
+        except Exception:
+            recorder.record(index, time.perf_counter() - due)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index, offset in enumerate(offsets):
+            due = start + offset
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(process, index, due)
+    elapsed = time.perf_counter() - start
+
+    return summarize(recorder, count, rate, elapsed)
+
+def summarize(recorder, count, rate, elapsed):
+    latencies = recorder.latencies[:count]
+    return {
+        "sent": count,
+        "completed": recorder.completed,
+        "errors": recorder.errors,
+        "alerts_queued": recorder.alerts,
+        "categories": recorder.categories,
+        "target_rate": rate,
+        "elapsed_seconds": elapsed,
+        "throughput": recorder.completed / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            **{f"p{p:g}": float(np.percentile(latencies, p) * 1000) for p in PERCENTILES},
+            "mean": float(latencies.mean() * 1000),
+            "max": float(latencies.max() * 1000)
+        },
+        "histogram": latency_histogram(latencies)
+    }
+
+def find_max_throughput(transactions, start_rate, p99_slo_ms, seconds_per_step=5.0, max_steps=12, **options):
+    # Doubles the offered rate until p99 latency breaks the SLO or the pipeline
+    # falls behind, then bisects between the last good and first bad rate
+    steps = []
+
+    def attempt(rate):
+        report = run_replay(transactions, rate=rate, count=max(int(rate * seconds_per_step), 1), **options)
+        sustained = report["latency_ms"]["p99"] <= p99_slo_ms and report["throughput"] >= 0.95 * rate and not report["errors"]
+        steps.append({"rate": rate, "sustained": sustained, "throughput": report["throughput"], "p99_ms": report["latency_ms"]["p99"]})
+        return sustained
+
+    good, bad = 0.0, None
+    rate = start_rate
+    for _ in range(max_steps):
+        if attempt(rate):
+            good = rate
+            rate *= 2
+        else:
+            bad = rate
+            break
+    if bad is not None:
+        for _ in range(max_steps - len(steps)):
+            if bad - good <= max(good * 0.05, 1):
+                break
+            rate = (good + bad) / 2
+            if attempt(rate):
+                good = rate
+            else:
+                bad = rate
+
+    return {"max_sustainable_rate": good, "p99_slo_ms": p99_slo_ms, "steps": steps}
+
+def print_report(report):
+    print(f"Sent {report['sent']} transactions in {report['elapsed_seconds']:.2f}s "
+          f"({report['throughput']:.0f}/s, target {report['target_rate'] or 'unthrottled'})")
+    print(f"Completed {report['completed']}, errors {report['errors']}, alerts queued {report['alerts_queued']}")
+    print("Categories: " + ", ".join(f"{level} {count}" for level, count in sorted(report["categories"].items())))
+    print("Latency (ms): " + ", ".join(f"{name} {value:.3f}" for name, value in report["latency_ms"].items()))
+    peak = max(count for _, count in report["histogram"])
+    for upper, count in report["histogram"]:
+        print(f"  <= {upper:10.3f} ms {count:8d} {'#' * max(int(40 * count / peak), 1)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay transactions through the FinSec live scoring path")
+    parser.add_argument("data", nargs="?", default=DEFAULT_DATA, help="CSV of transactions to replay")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate N synthetic transactions modeled on the CSV")
+    parser.add_argument("--count", type=int, help="Transactions to send (the data is cycled); defaults to one pass")
+    parser.add_argument("--rate", type=float, default=0, help="Offered transactions per second (0 = as fast as possible)")
+    parser.add_argument("--pattern", choices=["steady", "poisson", "burst"], default="steady")
+    parser.add_argument("--burst-size", type=int, default=100, help="Transactions per burst with --pattern burst")
+    parser.add_argument("--concurrency", type=int, default=4, help="Worker threads scoring transactions")
+    parser.add_argument("--medium-threshold", type=float)
+    parser.add_argument("--high-threshold", type=float)
+    parser.add_argument("--alerts", action="store_true", help="Queue high-risk alerts to a local stub webhook receiver")
+    parser.add_argument("--find-max", action="store_true", help="Search for the maximum rate that meets --p99-slo-ms")
+    parser.add_argument("--start-rate", type=float, default=1000)
+    parser.add_argument("--p99-slo-ms", type=float, default=50)
+    parser.add_argument("--step-seconds", type=float, default=5)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+
+    transactions = load_transactions(args.data)
+    if args.synthetic:
+        transactions = synthetic_transactions(args.synthetic, transactions, args.seed)
+    if not transactions:
+        sys.exit(f"No transactions found in {args.data}")
+
+    thresholds = None
+    if args.medium_threshold is not None and args.high_threshold is not None:
+        thresholds = (args.medium_threshold, args.high_threshold)
+
+    options = {
+        "pattern": args.pattern,
+        "burst_size": args.burst_size,
+        "concurrency": args.concurrency,
+        "thresholds": thresholds,
+        "seed": args.seed
+    }
+
+    receiver = None
+    if args.alerts:
+        from alerts import AlertDispatcher, StubWebhookReceiver
+
+        receiver = StubWebhookReceiver().start()
+        options["webhook_url"] = receiver.url
+        options["dispatcher"] = AlertDispatcher(os.path.join(tempfile.mkdtemp(), "replay_alerts.db")).start()
+
+    if args.find_max:
+        report = find_max_throughput(transactions, args.start_rate, args.p99_slo_ms, args.step_seconds, **options)
+        for step in report["steps"]:
+            print(f"{step['rate']:10.0f}/s offered  {step['throughput']:10.0f}/s achieved  "
+                  f"p99 {step['p99_ms']:8.3f} ms  {'ok' if step['sustained'] else 'FAILED'}")
+        print(f"Maximum sustainable rate: {report['max_sustainable_rate']:.0f}/s at p99 <= {args.p99_slo_ms:g} ms")
+    else:
+        report = run_replay(transactions, rate=args.rate, count=args.count, **options)
+        print_report(report)
+
+    if receiver:
+        # Give the dispatcher time to deliver what the run queued
+        dispatcher = options["dispatcher"]
+        deadline = time.time() + 30
+        while dispatcher.pending_count() and time.time() < deadline:
+            time.sleep(0.5)
+        dispatcher.stop()
+        report["alerts_delivered"] = receiver.alert_count()
+        print(f"Alerts delivered to stub receiver: {report['alerts_delivered']}")
+        receiver.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
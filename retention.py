@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import uuid
+import argparse
+import datetime
+import statistics
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Retention and compaction
+# Scan data ages out in two steps, per the owner's plan. After detail_days a
+# scan's per-transaction rows (scan_transactions and their search entries) are
+# archived; after scan_days the scan row itself goes too, together with its
+# duplicate-detection fingerprints in seen_transactions (a transaction replayed
+# after that is scanned again). scan_daily_rollups is never touched, so
+# history trends stay complete. Archives are zstd Parquet
+# files written and closed before anything is deleted. Each run ends with an
+# incremental VACUUM and stores a report of space reclaimed and of the latency
+# of the History page queries before and after.
+
+PLAN_RETENTION = {
+    "free": {"detail_days": 30, "scan_days": 365},
+    "premium": {"detail_days": 180, "scan_days": 1095}
+}
+DEFAULT_PLAN = "free"
+ARCHIVE_DIR = os.getenv("FINSEC_ARCHIVE_DIR", "archive")
+COMPACTION_INTERVAL = int(os.getenv("FINSEC_COMPACTION_INTERVAL", str(24 * 3600)))
+COMPACTION_LEASE = 3600
+ARCHIVE_CHUNK_SIZE = 100000
+DELETE_BATCH_SCANS = 100
+LATENCY_PROBES = 5
+
+# Fixed archive schemas, so every file reads back the same way
+ARCHIVE_SCHEMAS = {
+    "scan_transactions": pa.schema([
+        ("id", pa.int64()),
+        ("scan_id", pa.string()),
+        ("user_id", pa.string()),
+        ("transaction_id", pa.string()),
+        ("date", pa.string()),
+        ("amount", pa.float64()),
+        ("merchant", pa.string()),
+        ("location", pa.string()),
+        ("category", pa.string()),
+        ("risk_score", pa.float64()),
+        ("risk_category", pa.string()),
+        ("merchant_code", pa.int32()),
+        ("location_code", pa.int32()),
+        ("category_code", pa.int32())
+    ]),
+    "scans": pa.schema([
+        ("id", pa.string()),
+        ("user_id", pa.string()),
+        ("filename", pa.string()),
+        ("total_transactions", pa.int64()),
+        ("high_risk_count", pa.int64()),
+        ("medium_risk_count", pa.int64()),
+        ("low_risk_count", pa.int64()),
+        ("scan_date", pa.timestamp("us"))
+    ])
+}
+
+# Overrides as JSON, e.g. FINSEC_RETENTION='{"free": {"detail_days": 7}}'
+for plan, overrides in json.loads(os.getenv("FINSEC_RETENTION", "{}")).items():
+    PLAN_RETENTION.setdefault(plan, dict(PLAN_RETENTION[DEFAULT_PLAN])).update(overrides)
+
+def plan_retention(plan):
+    policy = PLAN_RETENTION.get(plan, PLAN_RETENTION[DEFAULT_PLAN])
+    # Details never outlive the scan they belong to
+    return {"detail_days": min(policy["detail_days"], policy["scan_days"]), "scan_days": policy["scan_days"]}
+
+def _as_datetime(value):
+    return value if isinstance(value, datetime.datetime) else datetime.datetime.fromisoformat(str(value))
+
+def _in_clause(values):
+    return ", ".join("?" for _ in values)
+
+def _batches(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def init_retention_tables(tx):
+    tx.execute('''
+    CREATE TABLE IF NOT EXISTS compaction_runs (
+        id TEXT PRIMARY KEY,
+        started_at TIMESTAMP,
+        report TEXT
+    )
+    ''')
+    tx.execute('''
+    CREATE TABLE IF NOT EXISTS maintenance_leases (
+        name TEXT PRIMARY KEY,
+        holder TEXT,
+        expires_at REAL
+    )
+    ''')
+
+class Compactor:
+    def __init__(self, database, search_index, archive_dir=ARCHIVE_DIR):
+        self.database = database
+        self.search_index = search_index
+        self.archive_dir = archive_dir
+        self.holder = str(uuid.uuid4())
+
+    # Only one process compacts at a time, whichever takes the lease
+    def _acquire_lease(self, now):
+        taken = self.database.execute(
+            "INSERT INTO maintenance_leases (name, holder, expires_at) VALUES ('compaction', ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+            "WHERE maintenance_leases.expires_at < ?",
+            (self.holder, now + COMPACTION_LEASE, now)
+        )
+        return taken == 1
+
+    def _release_lease(self):
+        self.database.execute("UPDATE maintenance_leases SET expires_at = 0 WHERE name = 'compaction' AND holder = ?", (self.holder,))
+
+    def expired_scans(self, now=None):
+        # (detail_ids, scan_ids): scans whose details, or whole rows, are past retention
+        now = now or datetime.datetime.now()
+        shortest = min(plan_retention(plan)["detail_days"] for plan in PLAN_RETENTION)
+        candidates = self.database.fetch_all(
+            "SELECT s.id, s.scan_date, u.plan FROM scans s LEFT JOIN users u ON u.id = s.user_id WHERE s.scan_date < ?",
+            (now - datetime.timedelta(days=shortest),)
+        )
+        detail_ids, scan_ids = [], []
+        for scan in candidates:
+            policy = plan_retention(scan["plan"])
+            age = now - _as_datetime(scan["scan_date"])
+            if age > datetime.timedelta(days=policy["scan_days"]):
+                scan_ids.append(scan["id"])
+            if age > datetime.timedelta(days=policy["detail_days"]):
+                detail_ids.append(scan["id"])
+
+        # Skip scans whose details were archived by an earlier run
+        stored = set()
+        for batch in _batches(detail_ids, DELETE_BATCH_SCANS):
+            rows = self.database.fetch_all(
+                f"SELECT DISTINCT scan_id FROM scan_transactions WHERE scan_id IN ({_in_clause(batch)})", tuple(batch)
+            )
+            stored.update(row["scan_id"] for row in rows)
+        return [scan_id for scan_id in detail_ids if scan_id in stored], scan_ids
+
+    def _archive(self, table, key, ids, run_id):
+        # Streams the rows into one Parquet file; returns (rows, path, bytes)
+        if not ids:
+            return 0, None, 0
+        schema = ARCHIVE_SCHEMAS[table]
+        os.makedirs(os.path.join(self.archive_dir, table), exist_ok=True)
+        path = os.path.join(self.archive_dir, table, f"{run_id}.parquet")
+        rows = 0
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            for batch in _batches(ids, DELETE_BATCH_SCANS):
+                for _, chunk in self.database.stream(
+                    f"SELECT {', '.join(schema.names)} FROM {table} WHERE {key} IN ({_in_clause(batch)})", tuple(batch), ARCHIVE_CHUNK_SIZE
+                ):
+                    columns = []
+                    for field, values in zip(schema, zip(*chunk)):
+                        if pa.types.is_timestamp(field.type):
+                            values = [None if value is None else _as_datetime(value) for value in values]
+                        columns.append(pa.array(values, type=field.type))
+                    writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                    rows += len(chunk)
+        if not rows:
+            os.remove(path)
+            return 0, None, 0
+        return rows, path, os.path.getsize(path)
+
+    def _probe_latency(self):
+        # Median of the History page's scan listing for the user with most scans
+        busiest = self.database.fetch_one(
+            "SELECT user_id, COUNT(*) AS scans FROM scans GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1"
+        )
+        if busiest is None:
+            return 0.0
+        timings = []
+        for _ in range(LATENCY_PROBES):
+            start = time.perf_counter()
+            self.database.fetch_all(
+                "SELECT id, filename, total_transactions, high_risk_count, medium_risk_count, low_risk_count, scan_date "
+                "FROM scans WHERE user_id = ? ORDER BY scan_date DESC",
+                (busiest["user_id"],)
+            )
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000
+
+    def run(self, dry_run=False, now=None):
+        # Returns the run report, or None when another process holds the lease
+        if not dry_run and not self._acquire_lease(time.time()):
+            return None
+        try:
+            return self._run(dry_run, now)
+        finally:
+            if not dry_run:
+                self._release_lease()
+
+    def _run(self, dry_run, now):
+        started = time.perf_counter()
+        started_at = datetime.datetime.now()
+        run_id = started_at.strftime("%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:8]
+        detail_ids, scan_ids = self.expired_scans(now)
+        space_before = self.database.space_stats()
+        report = {
+            "id": run_id,
+            "dry_run": dry_run,
+            "scans_with_expired_details": len(detail_ids),
+            "expired_scans": len(scan_ids),
+            "size_before_bytes": space_before["size_bytes"],
+            "latency_before_ms": self._probe_latency()
+        }
+        if dry_run:
+            return report
+
+        # Archive first; nothing is deleted unless its file was written and closed
+        detail_rows, detail_path, detail_bytes = self._archive("scan_transactions", "scan_id", detail_ids, run_id)
+        scan_rows, scan_path, scan_bytes = self._archive("scans", "id", scan_ids, run_id)
+
+        for batch in _batches(detail_ids, DELETE_BATCH_SCANS):
+            with self.database.transaction() as tx:
+                for scan_id in batch:
+                    for sql, params in self.search_index.remove_scan_statements(scan_id):
+                        tx.execute(sql, params)
+                tx.execute(f"DELETE FROM scan_transactions WHERE scan_id IN ({_in_clause(batch)})", tuple(batch))
+        expired_fingerprints = 0
+        for batch in _batches(scan_ids, DELETE_BATCH_SCANS):
+            with self.database.transaction() as tx:
+                # Through the scans rows, so the (user_id, scan_id) index is used
+                expired_fingerprints += tx.execute(
+                    "DELETE FROM seen_transactions WHERE (user_id, scan_id) IN "
+                    f"(SELECT user_id, id FROM scans WHERE id IN ({_in_clause(batch)}))",
+                    tuple(batch)
+                )
+                tx.execute(f"DELETE FROM scans WHERE id IN ({_in_clause(batch)})", tuple(batch))
+
+        if detail_ids:
+            self.search_index.compact()
+        vacuum = self.database.reclaim_space()
+        space_after = self.database.space_stats()
+        report.update({
+            "archived_transactions": detail_rows,
+            "archived_scans": scan_rows,
+            "expired_fingerprints": expired_fingerprints,
+            "archive_files": [path for path in (detail_path, scan_path) if path],
+            "archive_bytes": detail_bytes + scan_bytes,
+            "vacuum": vacuum,
+            "size_after_bytes": space_after["size_bytes"],
+            "reclaimed_bytes": space_before["size_bytes"] - space_after["size_bytes"],
+            "latency_after_ms": self._probe_latency(),
+            "seconds": round(time.perf_counter() - started, 3)
+        })
+        self.database.execute(
+            "INSERT INTO compaction_runs (id, started_at, report) VALUES (?, ?, ?)",
+            (run_id, started_at, json.dumps(report))
+        )
+        return report
+
+    def recent_runs(self, limit=20):
+        rows = self.database.fetch_all("SELECT report FROM compaction_runs ORDER BY started_at DESC LIMIT ?", (limit,))
+        return [json.loads(row["report"]) for row in rows]
+
+class CompactionScheduler:
+    # Runs the compactor every interval seconds from a daemon thread
+    def __init__(self, compactor, interval=COMPACTION_INTERVAL):
+        self.compactor = compactor
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.compactor.run()
+            except Exception:
+                # A failed run is retried at the next interval
+                pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive scan data past its plan's retention and compact the database.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    from storage import get_database
+    from search import create_search_index
+
+    database = get_database()
+    report = Compactor(database, create_search_index(database), args.archive_dir).run(dry_run=args.dry_run)
+    if report is None:
+        print("Another process is compacting; try again later.")
+        return 1
+    print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+# Fraud ring detection
+# Transactions that share an entity identifier (card or customer) are linked,
+# and connected components are found with an array-backed union-find.
+# Unions are applied to all edges at once (hooking larger roots onto smaller
+# ones) followed by pointer jumping, so every round is a handful of NumPy passes.
+# Merchants and locations are shared by ordinary customers of the same shop, so
+# they never link rows on their own; they only count as shared evidence inside
+# a component the entity identifiers already formed. Dictionary-encoded
+# columns are read from their codes, without hashing strings.
+
+LINK_COLUMNS = ["card_number", "card_id", "customer_id"]
+SUPPORTING_COLUMNS = ["merchant", "location"]
+MAX_SHARED_ROWS = 50
+RING_MIN_SIZE = 3
+RING_SIZE_THRESHOLD = 10
+RING_RISK_THRESHOLD = 0.5
+RING_INDICATOR = "Linked to suspected fraud ring"
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n, dtype=np.int64)
+
+    def _compress(self):
+        # Pointer jumping until every node points straight at its root
+        parent = self.parent
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+        self.parent = parent
+
+    def union_edges(self, left, right):
+        left = np.asarray(left, dtype=np.int64)
+        right = np.asarray(right, dtype=np.int64)
+        while len(left):
+            self._compress()
+            left_root = self.parent[left]
+            right_root = self.parent[right]
+            pending = left_root != right_root
+            if not pending.any():
+                break
+            left, right = left[pending], right[pending]
+            low = np.minimum(left_root[pending], right_root[pending])
+            high = np.maximum(left_root[pending], right_root[pending])
+            # Roots only ever point at smaller indices, so no cycles can form
+            np.minimum.at(self.parent, high, low)
+        self._compress()
+
+    def components(self):
+        self._compress()
+        return self.parent
+
+def link_edges(codes, max_shared=MAX_SHARED_ROWS):
+    # Star edges from every row to the first row with the same identifier;
+    # missing identifiers (-1) and hub values shared too widely are skipped
+    rows = np.flatnonzero(codes >= 0)
+    if not len(rows):
+        return rows, rows
+    group_codes = codes[rows]
+    sizes = np.bincount(group_codes)
+    keep = (sizes[group_codes] > 1) & (sizes[group_codes] <= max_shared)
+    rows, group_codes = rows[keep], group_codes[keep]
+
+    first = np.full(len(sizes), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first, group_codes, rows)
+    anchors = first[group_codes]
+    linked = rows != anchors
+    return rows[linked], anchors[linked]
+
+def _link_codes(df, column, encoded=None):
+    # Identifier codes per row, with -1 for missing or blank values
+    if encoded and column in encoded:
+        # Missing values land on the lookup's last slot, which counts as blank
+        blank = encoded[column].lookup("blank", lambda value: value.strip() == "", bool)
+        return np.where(blank, -1, encoded[column].codes)
+    codes, uniques = pd.factorize(df[column], sort=False)
+    # Blank text identifiers never link rows; check the distinct values only
+    if uniques.dtype == object:
+        blank = np.array([str(value).strip() == "" for value in uniques], dtype=bool)
+        if blank.any():
+            codes = np.where(blank[np.maximum(codes, 0)] & (codes >= 0), -1, codes)
+    return codes
+
+def detect_fraud_rings(df, columns=None, max_shared=MAX_SHARED_ROWS, min_size=RING_MIN_SIZE,
+                       size_threshold=RING_SIZE_THRESHOLD, risk_threshold=RING_RISK_THRESHOLD, encoded=None,
+                       supporting_columns=None):
+    # Returns (ring_ids, rings): ring_ids is -1 for rows outside a flagged ring
+    n = len(df)
+    columns = [column for column in (columns or LINK_COLUMNS) if column in df.columns]
+    supporting_columns = [column for column in (supporting_columns or SUPPORTING_COLUMNS) if column in df.columns]
+    ring_ids = np.full(n, -1, dtype=np.int64)
+    empty = pd.DataFrame(columns=["ring_id", "transactions", "average_risk_score", "high_risk_count", "shared_identifiers"])
+    if n == 0 or not columns:
+        return ring_ids, empty
+
+    union_find = UnionFind(n)
+    linked_by = []
+    for column in columns:
+        left, right = link_edges(_link_codes(df, column, encoded), max_shared)
+        if len(left):
+            union_find.union_edges(left, right)
+            linked_by.append((column, left))
+
+    roots = union_find.components()
+    sizes = np.bincount(roots, minlength=n)
+
+    # Merchant and location are only noted when rows of one component share them
+    for column in supporting_columns:
+        codes = _link_codes(df, column, encoded).astype(np.int64)
+        within = (codes >= 0) & (sizes[roots] > 1)
+        pairs = np.full(n, -1, dtype=np.int64)
+        if within.any():
+            pairs[within] = pd.factorize(roots[within] * (codes.max() + 1) + codes[within], sort=False)[0]
+        left, _ = link_edges(pairs, max_shared)
+        if len(left):
+            linked_by.append((column, left))
+    scores = df["risk_score"].to_numpy(dtype=np.float64) if "risk_score" in df.columns else np.zeros(n)
+    mean_scores = np.bincount(roots, weights=scores, minlength=n) / np.maximum(sizes, 1)
+
+    flagged_roots = np.flatnonzero(
+        (sizes >= min_size) & ((sizes >= size_threshold) | (mean_scores >= risk_threshold))
+    )
+    if not len(flagged_roots):
+        return ring_ids, empty
+
+    # Number flagged rings 0..k-1, largest first
+    flagged_roots = flagged_roots[np.argsort(-sizes[flagged_roots], kind="stable")]
+    ring_of_root = np.full(n, -1, dtype=np.int64)
+    ring_of_root[flagged_roots] = np.arange(len(flagged_roots))
+    ring_ids = ring_of_root[roots]
+
+    in_ring = ring_ids >= 0
+    high = (df["risk_category"].to_numpy() == "High") if "risk_category" in df.columns else np.zeros(n, dtype=bool)
+    high_counts = np.bincount(ring_ids[in_ring], weights=high[in_ring], minlength=len(flagged_roots))
+
+    shared = [[] for _ in flagged_roots]
+    for column, rows in linked_by:
+        for ring in np.unique(ring_ids[rows][ring_ids[rows] >= 0]):
+            shared[ring].append(column)
+
+    rings = pd.DataFrame({
+        "ring_id": np.arange(len(flagged_roots)),
+        "transactions": sizes[flagged_roots],
+        "average_risk_score": np.round(mean_scores[flagged_roots], 3),
+        "high_risk_count": high_counts.astype(np.int64),
+        "shared_identifiers": [", ".join(columns_) for columns_ in shared]
+    })
+    return ring_ids, rings
@@ -0,0 +1,247 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from encoding import ENCODED_FIELDS
+
+# Transaction search
+# Every saved scan also stores its scored transactions in scan_transactions,
+# and an inverted index over transaction_id, merchant, location and category
+# is kept in step with that table: an external-content FTS5 table filled per
+# scan on SQLite, a GIN tsvector index on PostgreSQL. Searches are scoped
+# to one user, newest first, and page by keyset (the last row id seen), so
+# every page costs the same however deep the user goes.
+
+SEARCH_FIELDS = ("transaction_id", "merchant", "location", "category")
+SEARCH_PAGE_SIZE = 50
+MAX_COUNTED_MATCHES = 10000
+
+TRANSACTION_INSERT = (
+    "INSERT INTO scan_transactions (scan_id, user_id, transaction_id, date, amount, merchant, location, category, risk_score, risk_category, "
+    "merchant_code, location_code, category_code) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+# Dictionary codes (see encoding.py) stored next to their strings
+CODE_COLUMNS = tuple(f"{field}_code" for field in ENCODED_FIELDS)
+
+RESULT_COLUMNS = (
+    "t.id, t.scan_id, s.filename, s.scan_date, t.transaction_id, t.date, t.amount, "
+    "t.merchant, t.location, t.category, t.risk_score, t.risk_category"
+)
+
+def _column_values(df, column, dtype):
+    if column not in df.columns:
+        return [None] * len(df)
+    values = df[column]
+    missing = values.isna().to_numpy()
+    if dtype is float:
+        values = pd.to_numeric(values, errors="coerce")
+        missing |= values.isna().to_numpy()
+    converted = values.astype(dtype).to_numpy(dtype=object)
+    converted[missing] = None
+    return converted.tolist()
+
+def _code_values(encoded, field, count):
+    if not encoded or field not in encoded:
+        return [None] * count
+    codes = encoded[field].codes.astype(object)
+    codes[encoded[field].codes < 0] = None
+    return codes.tolist()
+
+def transaction_rows(scan_id, user_id, df, encoded=None):
+    # Parameter tuples for TRANSACTION_INSERT from an analyzed frame; columns
+    # the upload did not have are stored as NULL
+    columns = [
+        _column_values(df, "transaction_id", str),
+        _column_values(df, "date", str),
+        _column_values(df, "amount", float),
+        _column_values(df, "merchant", str),
+        _column_values(df, "location", str),
+        _column_values(df, "category", str),
+        np.asarray(df["risk_score"], dtype=float).tolist(),
+        df["risk_category"].astype(str).tolist()
+    ] + [_code_values(encoded, field, len(df)) for field in ENCODED_FIELDS]
+    return [(scan_id, user_id) + row for row in zip(*columns)]
+
+def search_terms(query):
+    return re.findall(r"\w+", query.lower())
+
+class SearchIndex:
+    id_column = None
+
+    def __init__(self, database):
+        self.database = database
+
+    def create_schema(self, tx):
+        tx.execute(f'''
+        CREATE TABLE IF NOT EXISTS scan_transactions (
+            id {self.id_column},
+            scan_id TEXT,
+            user_id TEXT,
+            transaction_id TEXT,
+            date TEXT,
+            amount REAL,
+            merchant TEXT,
+            location TEXT,
+            category TEXT,
+            risk_score REAL,
+            risk_category TEXT,
+            merchant_code INTEGER,
+            location_code INTEGER,
+            category_code INTEGER,
+            FOREIGN KEY (scan_id) REFERENCES scans (id)
+        )
+        ''')
+        tx.execute("CREATE INDEX IF NOT EXISTS idx_scan_transactions_scan ON scan_transactions (scan_id)")
+
+    def index_scan_statements(self, scan_id):
+        # Statements to run, in the same transaction, after a scan's rows are inserted
+        return []
+
+    def remove_scan_statements(self, scan_id):
+        return []
+
+    def compact(self):
+        # Called after bulk removals so the index gives the space back
+        pass
+
+    def search(self, user_id, query, field=None, risk=None, before_id=None, limit=SEARCH_PAGE_SIZE):
+        # Returns (rows, cursor); pass cursor back as before_id for the next
+        # page. cursor is None on the last page.
+        terms = search_terms(query)
+        if not terms:
+            return [], None
+        sql, params = self._search_sql(user_id, terms, field, risk, before_id)
+        rows = self.database.fetch_all(sql, params + (limit + 1,))
+        cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+        return rows[:limit], cursor
+
+    def count(self, user_id, query, field=None, risk=None):
+        # Capped at MAX_COUNTED_MATCHES, so very common terms stay cheap
+        terms = search_terms(query)
+        if not terms:
+            return 0
+        sql, params = self._count_sql(user_id, terms, field, risk)
+        row = self.database.fetch_one(sql, params + (MAX_COUNTED_MATCHES,))
+        return row["matches"]
+
+class FTS5SearchIndex(SearchIndex):
+    id_column = "INTEGER PRIMARY KEY"
+    INDEXED = ("user_id", "risk_category") + SEARCH_FIELDS
+
+    def create_schema(self, tx):
+        super().create_schema(tx)
+        # user_id and risk_category are indexed too, so the whole filter runs
+        # inside FTS5 and ORDER BY rowid DESC LIMIT stops early
+        tx.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS scan_transactions_fts USING fts5("
+            f"{', '.join(self.INDEXED)}, content='scan_transactions', content_rowid='id', prefix='2 3')"
+        )
+
+    # One INSERT ... SELECT per scan instead of a trigger per row, which is
+    # about ten times faster for large scans
+    def index_scan_statements(self, scan_id):
+        columns = ", ".join(self.INDEXED)
+        return [(
+            f"INSERT INTO scan_transactions_fts (rowid, {columns}) SELECT id, {columns} FROM scan_transactions WHERE scan_id = ?",
+            (scan_id,)
+        )]
+
+    def remove_scan_statements(self, scan_id):
+        # Must run before the rows leave scan_transactions
+        columns = ", ".join(self.INDEXED)
+        return [(
+            f"INSERT INTO scan_transactions_fts (scan_transactions_fts, rowid, {columns}) "
+            f"SELECT 'delete', id, {columns} FROM scan_transactions WHERE scan_id = ?",
+            (scan_id,)
+        )]
+
+    def compact(self):
+        # Removals are only delete markers until the segments are merged
+        self.database.execute("INSERT INTO scan_transactions_fts (scan_transactions_fts) VALUES ('optimize')")
+
+    def _match(self, user_id, terms, field, risk):
+        def phrase(text):
+            return '"' + str(text).replace('"', '""') + '"'
+
+        # Quoted prefix terms, so user input is never read as FTS5 syntax
+        columns = field if field in SEARCH_FIELDS else " ".join(SEARCH_FIELDS)
+        expression = f"user_id : {phrase(user_id)} AND {{{columns}}} : ({' '.join(phrase(term) + '*' for term in terms)})"
+        if risk:
+            expression += f" AND risk_category : {phrase(risk)}"
+        return expression
+
+    def _search_sql(self, user_id, terms, field, risk, before_id):
+        params = (self._match(user_id, terms, field, risk),)
+        keyset = ""
+        if before_id is not None:
+            keyset = "AND rowid < ?"
+            params += (before_id,)
+        sql = f'''
+        SELECT {RESULT_COLUMNS}
+        FROM (
+            SELECT rowid FROM scan_transactions_fts
+            WHERE scan_transactions_fts MATCH ? {keyset}
+            ORDER BY rowid DESC LIMIT ?
+        ) m
+        JOIN scan_transactions t ON t.id = m.rowid
+        JOIN scans s ON s.id = t.scan_id
+        ORDER BY t.id DESC
+        '''
+        return sql, params
+
+    def _count_sql(self, user_id, terms, field, risk):
+        sql = '''
+        SELECT COUNT(*) AS matches FROM (
+            SELECT rowid FROM scan_transactions_fts WHERE scan_transactions_fts MATCH ? LIMIT ?
+        ) m
+        '''
+        return sql, (self._match(user_id, terms, field, risk),)
+
+class PostgresSearchIndex(SearchIndex):
+    id_column = "BIGSERIAL PRIMARY KEY"
+    DOCUMENT = "to_tsvector('simple', " + " || ' ' || ".join(f"coalesce({{alias}}{field}, '')" for field in SEARCH_FIELDS) + ")"
+
+    def create_schema(self, tx):
+        super().create_schema(tx)
+        tx.execute(f"CREATE INDEX IF NOT EXISTS idx_scan_transactions_search ON scan_transactions USING GIN ({self.DOCUMENT.format(alias='')})")
+        tx.execute("CREATE INDEX IF NOT EXISTS idx_scan_transactions_user ON scan_transactions (user_id, id)")
+
+    def _where(self, user_id, terms, field, risk):
+        # Terms are \w+ only, so they are safe inside to_tsquery
+        query = " & ".join(f"{term}:*" for term in terms)
+        where = f"t.user_id = ? AND {self.DOCUMENT.format(alias='t.')} @@ to_tsquery('simple', ?)"
+        params = (user_id, query)
+        if field in SEARCH_FIELDS:
+            where += f" AND to_tsvector('simple', coalesce(t.{field}, '')) @@ to_tsquery('simple', ?)"
+            params += (query,)
+        if risk:
+            where += " AND t.risk_category = ?"
+            params += (risk,)
+        return where, params
+
+    def _search_sql(self, user_id, terms, field, risk, before_id):
+        where, params = self._where(user_id, terms, field, risk)
+        if before_id is not None:
+            where += " AND t.id < ?"
+            params += (before_id,)
+        sql = f'''
+        SELECT {RESULT_COLUMNS}
+        FROM scan_transactions t JOIN scans s ON s.id = t.scan_id
+        WHERE {where}
+        ORDER BY t.id DESC LIMIT ?
+        '''
+        return sql, params
+
+    def _count_sql(self, user_id, terms, field, risk):
+        where, params = self._where(user_id, terms, field, risk)
+        sql = f"SELECT COUNT(*) AS matches FROM (SELECT 1 FROM scan_transactions t WHERE {where} LIMIT ?) m"
+        return sql, params
+
+def create_search_index(database):
+    if database.dialect == "sqlite":
+        return FTS5SearchIndex(database)
+    if database.dialect == "postgresql":
+        return PostgresSearchIndex(database)
+    raise ValueError(f"No transaction search index for {database.dialect}")
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+
+import pyarrow as pa
+
+# Shared session store
+# Session state that must survive a request landing on another replica is kept
+# outside the process, keyed by session id (and tagged with the user id).
+# Small state is stored as JSON; result frames as zstd-compressed Arrow IPC
+# streams. Every entry expires after a TTL. Backends only move bytes, so the
+# SQLite and file implementations are interchangeable.
+
+SESSION_STORE_URL = os.getenv("FINSEC_SESSION_STORE", "sqlite:///finsec.db")
+SESSION_TTL = int(os.getenv("FINSEC_SESSION_TTL", str(24 * 3600)))
+EVICT_INTERVAL = 300
+STATE_KEY = "state"
+FRAME_PREFIX = "frame:"
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+def is_session_id(value):
+    # Only ids this server issues (uuid4 hex) are accepted; session ids arrive
+    # in the URL and also name directories in the file backend
+    try:
+        parsed = uuid.UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        return False
+    return parsed.version == 4 and parsed.hex == value
+
+class SQLiteBackend:
+    def __init__(self, db_path="finsec.db"):
+        self.db_path = db_path
+        conn = self._connect()
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_store (
+            session_id TEXT,
+            key TEXT,
+            user_id TEXT,
+            value BLOB,
+            expires_at REAL,
+            PRIMARY KEY (session_id, key)
+        )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_session_store_expiry ON session_store (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_session_store_user ON session_store (user_id)")
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def put(self, session_id, key, user_id, value, expires_at):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO session_store (session_id, key, user_id, value, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, key, user_id, value, expires_at)
+            )
+        conn.close()
+
+    def get(self, session_id, key):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value FROM session_store WHERE session_id = ? AND key = ? AND expires_at > ?",
+            (session_id, key, time.time())
+        ).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def delete(self, session_id=None, user_id=None):
+        conn = self._connect()
+        with conn:
+            if session_id is not None:
+                conn.execute("DELETE FROM session_store WHERE session_id = ?", (session_id,))
+            if user_id is not None:
+                conn.execute("DELETE FROM session_store WHERE user_id = ?", (user_id,))
+        conn.close()
+
+    def evict(self, now):
+        conn = self._connect()
+        with conn:
+            removed = conn.execute("DELETE FROM session_store WHERE expires_at <= ?", (now,)).rowcount
+        conn.close()
+        return removed
+
+class FileBackend:
+    # <root>/<session_id>/<key>.bin plus a small .meta JSON with user and expiry;
+    # works on any directory the replicas share
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _inside_root(self, path):
+        # Resolved, so no id or key can reach outside the store
+        path = os.path.realpath(path)
+        if os.path.commonpath([self.root, path]) != self.root or path == self.root:
+            raise ValueError("Session store path outside its root")
+        return path
+
+    def _session_dir(self, session_id):
+        if not is_session_id(session_id):
+            raise ValueError("Invalid session id")
+        return self._inside_root(os.path.join(self.root, session_id))
+
+    def _path(self, session_id, key):
+        safe_key = key.replace(":", "_").replace(os.sep, "_")
+        return self._inside_root(os.path.join(self._session_dir(session_id), safe_key))
+
+    def put(self, session_id, key, user_id, value, expires_at):
+        path = self._path(session_id, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so readers never see a partial entry
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(value)
+        os.replace(temp_path, path + ".bin")
+        with open(temp_path, "w") as f:
+            json.dump({"user_id": user_id, "expires_at": expires_at}, f)
+        os.replace(temp_path, path + ".meta")
+
+    def _meta(self, path):
+        try:
+            with open(path + ".meta") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, session_id, key):
+        path = self._path(session_id, key)
+        meta = self._meta(path)
+        if meta is None or meta["expires_at"] <= time.time():
+            return None
+        try:
+            with open(path + ".bin", "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def delete(self, session_id=None, user_id=None):
+        if session_id is not None:
+            shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+        if user_id is not None:
+            for session in filter(is_session_id, os.listdir(self.root)):
+                directory = os.path.join(self.root, session)
+                metas = [name for name in os.listdir(directory) if name.endswith(".meta")]
+                if any((self._meta(os.path.join(directory, name[:-5])) or {}).get("user_id") == user_id for name in metas):
+                    shutil.rmtree(directory, ignore_errors=True)
+
+    def evict(self, now):
+        removed = 0
+        for session in filter(is_session_id, os.listdir(self.root)):
+            directory = os.path.join(self.root, session)
+            for name in os.listdir(directory):
+                if not name.endswith(".meta"):
+                    continue
+                path = os.path.join(directory, name[:-5])
+                meta = self._meta(path)
+                if meta is not None and meta["expires_at"] <= now:
+                    for suffix in (".bin", ".meta"):
+                        if os.path.exists(path + suffix):
+                            os.remove(path + suffix)
+                    removed += 1
+            if not os.listdir(directory):
+                os.rmdir(directory)
+        return removed
+
+def _json_default(value):
+    # NumPy scalars (counts, scores) become plain numbers, anything else text
+    return value.item() if hasattr(value, "item") else str(value)
+
+def encode_state(state):
+    return json.dumps(state, default=_json_default, sort_keys=True).encode()
+
+def frame_to_ipc(df):
+    table = None
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object columns (common in uploads) are stored as text
+        converted = df.copy()
+        for column in converted.columns[converted.dtypes == object]:
+            try:
+                pa.array(converted[column])
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                converted[column] = converted[column].astype(str)
+        table = pa.Table.from_pandas(converted, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression="zstd")) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def frame_from_ipc(value):
+    with pa.ipc.open_stream(pa.py_buffer(value)) as reader:
+        return reader.read_all().to_pandas()
+
+class SessionStore:
+    def __init__(self, backend, ttl=SESSION_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._last_evict = 0.0
+
+    def _expires_at(self):
+        now = time.time()
+        if now - self._last_evict >= EVICT_INTERVAL:
+            self._last_evict = now
+            self.backend.evict(now)
+        return now + self.ttl
+
+    def save_state(self, session_id, user_id, state):
+        value = encode_state(state)
+        self.backend.put(session_id, STATE_KEY, user_id, value, self._expires_at())
+
+    def load_state(self, session_id):
+        value = self.backend.get(session_id, STATE_KEY)
+        return json.loads(value) if value is not None else None
+
+    def save_frame(self, session_id, user_id, name, df):
+        self.backend.put(session_id, FRAME_PREFIX + name, user_id, frame_to_ipc(df), self._expires_at())
+
+    def load_frame(self, session_id, name):
+        value = self.backend.get(session_id, FRAME_PREFIX + name)
+        return frame_from_ipc(value) if value is not None else None
+
+    def delete_session(self, session_id):
+        self.backend.delete(session_id=session_id)
+
+    def delete_user(self, user_id):
+        self.backend.delete(user_id=user_id)
+
+def create_session_store(url=SESSION_STORE_URL, ttl=SESSION_TTL):
+    # sqlite:///path/to.db or file:///path/to/directory
+    scheme, _, location = url.partition("://")
+    if scheme == "sqlite":
+        # As in SQLAlchemy URLs: sqlite:///relative.db, sqlite:////absolute.db
+        location = location[1:] if location.startswith("/") else location
+        return SessionStore(SQLiteBackend(location or "finsec.db"), ttl)
+    if scheme == "file":
+        return SessionStore(FileBackend(location), ttl)
+    raise ValueError(f"Unsupported session store URL: {url}")
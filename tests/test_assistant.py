@@ -0,0 +1,20 @@
+from assistant import Assistant, StubBackend
+
+def test_same_question_without_history_is_cached():
+    backend = StubBackend()
+    assistant = Assistant(backend)
+    first = assistant.get_response("How do I upload a file?")
+    assert assistant.get_response("how do I upload a file") == first
+    assert backend.calls == 1
+
+def test_cached_answer_is_not_shared_across_conversations():
+    backend = StubBackend()
+    assistant = Assistant(backend)
+    history_a = [{"role": "user", "content": "My card ending 4242 was declined"}, {"role": "assistant", "content": "Sorry to hear that."}]
+    history_b = [{"role": "user", "content": "How do webhooks work?"}, {"role": "assistant", "content": "See Settings."}]
+    assistant.get_response("What should I do next?", history_a)
+    assistant.get_response("What should I do next?", history_b)
+    assistant.get_response("What should I do next?")
+    assert backend.calls == 3
+    assistant.get_response("What should I do next?", history_a)
+    assert backend.calls == 3
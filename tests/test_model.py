@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from model import RiskModel, train_model
+
+def test_saved_model_loads_from_the_exact_path(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "amount": rng.random(400) * 1000,
+        "merchant": rng.choice(["Casino", "Grocer", "Online Shop"], 400),
+        "category": rng.choice(["gambling", "food", "retail"], 400),
+        "location": rng.choice(["Online", "Store"], 400),
+        "card_type": rng.choice(["credit", "debit"], 400),
+        "is_fraud": rng.integers(0, 2, 400)
+    })
+    model = train_model(df, "is_fraud")
+    path = str(tmp_path / "models" / "risk")
+    model.save(path)
+
+    loaded = RiskModel.load(path)
+    assert loaded.version == model.version
+    assert np.allclose(loaded.score_frame(df), model.score_frame(df))
+    assert sorted(p.name for p in (tmp_path / "models").iterdir()) == ["risk"]
@@ -0,0 +1,150 @@
+import sys
+import types
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from storage import PostgresDatabase
+from dedup import DuplicateIndex, init_duplicate_tables
+from quotas import QuotaManager, QuotaExceeded, init_quota_tables
+from retention import Compactor, init_retention_tables
+from search import PostgresSearchIndex
+
+# psycopg2 stand-in: statements are formatted the way psycopg2 formats them
+# (%s placeholders, %% for a literal percent sign, so an untranslated "?" or a
+# stray "%" fails) and, unless recording only, run against in-memory SQLite,
+# which shares PostgreSQL's INSERT ... ON CONFLICT semantics.
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = []
+        self.rowcount = -1
+        self._rows = []
+
+    def _format(self, sql, params):
+        return sql % tuple("?" for _ in params)
+
+    def execute(self, sql, params=()):
+        self.connection.statements.append((sql, tuple(params)))
+        sql = self._format(sql, params)
+        if self.connection.sqlite is None:
+            self.description, self._rows, self.rowcount = [], [], 0
+            return
+        cursor = self.connection.sqlite.execute(sql, params)
+        self.description = cursor.description or []
+        self._rows = cursor.fetchall()
+        self.rowcount = cursor.rowcount
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        self.connection.statements.append((sql, rows))
+        sql = self._format(sql, rows[0])
+        if self.connection.sqlite is not None:
+            self.rowcount = self.connection.sqlite.executemany(sql, rows).rowcount
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    closed = 0
+
+    def __init__(self, sqlite, statements):
+        self.sqlite = sqlite
+        self.statements = statements
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        if self.sqlite is not None:
+            self.sqlite.commit()
+
+    def rollback(self):
+        if self.sqlite is not None:
+            self.sqlite.rollback()
+
+def _fake_driver(monkeypatch, sqlite):
+    statements = []
+    module = types.ModuleType("psycopg2")
+    module.OperationalError = type("OperationalError", (Exception,), {})
+    module.InterfaceError = type("InterfaceError", (Exception,), {})
+    module.connect = lambda dsn: FakeConnection(sqlite, statements)
+    monkeypatch.setitem(sys.modules, "psycopg2", module)
+    database = PostgresDatabase("postgresql://finsec@localhost/finsec", pool_size=1)
+    database.statements = statements
+    return database
+
+@pytest.fixture
+def postgres(monkeypatch):
+    sqlite = sqlite3.connect(":memory:")
+    yield _fake_driver(monkeypatch, sqlite)
+    sqlite.close()
+
+@pytest.fixture
+def recording_postgres(monkeypatch):
+    return _fake_driver(monkeypatch, None)
+
+def _sent(database, fragment):
+    return [sql for sql, params in database.statements if fragment in sql]
+
+def test_translate_placeholders_and_percent_signs(postgres):
+    assert postgres.translate("SELECT id FROM users WHERE email LIKE '%@bank.com' AND plan = ?") == (
+        "SELECT id FROM users WHERE email LIKE '%%@bank.com' AND plan = %s"
+    )
+    assert postgres.fetch_one("SELECT COUNT(*) AS n FROM (SELECT '100%' AS label) t WHERE label LIKE ?", ("%",))["n"] == 1
+
+def test_duplicate_claims_use_on_conflict(postgres):
+    with postgres.transaction() as tx:
+        init_duplicate_tables(tx)
+    df = pd.DataFrame({"transaction_id": [f"T{i}" for i in range(20)]})
+    first_id, first = DuplicateIndex(postgres).claim("u1", df)
+    # A second process, with its own empty Bloom filter, sees the claim
+    second_id, second = DuplicateIndex(postgres).claim("u1", df)
+    assert not first.any() and second.all()
+    assert _sent(postgres, "ON CONFLICT (user_id, fingerprint) DO NOTHING")[0].endswith("VALUES (%s, %s, %s, %s) ON CONFLICT (user_id, fingerprint) DO NOTHING")
+
+def test_scan_quota_is_one_conditional_upsert(postgres):
+    with postgres.transaction() as tx:
+        init_quota_tables(tx)
+    managers = [QuotaManager(postgres), QuotaManager(postgres)]
+    for attempt in range(10):
+        managers[attempt % 2].check_scan("u1", "free", 100)
+    with pytest.raises(QuotaExceeded):
+        managers[0].check_scan("u1", "free", 100)
+    assert _sent(postgres, "WHERE quota_usage.used + excluded.used <= %s")
+
+def test_compaction_lease_is_taken_once(postgres):
+    with postgres.transaction() as tx:
+        init_retention_tables(tx)
+    first, second = Compactor(postgres, None), Compactor(postgres, None)
+    assert first._acquire_lease(1000.0)
+    assert not second._acquire_lease(1001.0)
+    first._release_lease()
+    assert second._acquire_lease(1002.0)
+    assert _sent(postgres, "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder")
+
+def test_search_uses_gin_tsvector_index(recording_postgres):
+    index = PostgresSearchIndex(recording_postgres)
+    with recording_postgres.transaction() as tx:
+        index.create_schema(tx)
+    assert _sent(recording_postgres, "USING GIN (to_tsvector('simple', coalesce(transaction_id, '')")
+    assert "id BIGSERIAL PRIMARY KEY" in _sent(recording_postgres, "CREATE TABLE IF NOT EXISTS scan_transactions")[0]
+
+    rows, cursor = index.search("u1", "Coffee shop", field="merchant", risk="High", before_id=500, limit=10)
+    assert rows == [] and cursor is None
+    sql, params = recording_postgres.statements[-1]
+    assert "@@ to_tsquery('simple', %s)" in sql and "AND t.id < %s" in sql and "?" not in sql
+    assert params == ("u1", "coffee:* & shop:*", "coffee:* & shop:*", "High", 500, 11)
@@ -0,0 +1,40 @@
+import datetime
+
+import pandas as pd
+
+from storage import SQLiteDatabase
+from dedup import DuplicateIndex, init_duplicate_tables
+from retention import Compactor, init_retention_tables
+from search import create_search_index
+
+def test_expired_scans_take_their_fingerprints_with_them(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / "finsec.db"))
+    search_index = create_search_index(database)
+    with database.transaction() as tx:
+        tx.execute("CREATE TABLE users (id TEXT PRIMARY KEY, plan TEXT)")
+        tx.execute(
+            "CREATE TABLE scans (id TEXT PRIMARY KEY, user_id TEXT, filename TEXT, total_transactions INTEGER, "
+            "high_risk_count INTEGER, medium_risk_count INTEGER, low_risk_count INTEGER, scan_date TIMESTAMP)"
+        )
+        search_index.create_schema(tx)
+        init_duplicate_tables(tx)
+        init_retention_tables(tx)
+        tx.execute("INSERT INTO users (id, plan) VALUES ('u1', 'free')")
+
+    duplicate_index = DuplicateIndex(database)
+    now = datetime.datetime.now()
+    for scan_id, scan_date, count in (("old", now - datetime.timedelta(days=400), 30), ("recent", now, 20)):
+        database.execute(
+            "INSERT INTO scans (id, user_id, filename, total_transactions, high_risk_count, medium_risk_count, low_risk_count, scan_date) "
+            "VALUES (?, 'u1', 'export.csv', ?, 0, 0, ?, ?)",
+            (scan_id, count, count, scan_date)
+        )
+        claim_id, _ = duplicate_index.claim("u1", pd.DataFrame({"transaction_id": [f"{scan_id}-{i}" for i in range(count)]}))
+        duplicate_index.record(claim_id, scan_id)
+
+    report = Compactor(database, search_index, str(tmp_path / "archive")).run()
+
+    assert report["expired_scans"] == 1
+    assert report["expired_fingerprints"] == 30
+    remaining = database.fetch_all("SELECT scan_id, COUNT(*) AS n FROM seen_transactions GROUP BY scan_id")
+    assert remaining == [{"scan_id": "recent", "n": 20}]
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from rings import detect_fraud_rings
+
+def benign_frame(n=2000, seed=0):
+    # Every customer has their own card; they all shop at the same few places
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "transaction_id": [f"T{i}" for i in range(n)],
+        "card_number": [f"4000{i:012d}" for i in range(n)],
+        "customer_id": [f"C{i}" for i in range(n)],
+        "merchant": rng.choice(["Amazon", "Grocery Store", "Gas Station", "Coffee Shop"], n),
+        "location": rng.choice(["New York USA", "Chicago USA", "Online"], n),
+        "risk_score": rng.uniform(0, 1, n)
+    })
+
+def test_shared_merchants_and_locations_do_not_form_rings():
+    ring_ids, rings = detect_fraud_rings(benign_frame())
+    assert (ring_ids == -1).all()
+    assert rings.empty
+
+def test_shared_card_forms_ring_with_supporting_merchant():
+    df = benign_frame(200)
+    # Twelve transactions on one card across three customers, all at one merchant
+    members = np.arange(12)
+    df.loc[members, "card_number"] = "4000999999999999"
+    df.loc[members, "merchant"] = "Electronics Store"
+    ring_ids, rings = detect_fraud_rings(df)
+
+    assert len(rings) == 1
+    assert set(np.flatnonzero(ring_ids >= 0)) == set(members)
+    assert rings.loc[0, "transactions"] == 12
+    shared = rings.loc[0, "shared_identifiers"].split(", ")
+    assert "card_number" in shared and "merchant" in shared
+
+def test_merchant_alone_never_links_customers():
+    df = benign_frame(30)
+    df["merchant"] = "Amazon"
+    df["location"] = "Online"
+    df["risk_score"] = 0.99
+    ring_ids, rings = detect_fraud_rings(df)
+    assert rings.empty
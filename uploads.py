@@ -0,0 +1,143 @@
+import os
+import time
+import hashlib
+import tempfile
+
+import pandas as pd
+
+# Upload spooling
+# Uploaded files are copied to a temp directory under their SHA-256, so the
+# session only keeps the path and hash. Parsing goes through memory-mapped,
+# chunked reads, so the raw bytes live in the page cache instead of the worker,
+# and callers consume the chunks one at a time (see read_new_transactions in
+# app.py) instead of building a frame of the whole file.
+
+UPLOAD_DIR = os.getenv("FINSEC_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "finsec_uploads"))
+SPOOL_BLOCK_SIZE = 1024 * 1024
+CHUNK_ROWS = 100000
+UPLOAD_MAX_AGE = 24 * 3600
+
+# Supported formats
+# The format is detected from magic bytes, falling back to the file extension
+# for the payload inside a compressed file. Parquet reads are projected onto
+# the columns scoring uses; CSV and JSON Lines keep every column.
+UPLOAD_TYPES = ["csv", "gz", "zst", "zstd", "parquet", "pq", "jsonl", "ndjson"]
+SCORING_COLUMNS = [
+    "transaction_id", "date", "timestamp", "amount", "merchant", "category", "location",
+    "card_type", "card_number", "card_id", "customer_id"
+]
+COMPRESSION_EXTENSIONS = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+MAGIC_BYTES = [
+    (b"PAR1", ("parquet", None)),
+    (b"\x1f\x8b", (None, "gzip")),
+    (b"\x28\xb5\x2f\xfd", (None, "zstd"))
+]
+
+def _extension(filename):
+    # Keeps the inner extension of compressed files, e.g. ".csv.gz"
+    stem, extension = os.path.splitext(filename.lower())
+    if extension in COMPRESSION_EXTENSIONS:
+        extension = os.path.splitext(stem)[1] + extension
+    return extension
+
+def detect_format(path):
+    # Returns (format, compression) with format one of csv, jsonl, parquet
+    with open(path, "rb") as f:
+        head = f.read(4)
+
+    file_format, compression = None, None
+    for magic, detected in MAGIC_BYTES:
+        if head.startswith(magic):
+            file_format, compression = detected
+            break
+    if file_format is None:
+        stem, extension = os.path.splitext(path.lower())
+        if extension in COMPRESSION_EXTENSIONS:
+            compression = compression or COMPRESSION_EXTENSIONS[extension]
+            extension = os.path.splitext(stem)[1]
+        if extension in (".parquet", ".pq"):
+            file_format = "parquet"
+        elif extension in (".jsonl", ".ndjson", ".json") or (compression is None and head[:1] == b"{"):
+            file_format = "jsonl"
+        else:
+            file_format = "csv"
+    return file_format, compression
+
+def spool_upload(file, filename, upload_dir=UPLOAD_DIR):
+    os.makedirs(upload_dir, exist_ok=True)
+    extension = _extension(filename)
+    digest = hashlib.sha256()
+
+    # Copy block by block while hashing, then move into place under the hash
+    file.seek(0)
+    fd, temp_path = tempfile.mkstemp(dir=upload_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = file.read(SPOOL_BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                out.write(block)
+        content_hash = digest.hexdigest()
+        path = os.path.join(upload_dir, content_hash + extension)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            os.utime(path)
+        else:
+            os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    file.seek(0)
+
+    return {"name": filename, "path": path, "hash": content_hash, "size": os.path.getsize(path)}
+
+def _parquet_columns(parquet_file, columns):
+    available = parquet_file.schema_arrow.names
+    projected = [column for column in (columns or SCORING_COLUMNS) if column in available]
+    # Files that share none of the scoring columns are read whole
+    return projected or None
+
+def iter_upload_chunks(path, chunksize=CHUNK_ROWS, columns=None):
+    file_format, compression = detect_format(path)
+
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        projected = _parquet_columns(parquet_file, columns)
+        return (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunksize, columns=projected))
+
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401  (pandas needs it for zstd)
+        except ImportError:
+            raise ValueError("Reading zstd-compressed uploads requires the zstandard package")
+
+    if file_format == "jsonl":
+        # Streams one chunk of lines at a time
+        reader = pd.read_json(path, lines=True, chunksize=chunksize, compression=compression, dtype=False)
+        if columns:
+            return (chunk[[column for column in columns if column in chunk.columns]] for chunk in reader)
+        return reader
+
+    # Compressed CSV is decompressed on the fly; plain CSV is memory-mapped
+    return pd.read_csv(path, memory_map=compression is None, compression=compression, chunksize=chunksize, usecols=columns)
+
+def preview_upload(path, rows=5):
+    return next(iter(iter_upload_chunks(path, max(rows, 1))), pd.DataFrame()).head(rows)
+
+def cleanup_uploads(upload_dir=UPLOAD_DIR, max_age=UPLOAD_MAX_AGE):
+    # Spool files are shared by content hash, so they expire by age
+    if not os.path.isdir(upload_dir):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(upload_dir):
+        path = os.path.join(upload_dir, name)
+        if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed